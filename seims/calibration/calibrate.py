@@ -8,6 +8,12 @@
     - 18-01-25  - lj - redesign the individual class, add 95PPU, etc.
     - 18-02-09  - lj - compatible with Python3.
     - 20-07-22  - lj - update to use global MongoClient object.
+    - 26-10-18  - st - Timeout and retries of model runs, isolate failed evaluations.
+    - 26-10-18  - st - Read-only observations shared by evaluations in each process.
+    - 26-10-18  - st - Configurable criterion, seed, and workers of Latin hypercube sampling.
+    - 26-10-18  - st - Mark the individuals whose model runs were terminated.
+    - 26-10-18  - st - Evaluate individuals with the calibrated values of a given ID.
+    - 26-10-18  - st - Reset the results inherited from parents before evaluation.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -15,15 +21,14 @@ import time
 from collections import OrderedDict
 import os
 import sys
-from copy import deepcopy
 
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
-from typing import Optional
+from typing import Optional, Dict, List, Tuple, AnyStr
 from pygeoc.utils import FileClass
 
-from utility import read_data_items_from_txt
+from utility import read_data_items_from_txt, TimeseriesArray
 # import global_mongoclient as MongoDBObj
 from preprocess.db_mongodb import MongoClient, ConnectMongoDB
 from preprocess.text import DBTableNames
@@ -32,8 +37,16 @@ from calibration.config import CaliConfig, get_optimization_config
 from calibration.sample_lhs import lhs
 
 
+# Process-level store of observations at the outlet, see `outlet_observations`.
+_OUTLET_OBSERVATIONS = dict()  # type: Dict[Tuple, Tuple[List[AnyStr], TimeseriesArray]]
+
+
 class TimeseriesData(object):
-    """Time series data, for observation and simulation data."""
+    """Time series data, for observation and simulation data.
+
+    For observation data of individuals, only `vars` is set and `data` is left empty, the data
+      is shared by `outlet_observations` to avoid copying and pickling it with each individual.
+    """
 
     def __init__(self):
         self.vars = list()
@@ -109,6 +122,12 @@ class Calibration(object):
         self.param_defs = dict()
         # run seims related
         self.modelrun = False
+        self.max_runtime = None  # type: Optional[float] # terminate model run if exceeded
+        self.max_retries = 0  # type: int # retries of failed model run
+        if cali_cfg.opt is not None:
+            if cali_cfg.opt.run_timeout > 0:
+                self.max_runtime = cali_cfg.opt.run_timeout
+            self.max_retries = cali_cfg.opt.run_retries
         self.reset_simulation_timerange()
 
     @property
@@ -177,7 +196,9 @@ class Calibration(object):
             A list contains parameter value at each gene location.
         """
         param_num = self.ParamDefs['num_vars']
-        lhs_samples = lhs(param_num, n)
+        lhs_samples = lhs(param_num, n, criterion=self.cfg.lhs_criterion,
+                          iterations=self.cfg.lhs_iterations, seed=self.cfg.lhs_seed,
+                          workers=self.cfg.lhs_workers)
         all = list()
         for idx in range(n):
             gene_values = list()
@@ -195,64 +216,175 @@ def initialize_calibrations(cf):
     return cali.initialize()
 
 
-def calibration_objectives(cali_obj, ind):
+def outlet_observations(cali_obj, vars_list):
+    # type: (Calibration, List[AnyStr]) -> (List[AnyStr], TimeseriesArray)
+    """Observations at the outlet, which are read from MongoDB once per process.
+
+    The observations are stored in a process-level dict keyed by the model database, the
+      simulation period, and the variables, so that each worker process (e.g., of SCOOP or
+      process pool) reads them on its first evaluation, and the individuals only need to
+      carry the observed variables. The returned data is shared and MUST be read-only.
+    """
+    key = (cali_obj.model.host, cali_obj.model.port, cali_obj.model.db_name,
+           cali_obj.model.simu_stime, cali_obj.model.simu_etime, tuple(vars_list))
+    if key not in _OUTLET_OBSERVATIONS:
+        model_obj = MainSEIMS(args_dict=cali_obj.model.ConfigDict)
+        obs_vars, obs_data = model_obj.ReadOutletObservations(vars_list)
+        obs_ts = TimeseriesArray.from_dict(obs_data)
+        _OUTLET_OBSERVATIONS[key] = (obs_vars, obs_ts)
+        # The same observations are requested by the available variables subsequently
+        _OUTLET_OBSERVATIONS[key[:-1] + (tuple(obs_vars),)] = (obs_vars, obs_ts)
+    return _OUTLET_OBSERVATIONS[key]
+
+
+def calibration_objectives(cali_obj, ind, calc_statistics=True, cali_id=None):
     """Evaluate the objectives of given individual.
+
+    If `calc_statistics` is False, only the matched simulation and observation data of
+      calibration and validation periods are extracted, and the statistics should be calculated
+      for the whole population by `calibration_statistics` subsequently.
+
+    The model is executed with the calibrated values of `cali_id` (`ind.id` by default),
+      i.e., the index of `CALI_VALUES` written by `write_param_values_to_mongodb`.
+
+    Any error raised during the evaluation is caught and the individual is returned as
+      invalid, i.e., `ind.cali.valid` is False, so that the other evaluations are not affected.
     """
-    cali_obj.ID = ind.id
+    try:
+        return _calibration_objectives(cali_obj, ind, calc_statistics, cali_id)
+    except Exception as err:
+        print('Evaluate calibration %d failed! %s' % (ind.id, str(err)))
+        ind.run_success = False
+        ind.cali.valid = False
+        ind.vali.valid = False
+        return ind
+
+
+def calibration_objectives_in_slot(cali_obj, ind, cali_id):
+    """Evaluate the individual with the calibrated values of `cali_id`, e.g., a slot of
+    running models, without calculating the statistics, see `calibration_objectives`."""
+    return calibration_objectives(cali_obj, ind, calc_statistics=False, cali_id=cali_id)
+
+
+def _calibration_objectives(cali_obj, ind, calc_statistics=True, cali_id=None):
+    if cali_id is None:
+        cali_id = ind.id
+    cali_obj.ID = cali_id
     model_args = cali_obj.model.ConfigDict
     model_args.setdefault('calibration_id', -1)
-    model_args['calibration_id'] = ind.id
+    model_args['calibration_id'] = cali_id
     model_obj = MainSEIMS(args_dict=model_args)
 
-    # Set observation data to model_obj, no need to query database
-    model_obj.SetOutletObservations(ind.obs.vars, ind.obs.data)
+    # Reset the results, since the offspring cloned from parents carry the parents' results
+    ind.sim = TimeseriesData()
+    ind.cali = ObsSimData()
+    ind.vali = ObsSimData()
+    ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = [0.] * 4
+    ind.run_success = False
+    ind.terminated = False
+    ind.attempts = 0
+
+    # Set observation data to model_obj, no need to query database except the first evaluation
+    #   of the current process. The data carried by individual is used if available.
+    if ind.obs.data:
+        model_obj.SetOutletObservations(ind.obs.vars, ind.obs.data)
+    else:
+        obs_vars, obs_data = outlet_observations(cali_obj, ind.obs.vars)
+        model_obj.SetOutletObservations(obs_vars, obs_data, copy=False)
 
     # Execute model
     model_obj.SetMongoClient()
-    model_obj.run()
+    model_obj.run(max_runtime=cali_obj.max_runtime, max_retries=cali_obj.max_retries)
+    ind.run_success = model_obj.run_success
+    ind.terminated = model_obj.terminated
+    ind.attempts = model_obj.attempts
+    ind.runtime = model_obj.runtime
     time.sleep(0.1)  # Wait a moment in case of unpredictable file system error
 
     # read simulation data of the entire simulation period (include calibration and validation)
-    if model_obj.ReadTimeseriesSimulations():
+    if ind.run_success and model_obj.ReadTimeseriesSimulations():
         ind.sim.vars = model_obj.sim_vars[:]
-        ind.sim.data = deepcopy(model_obj.sim_value)
+        ind.sim.data = model_obj.sim_value
     else:
-        model_obj.clean(calibration_id=ind.id)
+        # Failed, timed out, or terminated, which is assigned with penalty fitness
+        ind.run_success = False
+        ind.cali.valid = False
+        ind.vali.valid = False
+        model_obj.clean(calibration_id=cali_id)
         model_obj.UnsetMongoClient()
+        model_obj.RecordTelemetry(tag='calibration')
         return ind
-    # Calculate NSE, R2, RMSE, PBIAS, and RSR, etc. of calibration period
-    ind.cali.vars, ind.cali.data = model_obj.ExtractSimData(cali_obj.cfg.cali_stime,
-                                                            cali_obj.cfg.cali_etime)
-    ind.cali.sim_obs_data = model_obj.ExtractSimObsData(cali_obj.cfg.cali_stime,
-                                                        cali_obj.cfg.cali_etime)
-
-    ind.cali.objnames, \
-    ind.cali.objvalues = model_obj.CalcTimeseriesStatistics(ind.cali.sim_obs_data,
-                                                            cali_obj.cfg.cali_stime,
+    # Extract data and calculate NSE, R2, RMSE, PBIAS, and RSR, etc. of each period
+    with model_obj.phase('statistics'):
+        ind.cali.vars, ind.cali.data = model_obj.ExtractSimData(cali_obj.cfg.cali_stime,
+                                                                cali_obj.cfg.cali_etime)
+        ind.cali.sim_obs_data = model_obj.ExtractSimObsData(cali_obj.cfg.cali_stime,
                                                             cali_obj.cfg.cali_etime)
-    if ind.cali.objnames and ind.cali.objvalues:
-        ind.cali.valid = True
-
-    # Calculate NSE, R2, RMSE, PBIAS, and RSR, etc. of validation period
-    if cali_obj.cfg.calc_validation:
-        ind.vali.vars, ind.vali.data = model_obj.ExtractSimData(cali_obj.cfg.vali_stime,
+        if calc_statistics:
+            ind.cali.objnames, \
+            ind.cali.objvalues = model_obj.CalcTimeseriesStatistics(ind.cali.sim_obs_data,
+                                                                    cali_obj.cfg.cali_stime,
+                                                                    cali_obj.cfg.cali_etime)
+            if ind.cali.objnames and ind.cali.objvalues:
+                ind.cali.valid = True
+
+        # Validation period
+        if cali_obj.cfg.calc_validation:
+            ind.vali.vars, ind.vali.data = model_obj.ExtractSimData(cali_obj.cfg.vali_stime,
+                                                                    cali_obj.cfg.vali_etime)
+            ind.vali.sim_obs_data = model_obj.ExtractSimObsData(cali_obj.cfg.vali_stime,
                                                                 cali_obj.cfg.vali_etime)
-        ind.vali.sim_obs_data = model_obj.ExtractSimObsData(cali_obj.cfg.vali_stime,
-                                                            cali_obj.cfg.vali_etime)
-
-        ind.vali.objnames, \
-        ind.vali.objvalues = model_obj.CalcTimeseriesStatistics(ind.vali.sim_obs_data,
-                                                                cali_obj.cfg.vali_stime,
-                                                                cali_obj.cfg.vali_etime)
-        if ind.vali.objnames and ind.vali.objvalues:
-            ind.vali.valid = True
+            if calc_statistics:
+                ind.vali.objnames, \
+                ind.vali.objvalues = model_obj.CalcTimeseriesStatistics(ind.vali.sim_obs_data,
+                                                                        cali_obj.cfg.vali_stime,
+                                                                        cali_obj.cfg.vali_etime)
+                if ind.vali.objnames and ind.vali.objvalues:
+                    ind.vali.valid = True
 
     # Get timespan
     ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = model_obj.GetTimespan()
 
     # delete model output directory for saving storage
-    model_obj.clean(calibration_id=ind.id)
+    model_obj.clean(calibration_id=cali_id)
     model_obj.UnsetMongoClient()
+    model_obj.RecordTelemetry(tag='calibration')
+    return ind
+
+
+def calibration_statistics(cali_obj, pops):
+    """Calculate the statistics of calibration (and validation) period of the evaluated
+    individuals in batch, i.e., as an (individuals x time) matrix per variable.
+    """
+    periods = [('cali', cali_obj.cfg.cali_stime, cali_obj.cfg.cali_etime)]
+    if cali_obj.cfg.calc_validation:
+        periods.append(('vali', cali_obj.cfg.vali_stime, cali_obj.cfg.vali_etime))
+    for period, stime, etime in periods:
+        sim_obs_dicts = [getattr(ind, period).sim_obs_data for ind in pops]
+        results = MainSEIMS.CalcTimeseriesStatisticsBatch(sim_obs_dicts, stime, etime)
+        for ind, (objnames, objvalues) in zip(pops, results):
+            ind_data = getattr(ind, period)
+            ind_data.objnames, ind_data.objvalues = objnames, objvalues
+            ind_data.valid = bool(ind.run_success and objnames and objvalues)
+    return pops
+
+
+def individual_cache_record(ind):
+    """Evaluated results of an individual to be stored in `utility.EvaluationCache`."""
+    return {'sim': ind.sim, 'cali': ind.cali, 'vali': ind.vali,
+            'timespan': [ind.io_time, ind.comp_time, ind.simu_time, ind.runtime]}
+
+
+def restore_individual_from_cache(ind, record):
+    """Restore the evaluated results of an individual from the cached record.
+    The timespan is set to zeros since no model is executed."""
+    ind.sim = record['sim']
+    ind.cali = record['cali']
+    ind.vali = record['vali']
+    ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = [0.] * 4
+    ind.run_success = True  # The cached records are successful model runs
+    ind.terminated = False
+    ind.attempts = 0
     return ind
 
 
@@ -6,6 +6,8 @@
     @changelog:
     - 18-01-20  - lj - initial implementation.
     - 18-02-09  - lj - compatible with Python3.
+    - 26-10-18  - st - Add computing resources for the executor of model runs.
+    - 26-10-18  - st - Add settings of Latin hypercube sampling.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -15,10 +17,11 @@ import sys
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
+from typing import Optional, AnyStr
 from pygeoc.utils import FileClass
 from run_seims import ParseSEIMSConfig
 from utility import get_optimization_config, parse_datetime_from_ini
-from utility import ParseNSGA2Config, PlotConfig
+from utility import ParseNSGA2Config, PlotConfig, ParseResourceConfig
 
 
 class CaliConfig(object):
@@ -27,6 +30,8 @@ class CaliConfig(object):
     def __init__(self, cf, method='nsga2'):
         # type: (ConfigParser, str) -> None
         """Initialization."""
+        # 0. Computing resources related, i.e., executor of model runs
+        self.resource = ParseResourceConfig(cf)  # type: ParseResourceConfig
         # 1. SEIMS model related
         self.model = ParseSEIMSConfig(cf)
 
@@ -54,6 +59,23 @@ class CaliConfig(object):
                                                   self.vali_stime >= self.vali_etime):
             raise ValueError("Wrong time settings in [CALI_Settings]!")
 
+        # Latin hypercube sampling of initial parameter values, see `calibration.sample_lhs`
+        self.lhs_criterion = None  # type: Optional[AnyStr] # None for the classic design
+        self.lhs_iterations = 5
+        self.lhs_workers = 1
+        self.lhs_seed = None  # type: Optional[int]
+        if cf.has_option('CALI_Settings', 'lhs_criterion'):
+            criterion = cf.get('CALI_Settings', 'lhs_criterion').strip().lower()
+            if criterion not in ['', 'none']:
+                self.lhs_criterion = criterion
+        if cf.has_option('CALI_Settings', 'lhs_iterations'):
+            self.lhs_iterations = cf.getint('CALI_Settings', 'lhs_iterations')
+        if cf.has_option('CALI_Settings', 'lhs_workers'):
+            self.lhs_workers = cf.getint('CALI_Settings', 'lhs_workers')
+        if cf.has_option('CALI_Settings', 'lhs_seed') and \
+            cf.get('CALI_Settings', 'lhs_seed').strip():
+            self.lhs_seed = cf.getint('CALI_Settings', 'lhs_seed')
+
         # 3. Parameters settings for specific optimization algorithm
         self.opt_mtd = method
         self.opt = None
@@ -10,6 +10,20 @@
     - 18-08-26  - lj - Gather the execute time of all model runs. Plot pareto graphs.
     - 18-08-29  - jz,lj,sf - Add Nutrient calibration step.
     - 18-10-22  - lj - Make the customizations of multi-objectives flexible.
+    - 26-10-18  - st - Assign penalty fitness to the individuals whose model runs failed.
+    - 26-10-18  - st - Evaluate individuals by the executor configured in [Computing_Resources].
+    - 26-10-18  - st - Asynchronous steady-state evolution.
+    - 26-10-18  - st - Surrogate-assisted pre-screening of offspring.
+    - 26-10-18  - st - Periodic checkpoints and resume from the last complete generation.
+    - 26-10-18  - st - Stop by hypervolume convergence or computing budgets.
+    - 26-10-18  - st - Share observations among evaluations instead of copying to individuals.
+    - 26-10-18  - st - Append population details to the columnar store.
+    - 26-10-18  - st - Plot in a background process at the configured frequency.
+    - 26-10-18  - st - Runtime budget of early termination by successful model runs only.
+    - 26-10-18  - st - Warm start from the archive of a previous run.
+    - 26-10-18  - st - Wait for the deferred GridFS cleanup before reusing calibration IDs.
+    - 26-10-18  - st - Skip the initialization of population when resuming from checkpoint.
+    - 26-10-18  - st - Rename the runtime budget to runtime ratio limit, which is what it enforces.
 """
 from __future__ import absolute_import, division, unicode_literals
 
@@ -18,27 +32,38 @@ import os
 import random
 import time
 import sys
+import threading
 from io import open
 
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
-from typing import Dict
+from typing import Dict, List
 import numpy
 from deap import base
 from deap import creator
 from deap import tools
 from deap.benchmarks.tools import hypervolume
-from copy import deepcopy
 from pygeoc.utils import UtilClass
 
 from utility.scoop_func import scoop_log
+from utility.eval_cache import EvaluationCache
+from utility.executor import create_executor
+from utility.surrogate import SurrogateModel
+from utility.checkpoint import save_checkpoint, load_checkpoint, restore_log_files
+from utility.convergence import ConvergenceMonitor
+from utility.population_store import PopulationStore
+from utility.background_plot import BackgroundPlotter
+from utility.warm_start import load_archive_genes, revalidate_bounds
 from scenario_analysis.userdef import initIterateWithCfg, initRepeatWithCfg
 from scenario_analysis.visualization import plot_pareto_front_single, plot_hypervolume_single
 from calibration.config import CaliConfig, get_optimization_config
-from run_seims import MainSEIMS
+from run_seims import MainSEIMS, RuntimeRatioLimit
 
 from calibration.calibrate import Calibration, initialize_calibrations, calibration_objectives
+from calibration.calibrate import calibration_objectives_in_slot
+from calibration.calibrate import calibration_statistics, outlet_observations
+from calibration.calibrate import individual_cache_record, restore_individual_from_cache
 from calibration.calibrate import TimeseriesData, ObsSimData
 from calibration.userdef import write_param_values_to_mongodb, output_population_details
 
@@ -111,7 +136,8 @@ creator.create('Individual', array.array, typecode=str('d'), fitness=creator.Fit
                gen=-1, id=-1,
                obs=TimeseriesData, sim=TimeseriesData,
                cali=ObsSimData, vali=ObsSimData,
-               io_time=0., comp_time=0., simu_time=0., runtime=0.)
+               io_time=0., comp_time=0., simu_time=0., runtime=0.,
+               run_success=False, terminated=False, attempts=0)
 # The Individual class equals to:
 # class Individual(array.array):
 #     gen = -1  # Generation No.
@@ -124,7 +150,9 @@ toolbox = base.Toolbox()
 toolbox.register('gene_values', initialize_calibrations)
 toolbox.register('individual', initIterateWithCfg, creator.Individual, toolbox.gene_values)
 toolbox.register('population', initRepeatWithCfg, list, toolbox.individual)
-toolbox.register('evaluate', calibration_objectives)
+# Statistics are calculated for the whole population in `evaluate_parallel` in batch
+toolbox.register('evaluate', calibration_objectives, calc_statistics=False)
+toolbox.register('evaluate_in_slot', calibration_objectives_in_slot)
 
 # mate and mutate
 toolbox.register('mate', tools.cxSimulatedBinaryBounded)
@@ -139,7 +167,7 @@ def main(cfg):
 
     # Initial timespan variables
     stime = time.time()
-    plot_time = 0.
+    plot_time = 0.  # Submitting plots and waiting for the final ones, not the rendering
     allmodels_exect = list()  # execute time of all model runs
 
     # create reference point for hypervolume
@@ -156,36 +184,86 @@ def main(cfg):
     # read observation data from MongoDB
     cali_obj = Calibration(cfg)
 
-    # Read observation data just once
+    # Read observation data just once, which is shared by evaluations rather than copied to
+    #   individuals. Each worker process reads it on its first evaluation.
     model_cfg_dict = cali_obj.model.ConfigDict
-    model_obj = MainSEIMS(args_dict=model_cfg_dict)
-
-    model_obj.SetMongoClient()
-    obs_vars, obs_data_dict = model_obj.ReadOutletObservations(object_vars)
-    model_obj.UnsetMongoClient()
-
-    # Initialize population
-    param_values = cali_obj.initialize(cfg.opt.npop)
-    pop = list()
-    for i in range(cfg.opt.npop):
-        ind = creator.Individual(param_values[i])
-        ind.gen = 0
-        ind.id = i
-        ind.obs.vars = obs_vars[:]
-        ind.obs.data = deepcopy(obs_data_dict)
-        pop.append(ind)
-    param_values = numpy.array(param_values)
-
-    # Write calibrated values to MongoDB
-    # TODO, extract this function, which is same with `Sensitivity::write_param_values_to_mongodb`.
-    write_param_values_to_mongodb(cfg.model.host, cfg.model.port, cfg.model.db_name, cali_obj.ParamDefs, param_values)
+    obs_vars, _ = outlet_observations(cali_obj, object_vars)
+
+    # Persistent cache of evaluated individuals, keyed by parameter values and configuration
+    eval_cache = None
+    if cfg.opt.eval_cache:
+        cache_cfg = dict(model_cfg_dict)
+        cache_cfg.update({'param_defs': cali_obj.ParamDefs, 'object_vars': object_vars,
+                          'cali_stime': cfg.cali_stime, 'cali_etime': cfg.cali_etime,
+                          'vali_stime': cfg.vali_stime, 'vali_etime': cfg.vali_etime})
+        eval_cache = EvaluationCache(cfg.opt.eval_cache_dir, cache_cfg)
+    # Columnar store of population details, see `output_population_details`
+    pop_store = PopulationStore(cfg.opt.simdata_dir) if cfg.opt.population_store else None
+    # Plots of Pareto fronts and 95PPU are rendered off the critical path of model evaluations
+    plotter = BackgroundPlotter(cfg.opt.plot_frequency, cfg.opt.background_plot,
+                                cfg.opt.plot_queue_size)
+    # Surrogate of fitness values to pre-screen offspring, trained on evaluated individuals
+    surrogate = None
+    if cfg.opt.surrogate:
+        surrogate = SurrogateModel(cfg.opt.surrogate)
+
     # get the low and up bound of calibrated parameters
     bounds = numpy.array(cali_obj.ParamDefs['bounds'])
     low = bounds[:, 0]
     up = bounds[:, 1]
     low = low.tolist()
     up = up.tolist()
+
+    # Resume from the last checkpoint, i.e., the state after a complete generation, in which
+    #   case the initial population is neither sampled nor written to MongoDB
+    checkpoint = load_checkpoint(cfg.opt.checkpoint_file) if cfg.opt.resume else None
+    if checkpoint is not None:
+        pop = checkpoint['pop']
+    else:
+        # Initialize population, warm start from the archive of a previous run if specified
+        param_values = list()
+        if cfg.opt.warm_start_file:
+            archive_genes, archive_inds = load_archive_genes(cfg.opt.warm_start_file,
+                                                             cfg.opt.warm_start_gen,
+                                                             sce_name='calibrationID')
+            param_values, kept = revalidate_bounds(archive_genes, low, up,
+                                                   cfg.opt.warm_start_bounds)
+            param_values = param_values[:cfg.opt.npop]
+            scoop_log('Warm start: %d of %d individuals in %s are valid for the current bounds, '
+                      '%d are used.' % (len(kept), len(archive_genes), cfg.opt.warm_start_file,
+                                        len(param_values)))
+            if cfg.opt.warm_start_cache and eval_cache is not None and archive_inds is not None:
+                seeded = 0
+                for genes, idx in zip(param_values, kept):
+                    tmpind = archive_inds[idx]
+                    if list(tmpind) == genes and tmpind.cali.valid and tmpind not in eval_cache:
+                        eval_cache.put(tmpind, individual_cache_record(tmpind))
+                        seeded += 1
+                scoop_log('Warm start: %d evaluated individuals are put into cache.' % seeded)
+        if len(param_values) < cfg.opt.npop:
+            param_values += cali_obj.initialize(cfg.opt.npop - len(param_values))
+        pop = list()
+        for i in range(cfg.opt.npop):
+            ind = creator.Individual(param_values[i])
+            ind.gen = 0
+            ind.id = i
+            ind.obs.vars = obs_vars[:]
+            pop.append(ind)
+        param_values = numpy.array(param_values)
+
+        # Write calibrated values to MongoDB
+        write_param_values_to_mongodb(cfg.model.host, cfg.model.port, cfg.model.db_name,
+                                      cali_obj.ParamDefs, param_values)
     pop_select_num = int(cfg.opt.npop * cfg.opt.rsel)
+    # Executor of model runs, e.g., SCOOP, process pool, or Slurm job array
+    executor = create_executor(cfg.resource, cfg.opt.out_dir,
+                               cfg.model.nprocess * cfg.model.nthread)
+    # Fitness values of the individuals whose model runs failed, the worst values by default
+    penalty_fitness = tuple(worse_objects)
+    if cfg.opt.penalty_fitness:
+        if len(cfg.opt.penalty_fitness) != len(worse_objects):
+            raise ValueError('PenaltyFitness should have %d values!' % len(worse_objects))
+        penalty_fitness = tuple(cfg.opt.penalty_fitness)
     init_time = time.time() - stime
 
     def check_validation(fitvalues):
@@ -198,24 +276,51 @@ def main(cfg):
                 flag = False
         return flag
 
+    def successful_run(tmpind):
+        """Whether the results of the individual are from its own successful model run."""
+        return tmpind.run_success and not tmpind.terminated and tmpind.cali.valid
+
+    # Background thread deleting the OUTPUT GridFS files of the last batch of model runs
+    gridfs_cleanup = list()  # type: List[threading.Thread]
+
+    def wait_gridfs_cleanup():
+        """Wait for the deferred cleanup of the last batch, which must be completed before
+        the same calibration IDs are executed again."""
+        while gridfs_cleanup:
+            gridfs_cleanup.pop().join()
+
     def evaluate_parallel(invalid_pops):
         """Evaluate model by SCOOP or map, and set fitness of individuals
          according to calibration step."""
-        popnum = len(invalid_pops)
         labels = list()
-        try:  # parallel on multi-processors or clusters using SCOOP
-            from scoop import futures
-            invalid_pops = list(futures.map(toolbox.evaluate, [cali_obj] * popnum, invalid_pops))
-        except ImportError or ImportWarning:  # Python build-in map (serial)
-            invalid_pops = list(map(toolbox.evaluate, [cali_obj] * popnum, invalid_pops))
-        for tmpind in invalid_pops:
-            labels = list()  # TODO, find an elegant way to get labels.
-            tmpfitnessv = list()
-            for k, v in list(multiobj.items()):
-                tmpvalues, tmplabel = tmpind.cali.efficiency_values(k, object_names[k])
-                tmpfitnessv += tmpvalues[:]
-                labels += tmplabel[:]
-            tmpind.fitness.values = tuple(tmpfitnessv)
+        # Restore the individuals that have been evaluated from cache
+        new_idx = list(range(len(invalid_pops)))
+        if eval_cache is not None:
+            new_idx = list()
+            for idx, tmpind in enumerate(invalid_pops):
+                record = eval_cache.get(tmpind)
+                if record is None:
+                    new_idx.append(idx)
+                else:
+                    restore_individual_from_cache(tmpind, record)
+        new_pops = [invalid_pops[idx] for idx in new_idx]
+        popnum = len(new_pops)
+        wait_gridfs_cleanup()
+        new_pops = executor.map(toolbox.evaluate, [cali_obj] * popnum, new_pops)
+        calibration_statistics(cali_obj, new_pops)
+        if cali_obj.model.defer_gridfs_cleanup and new_pops:
+            cleanup = MainSEIMS(args_dict=cali_obj.model.ConfigDict).CleanOutputGridFsBatch(
+                [(cali_obj.model.scenario_id, tmpind.id) for tmpind in new_pops],
+                background=True)
+            gridfs_cleanup.append(cleanup)
+        for idx, tmpind in zip(new_idx, new_pops):
+            invalid_pops[idx] = tmpind
+            if eval_cache is not None and successful_run(tmpind):
+                eval_cache.put(tmpind, individual_cache_record(tmpind))
+        if eval_cache is not None:
+            scoop_log('Individuals restored from cache: %d, newly evaluated: %d. %s' %
+                      (len(invalid_pops) - popnum, popnum, eval_cache.summary()))
+        labels = assign_fitness(invalid_pops)
 
         # Filter for a valid solution
         if filter_ind:
@@ -227,40 +332,51 @@ def main(cfg):
                 exit(2)
         return invalid_pops, labels  # Currently, `invalid_pops` contains evaluated individuals
 
-    # Record the count and execute timespan of model runs during the optimization
-    modelruns_count = {0: len(pop)}
-    modelruns_time = {0: 0.}  # Total time counted according to evaluate_parallel()
-    modelruns_time_sum = {0: 0.}  # Summarize time of every model runs according to pop
-
-    # Generation 0 before optimization
-    stime = time.time()
-    pop, plotlables = evaluate_parallel(pop)
-    modelruns_time[0] = time.time() - stime
-    for ind in pop:
-        allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
-        modelruns_time_sum[0] += ind.runtime
-
-    # currently, len(pop) may less than pop_select_num
-    pop = toolbox.select(pop, pop_select_num)
-    # Output simulated data to json or pickle files for future use.
-    output_population_details(pop, cfg.opt.simdata_dir, 0, plot_cfg=cali_obj.cfg.plot_cfg)
-
-    record = stats.compile(pop)
-    logbook.record(gen=0, evals=len(pop), **record)
-    scoop_log(logbook.stream)
-
-    # Begin the generational process
-    output_str = '### Generation number: %d, Population size: %d ###\n' % (cfg.opt.ngens,
-                                                                           cfg.opt.npop)
-    scoop_log(output_str)
-    UtilClass.writelog(cfg.opt.logfile, output_str, mode='replace')
-
-    modelsel_count = {0: len(pop)}  # type: Dict[int, int] # newly added Pareto fronts
-
-    for gen in range(1, cfg.opt.ngens + 1):
-        output_str = '###### Generation: %d ######\n' % gen
-        scoop_log(output_str)
-
+    def assign_fitness(evaluated_pops):
+        """Set fitness of evaluated individuals according to calibration step."""
+        labels = list()
+        failed_count = 0
+        terminated_count = 0
+        for tmpind in evaluated_pops:
+            labels = list()  # TODO, find an elegant way to get labels.
+            tmpfitnessv = list()
+            for k, v in list(multiobj.items()):
+                tmpvalues, tmplabel = tmpind.cali.efficiency_values(k, object_names[k])
+                tmpfitnessv += tmpvalues[:]
+                labels += tmplabel[:]
+            if tmpind.terminated:
+                terminated_count += 1
+                tmpfitnessv = penalty_fitness
+            elif not tmpind.cali.valid:
+                failed_count += 1
+                tmpfitnessv = penalty_fitness
+            tmpind.fitness.values = tuple(tmpfitnessv)
+        if failed_count:
+            scoop_log('%d individuals failed and assigned with penalty fitness.' % failed_count)
+        if terminated_count:
+            scoop_log('%d individuals were terminated by the runtime ratio limit and assigned with '
+                      'penalty fitness.' % terminated_count)
+        return labels
+
+    def train_surrogate(evaluated_inds, refit=True):
+        """Add the successfully evaluated individuals to surrogate and retrain it."""
+        if surrogate is None:
+            return
+        for tmpind in evaluated_inds:
+            if successful_run(tmpind):
+                surrogate.add(tmpind, tmpind.fitness.values)
+        if refit and surrogate.size >= cfg.opt.surrogate_min_samples:
+            surrogate.fit()
+
+    def prescreen_offspring(candidates, num):
+        """Select `num` most promising candidates by surrogate, or the first `num` ones."""
+        if surrogate is None or not surrogate.trained or num >= len(candidates):
+            return candidates[:num]
+        selected = surrogate.prescreen(candidates, num, multi_weight)
+        return [candidates[idx] for idx in selected]
+
+    def vary_population(pop):
+        """Generate offspring by mate and mutate, the changed ones have invalid fitness."""
         offspring = [toolbox.clone(ind) for ind in pop]
         # method1: use crowding distance (normalized as 0~1) as eta
         # tools.emo.assignCrowdingDist(offspring)
@@ -277,63 +393,125 @@ def main(cfg):
         else:
             toolbox.mutate(offspring[0], 1., low, up, cfg.opt.rmut)
             del offspring[0].fitness.values
+        return offspring
+
+    def record_runtimes(evaluated_inds):
+        """Record the runtime of successful model runs, i.e., not terminated, not retried,
+        and not restored from cache, as samples of the runtime ratio limit."""
+        for ind in evaluated_inds:
+            if ind.run_success and not ind.terminated and ind.attempts == 1 and \
+                ind.cali.valid and ind.runtime > 0.:
+                runtime_limit.add(ind.runtime)
+
+    def update_runtime_limit():
+        """Update the maximum runtime of model runs for early termination."""
+        if not cfg.opt.early_termination:
+            return
+        limit = runtime_limit.limit
+        if limit is None:
+            return
+        cali_obj.max_runtime = limit
+        if 0. < cfg.opt.run_timeout < cali_obj.max_runtime:
+            cali_obj.max_runtime = cfg.opt.run_timeout
+        scoop_log('Model runs longer than %.2fs will be terminated.' % cali_obj.max_runtime)
 
-        # Evaluate the individuals with an invalid fitness
-        invalid_inds = [ind for ind in offspring if not ind.fitness.valid]
-        valid_inds = [ind for ind in offspring if ind.fitness.valid]
-        if len(invalid_inds) == 0:  # No need to continue
-            scoop_log('Note: No invalid individuals available, the NSGA2 will be terminated!')
-            break
-
-        # Write new calibrated parameters to MongoDB
-        param_values = list()
-        for idx, ind in enumerate(invalid_inds):
-            ind.gen = gen
-            ind.id = idx
-            param_values.append(ind[:])
-        param_values = numpy.array(param_values)
-        write_param_values_to_mongodb(cfg.model.host, cfg.model.port, cfg.model.db_name,
-                                      cali_obj.ParamDefs, param_values)
-        # Count the model runs, and execute models
-        invalid_ind_size = len(invalid_inds)
-        modelruns_count.setdefault(gen, invalid_ind_size)
+    # Record the count and execute timespan of model runs during the optimization
+    modelruns_count = {0: len(pop)}
+    modelruns_time = {0: 0.}  # Total time counted according to evaluate_parallel()
+    modelruns_time_sum = {0: 0.}  # Summarize time of every model runs according to pop
+    modelsel_count = dict()  # type: Dict[int, int] # newly added Pareto fronts
+    # Runtime limit of early termination, i.e., `termination_ratio` times of the median
+    #   runtime of successful model runs, regardless of the objectives of the running models
+    runtime_limit = RuntimeRatioLimit(cfg.opt.termination_ratio)
+    # Hypervolume convergence and computing budgets
+    convergence = ConvergenceMonitor(cfg.opt.conv_window, cfg.opt.conv_tolerance,
+                                     cfg.opt.max_walltime, cfg.opt.max_evaluations)
+
+    def save_state(gen, pop, plotlables, plot_time):
+        """Save checkpoint after a complete generation, see `utility.checkpoint`."""
+        if cfg.opt.checkpoint_interval <= 0 or \
+            (gen % cfg.opt.checkpoint_interval != 0 and gen < cfg.opt.ngens):
+            return
+        save_checkpoint(cfg.opt.checkpoint_file,
+                        {'gen': gen, 'pop': pop, 'plotlables': plotlables, 'logbook': logbook,
+                         'plot_time': plot_time, 'allmodels_exect': allmodels_exect,
+                         'modelruns_count': modelruns_count, 'modelruns_time': modelruns_time,
+                         'modelruns_time_sum': modelruns_time_sum,
+                         'modelsel_count': modelsel_count, 'surrogate': surrogate,
+                         'max_runtime': cali_obj.max_runtime, 'runtime_limit': runtime_limit,
+                         'convergence': convergence},
+                        log_files=[cfg.opt.logfile, cfg.opt.hypervlog])
+
+    # Restore the state of the last complete generation from checkpoint
+    if checkpoint is not None:
+        restore_log_files(checkpoint)
+        start_gen = checkpoint['gen'] + 1
+        plotlables = checkpoint['plotlables']
+        logbook = checkpoint['logbook']
+        plot_time = checkpoint['plot_time']
+        allmodels_exect = checkpoint['allmodels_exect']
+        surrogate = checkpoint['surrogate']
+        cali_obj.max_runtime = checkpoint['max_runtime']
+        runtime_limit = checkpoint['runtime_limit']
+        convergence = checkpoint['convergence']
+        convergence.restart()
+        modelruns_count.update(checkpoint['modelruns_count'])
+        modelruns_time.update(checkpoint['modelruns_time'])
+        modelruns_time_sum.update(checkpoint['modelruns_time_sum'])
+        modelsel_count.update(checkpoint['modelsel_count'])
+        scoop_log('Resume from the checkpoint of generation %d.' % checkpoint['gen'])
+    else:
+        if cfg.opt.resume:
+            scoop_log('No valid checkpoint found, start a new optimization.')
+        start_gen = 1
+        # Generation 0 before optimization
         stime = time.time()
-        invalid_inds, plotlables = evaluate_parallel(invalid_inds)
-        curtimespan = time.time() - stime
-        modelruns_time.setdefault(gen, curtimespan)
-        modelruns_time_sum.setdefault(gen, 0.)
-        for ind in invalid_inds:
+        pop, plotlables = evaluate_parallel(pop)
+        modelruns_time[0] = time.time() - stime
+        train_surrogate(pop)
+        for ind in pop:
             allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
-            modelruns_time_sum[gen] += ind.runtime
+            modelruns_time_sum[0] += ind.runtime
+        record_runtimes(pop)
+        update_runtime_limit()
 
-        # Select the next generation population
-        # Previous version may result in duplications of the same scenario in one Pareto front,
-        #   thus, I decided to check and remove the duplications first.
-        # pop = toolbox.select(pop + valid_inds + invalid_inds, pop_select_num)
-        tmppop = pop + valid_inds + invalid_inds
-        pop = list()
-        unique_sces = dict()
-        for tmpind in tmppop:
-            if tmpind.gen in unique_sces and tmpind.id in unique_sces[tmpind.gen]:
-                continue
-            if tmpind.gen not in unique_sces:
-                unique_sces.setdefault(tmpind.gen, [tmpind.id])
-            elif tmpind.id not in unique_sces[tmpind.gen]:
-                unique_sces[tmpind.gen].append(tmpind.id)
-            pop.append(tmpind)
+        # currently, len(pop) may less than pop_select_num
         pop = toolbox.select(pop, pop_select_num)
+        # Output simulated data to json or pickle files for future use.
+        output_population_details(pop, cfg.opt.simdata_dir, 0, plot_cfg=cali_obj.cfg.plot_cfg,
+                                  store=pop_store, plotter=plotter)
 
-        output_population_details(pop, cfg.opt.simdata_dir, gen, plot_cfg=cali_obj.cfg.plot_cfg)
+        record = stats.compile(pop)
+        logbook.record(gen=0, evals=len(pop), **record)
+        scoop_log(logbook.stream)
+
+        # Begin the generational process
+        output_str = '### Generation number: %d, Population size: %d ###\n' % (cfg.opt.ngens,
+                                                                               cfg.opt.npop)
+        scoop_log(output_str)
+        UtilClass.writelog(cfg.opt.logfile, output_str, mode='replace')
+
+        modelsel_count[0] = len(pop)
+        convergence.update(hypervolume(pop, ref_pt), modelruns_count[0])
+        save_state(0, pop, plotlables, plot_time)
+
+    def report_generation(gen, pop, nevals, curtimespan, plotlables):
+        """Output, log, and plot the population of a generation, returns the timespan of
+        submitting plots, i.e., the plots are rendered in background if `background_plot`.
+        The convergence is updated by the hypervolume of the population."""
+        output_population_details(pop, cfg.opt.simdata_dir, gen, plot_cfg=cali_obj.cfg.plot_cfg,
+                                  store=pop_store, plotter=plotter)
+        hyper_v = hypervolume(pop, ref_pt)
+        convergence.update(hyper_v, nevals)
         hyper_str = 'Gen: %d, New model runs: %d, ' \
                     'Execute timespan: %.4f, Sum of model run timespan: %.4f, ' \
-                    'Hypervolume: %.4f\n' % (gen, invalid_ind_size,
-                                             curtimespan, modelruns_time_sum[gen],
-                                             hypervolume(pop, ref_pt))
+                    'Hypervolume: %.4f\n' % (gen, nevals,
+                                             curtimespan, modelruns_time_sum[gen], hyper_v)
         scoop_log(hyper_str)
         UtilClass.writelog(cfg.opt.hypervlog, hyper_str, mode='append')
 
         record = stats.compile(pop)
-        logbook.record(gen=gen, evals=len(invalid_inds), **record)
+        logbook.record(gen=gen, evals=nevals, **record)
         scoop_log(logbook.stream)
 
         # Count the newly generated near Pareto fronts
@@ -351,11 +529,12 @@ def main(cfg):
         title = (u'近似最优Pareto解集' if cali_obj.cfg.plot_cfg.plot_cn else
                  'Near Pareto optimal solutions')
 
-        plot_pareto_front_single(front, plotlables, cfg.opt.out_dir,
-                                 gen, title, plot_cfg=cali_obj.cfg.plot_cfg)
-        plot_time += time.time() - stime
+        plotter.submit(gen, plot_pareto_front_single, front, plotlables, cfg.opt.out_dir,
+                       gen, title, plot_cfg=cali_obj.cfg.plot_cfg)
+        submit_timespan = time.time() - stime
 
         # save in file
+        output_str = '###### Generation: %d ######\n' % gen
         # Header information
         output_str += 'generation\tcalibrationID\t'
         for kk, vv in list(object_names.items()):
@@ -375,11 +554,204 @@ def main(cfg):
             output_str += str(ind)
             output_str += '\n'
         UtilClass.writelog(cfg.opt.logfile, output_str, mode='append')
-
-        # TODO: Figure out if we should terminate the evolution
-
-    # Plot hypervolume and newly executed model count
-    plot_hypervolume_single(cfg.opt.hypervlog, cfg.opt.out_dir, plot_cfg=cali_obj.cfg.plot_cfg)
+        return submit_timespan
+
+    def evolve_steady_state(pop, plotlables, start_gen=1):
+        """Asynchronous steady-state evolution, returns the final population and the
+        timespan of submitting plots.
+
+        An offspring is generated from the current population (i.e., Pareto archive) and
+          submitted as soon as any evaluation finishes, and the population is updated by
+          NSGA-II selection once an offspring is evaluated. Every `npop` evaluations are
+          counted as a generation for logging and plotting.
+        Each individual has a unique (generation, ID) by the order of submission, while the
+          calibration IDs of the model runs are the slots of running models, i.e., only the
+          parameter values of the submitted slot are changed in MongoDB.
+        """
+        nslots = cfg.resource.max_workers if cfg.resource.max_workers > 0 else cfg.opt.npop
+        slot_values = numpy.tile(numpy.array(low), (nslots, 1))
+        free_slots = list(range(nslots))
+        running = dict()  # future: slot
+        pending = list()  # offspring waiting for a free slot
+        max_evals = cfg.opt.ngens * cfg.opt.npop
+        submitted = (start_gen - 1) * cfg.opt.npop  # Running ones are discarded when resuming
+        completed = submitted
+        if convergence.stop_reason:  # e.g., resumed from the checkpoint of the last generation
+            max_evals = submitted
+        sstime = time.time()
+        submit_timespan = 0.
+        wait_gridfs_cleanup()  # The slots are the calibration IDs of the initial population
+        while True:
+            evaluated = list()
+            # Submit offspring until all slots are occupied
+            while free_slots and submitted < max_evals:
+                if not pending:
+                    candidates = generate_offspring(pop)
+                    eval_num = len(candidates)
+                    if surrogate is not None and surrogate.trained:
+                        for _ in range(cfg.opt.surrogate_ratio - 1):
+                            candidates += generate_offspring(pop)
+                    pending.extend(prescreen_offspring(candidates, eval_num))
+                ind = pending.pop(0)
+                ind.gen = submitted // cfg.opt.npop + 1
+                ind.id = submitted % cfg.opt.npop
+                submitted += 1
+                record = eval_cache.get(ind) if eval_cache is not None else None
+                if record is not None:
+                    evaluated.append(restore_individual_from_cache(ind, record))
+                    continue
+                slot = free_slots.pop(0)
+                slot_values[slot] = ind[:]
+                write_param_values_to_mongodb(cfg.model.host, cfg.model.port,
+                                              cfg.model.db_name, cali_obj.ParamDefs,
+                                              slot_values, unset_previous=False)
+                running[executor.submit(toolbox.evaluate_in_slot, cali_obj, ind, slot)] = slot
+            if not evaluated and running:
+                done, _ = executor.wait_any(list(running))
+                for fut in done:
+                    slot = running.pop(fut)
+                    ind = fut.result()
+                    calibration_statistics(cali_obj, [ind])
+                    if cali_obj.model.defer_gridfs_cleanup:  # Before the slot is reused
+                        MainSEIMS(args_dict=cali_obj.model.ConfigDict).CleanOutputGridFsBatch(
+                            [(cali_obj.model.scenario_id, slot)])
+                    free_slots.append(slot)
+                    if eval_cache is not None and successful_run(ind):
+                        eval_cache.put(ind, individual_cache_record(ind))
+                    evaluated.append(ind)
+            if not evaluated:  # All offspring have been evaluated
+                break
+            labels = assign_fitness(evaluated)
+            if labels:
+                plotlables = labels
+            train_surrogate(evaluated, refit=False)
+            for ind in evaluated:
+                gen = completed // cfg.opt.npop + 1
+                completed += 1
+                modelruns_count[gen] = modelruns_count.get(gen, 0) + 1
+                modelruns_time_sum[gen] = modelruns_time_sum.get(gen, 0.) + ind.runtime
+                allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
+                record_runtimes([ind])
+                if not filter_ind or check_validation(ind.fitness.values):
+                    pop = toolbox.select(pop + [ind], pop_select_num)
+                if completed % cfg.opt.npop == 0 or completed == max_evals:
+                    modelruns_time[gen] = time.time() - sstime
+                    scoop_log('###### Generation: %d (steady-state) ######\n' % gen)
+                    update_runtime_limit()
+                    train_surrogate([])
+                    submit_timespan += report_generation(gen, pop, modelruns_count[gen],
+                                                       modelruns_time[gen], plotlables)
+                    save_state(gen, pop, plotlables, plot_time + submit_timespan)
+                    sstime = time.time()
+                    if convergence.stop_reason and max_evals > submitted:
+                        # Stop submitting, the running evaluations are still gathered
+                        scoop_log(convergence.stop_reason)
+                        max_evals = submitted
+        if eval_cache is not None:
+            scoop_log(eval_cache.summary())
+        return pop, submit_timespan
+
+    def generate_offspring(pop):
+        """Generate two offspring (or one if the population is too small) by mate and mutate."""
+        if len(pop) < 2:
+            offspring = [toolbox.clone(pop[0])]
+            toolbox.mutate(offspring[0], 1., low, up, cfg.opt.rmut)
+        else:
+            idx1, idx2 = sorted(random.sample(range(len(pop)), 2))
+            offspring = [toolbox.clone(pop[idx1]), toolbox.clone(pop[idx2])]
+            # Use the index of the pair at the sorted population as eta, like the generational
+            eta = idx1 // 2
+            if random.random() <= cfg.opt.rcross:
+                toolbox.mate(offspring[0], offspring[1], eta, low, up)
+            # Always mutate so that the offspring is unlikely to be the same as its parent
+            toolbox.mutate(offspring[0], eta, low, up, cfg.opt.rmut)
+            toolbox.mutate(offspring[1], eta, low, up, cfg.opt.rmut)
+        for ind in offspring:
+            del ind.fitness.values
+            ind.obs.vars = obs_vars[:]
+        return offspring
+
+    if cfg.opt.steady_state:
+        pop, ss_submit_time = evolve_steady_state(pop, plotlables, start_gen)
+        plot_time += ss_submit_time
+    else:
+        for gen in range(start_gen, cfg.opt.ngens + 1):
+            if convergence.stop_reason:
+                scoop_log('%s The NSGA2 will be terminated!' % convergence.stop_reason)
+                break
+            output_str = '###### Generation: %d ######\n' % gen
+            scoop_log(output_str)
+
+            offspring = vary_population(pop)
+            if surrogate is not None and surrogate.trained:
+                # Generate more candidates and evaluate the most promising ones by surrogate
+                candidates = [ind for ind in offspring if not ind.fitness.valid]
+                eval_num = len(candidates)
+                for _ in range(cfg.opt.surrogate_ratio - 1):
+                    candidates += [ind for ind in vary_population(pop) if not ind.fitness.valid]
+                offspring = [ind for ind in offspring if ind.fitness.valid] + \
+                            prescreen_offspring(candidates, eval_num)
+                scoop_log('Surrogate pre-screening: %d of %d candidates are selected.' %
+                          (eval_num, len(candidates)))
+
+            # Evaluate the individuals with an invalid fitness
+            invalid_inds = [ind for ind in offspring if not ind.fitness.valid]
+            valid_inds = [ind for ind in offspring if ind.fitness.valid]
+            if len(invalid_inds) == 0:  # No need to continue
+                scoop_log('Note: No invalid individuals available, the NSGA2 will be terminated!')
+                break
+
+            # Write new calibrated parameters to MongoDB
+            param_values = list()
+            for idx, ind in enumerate(invalid_inds):
+                ind.gen = gen
+                ind.id = idx
+                param_values.append(ind[:])
+            param_values = numpy.array(param_values)
+            write_param_values_to_mongodb(cfg.model.host, cfg.model.port, cfg.model.db_name,
+                                          cali_obj.ParamDefs, param_values)
+            # Count the model runs, and execute models
+            invalid_ind_size = len(invalid_inds)
+            modelruns_count.setdefault(gen, invalid_ind_size)
+            stime = time.time()
+            invalid_inds, plotlables = evaluate_parallel(invalid_inds)
+            curtimespan = time.time() - stime
+            train_surrogate(invalid_inds)
+            modelruns_time.setdefault(gen, curtimespan)
+            modelruns_time_sum.setdefault(gen, 0.)
+            for ind in invalid_inds:
+                allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
+                modelruns_time_sum[gen] += ind.runtime
+            record_runtimes(invalid_inds)
+            update_runtime_limit()
+
+            # Select the next generation population
+            # Previous version may result in duplications of the same scenario in one Pareto front,
+            #   thus, I decided to check and remove the duplications first.
+            # pop = toolbox.select(pop + valid_inds + invalid_inds, pop_select_num)
+            tmppop = pop + valid_inds + invalid_inds
+            pop = list()
+            unique_sces = dict()
+            for tmpind in tmppop:
+                if tmpind.gen in unique_sces and tmpind.id in unique_sces[tmpind.gen]:
+                    continue
+                if tmpind.gen not in unique_sces:
+                    unique_sces.setdefault(tmpind.gen, [tmpind.id])
+                elif tmpind.id not in unique_sces[tmpind.gen]:
+                    unique_sces[tmpind.gen].append(tmpind.id)
+                pop.append(tmpind)
+            pop = toolbox.select(pop, pop_select_num)
+            plot_time += report_generation(gen, pop, len(invalid_inds), curtimespan, plotlables)
+            save_state(gen, pop, plotlables, plot_time)
+
+    # Plot the pending graphs of the final generation, hypervolume and newly executed model count
+    stime = time.time()
+    plotter.close()
+    if plotter.enabled:
+        plot_hypervolume_single(cfg.opt.hypervlog, cfg.opt.out_dir,
+                                plot_cfg=cali_obj.cfg.plot_cfg)
+    plot_time += time.time() - stime
+    wait_gridfs_cleanup()
 
     # Save newly added Pareto fronts of each generations
     new_fronts_count = numpy.array(list(modelsel_count.items()))
@@ -413,8 +785,9 @@ def main(cfg):
     scoop_log('Initialization timespan: %.4f\n'
               'Model execution timespan: %.4f\n'
               'Sum of model runs timespan: %.4f\n'
-              'Plot Pareto graphs timespan: %.4f' % (init_time, exec_time,
+              'Plot timespan on the critical path: %.4f' % (init_time, exec_time,
                                                      exec_time_sum, plot_time))
+    executor.shutdown()
 
     return pop, logbook
 
@@ -11,12 +11,20 @@ Scilab:
     website: http://forge.scilab.org/index.php/p/scidoe/source/tree/master/macros/scidoe_lhsdesign.sci
 Much thanks goes to these individuals. It has been converted to Python by
 Abraham Lee.
+
+    @changelog:
+    - 26-10-18  - st - Vectorized sampling and distances, parallel candidates, and seed.
 """
+from __future__ import absolute_import, division
+
+from multiprocessing import Pool
 
 import numpy as np
 
+MAX_SEED = 2 ** 31 - 1
 
-def lhs(n, samples=None, criterion=None, iterations=None):
+
+def lhs(n, samples=None, criterion=None, iterations=None, seed=None, workers=1):
     """
     Generate a latin-hypercube design
 
@@ -36,6 +44,13 @@ def lhs(n, samples=None, criterion=None, iterations=None):
     iterations : int
         The number of iterations in the maximin and correlations algorithms
         (Default: 5).
+    seed : int
+        Seed of the random number generator for a reproducible design. If not
+        given, the global random state of numpy is used (Default: None).
+    workers : int
+        The number of processes evaluating the candidate designs of maximin and
+        correlation algorithms. Each candidate is generated from its own seed
+        drawn in advance, so the design does not depend on workers (Default: 1).
 
     Returns
     -------
@@ -86,116 +101,108 @@ def lhs(n, samples=None, criterion=None, iterations=None):
         >>> lhs(4, samples=5, criterion='correlate', iterations=10)
 
     """
-    H = None
-
     if samples is None:
         samples = n
 
     if criterion is not None:
-        assert criterion.lower() in ('center', 'c', 'maximin', 'm',
-                                     'centermaximin', 'cm', 'correlation',
-                                     'corr'), 'Invalid value for "criterion": {}'.format(criterion)
-    else:
-        H = _lhsclassic(n, samples)
-
-    if criterion is None:
-        criterion = 'center'
+        criterion = criterion.lower()
+        assert criterion in ('center', 'c', 'maximin', 'm', 'centermaximin', 'cm',
+                             'correlation', 'correlate', 'corr'), \
+            'Invalid value for "criterion": {}'.format(criterion)
 
     if iterations is None:
         iterations = 5
 
-    if H is None:
-        if criterion.lower() in ('center', 'c'):
-            H = _lhscentered(n, samples)
-        elif criterion.lower() in ('maximin', 'm'):
-            H = _lhsmaximin(n, samples, iterations, 'maximin')
-        elif criterion.lower() in ('centermaximin', 'cm'):
-            H = _lhsmaximin(n, samples, iterations, 'centermaximin')
-        elif criterion.lower() in ('correlate', 'corr'):
-            H = _lhscorrelate(n, samples, iterations)
+    rng = np.random if seed is None else np.random.RandomState(seed)
+    if criterion is None:
+        H = _lhsclassic(n, samples, rng)
+    elif criterion in ('center', 'c'):
+        H = _lhscentered(n, samples, rng)
+    elif criterion in ('maximin', 'm'):
+        H = _lhsoptimize(n, samples, iterations, 'maximin', rng, workers)
+    elif criterion in ('centermaximin', 'cm'):
+        H = _lhsoptimize(n, samples, iterations, 'centermaximin', rng, workers)
+    else:
+        H = _lhsoptimize(n, samples, iterations, 'correlation', rng, workers)
 
     return H
 
 
 ################################################################################
 
-def _lhsclassic(n, samples):
+def _lhsclassic(n, samples, rng=np.random):
     # Generate the intervals
     cut = np.linspace(0, 1, samples + 1)
 
     # Fill points uniformly in each interval
-    u = np.random.rand(samples, n)
-    a = cut[:samples]
-    b = cut[1:samples + 1]
-    rdpoints = np.zeros_like(u)
-    for j in range(n):
-        rdpoints[:, j] = u[:, j] * (b - a) + a
-
-    # Make the random pairings
-    H = np.zeros_like(rdpoints)
-    for j in range(n):
-        order = np.random.permutation(range(samples))
-        H[:, j] = rdpoints[order, j]
+    u = rng.rand(samples, n)
+    a = cut[:samples, np.newaxis]
+    rdpoints = u * (cut[1] - cut[0]) + a
 
-    return H
+    # Make the random pairings, i.e., an independent permutation of each column
+    order = np.argsort(rng.rand(samples, n), axis=0)
+    return rdpoints[order, np.arange(n)]
 
 
 ################################################################################
 
-def _lhscentered(n, samples):
+def _lhscentered(n, samples, rng=np.random):
     # Generate the intervals
     cut = np.linspace(0, 1, samples + 1)
-
-    # Fill points uniformly in each interval
-    u = np.random.rand(samples, n)
-    a = cut[:samples]
-    b = cut[1:samples + 1]
-    _center = (a + b) / 2
+    _center = (cut[:samples] + cut[1:samples + 1]) / 2
 
     # Make the random pairings
-    H = np.zeros_like(u)
-    for j in range(n):
-        H[:, j] = np.random.permutation(_center)
-
-    return H
+    order = np.argsort(rng.rand(samples, n), axis=0)
+    return _center[order]
 
 
 ################################################################################
 
-def _lhsmaximin(n, samples, iterations, lhstype):
-    maxdist = 0
-
-    # Maximize the minimum distance between points
-    for i in range(iterations):
-        if lhstype == 'maximin':
-            Hcandidate = _lhsclassic(n, samples)
-        else:
-            Hcandidate = _lhscentered(n, samples)
-
-        d = _pdist(Hcandidate)
-        if maxdist < np.min(d):
-            maxdist = np.min(d)
-            H = Hcandidate.copy()
-
-    return H
+def _lhscandidate(args):
+    """Generate a candidate design from its seed, and calculate the score to be
+    maximized, i.e., the minimum distance between points (maximin), or the
+    negative maximum absolute correlation coefficient between factors."""
+    n, samples, lhstype, seed = args
+    rng = np.random.RandomState(seed)
+    if lhstype == 'centermaximin':
+        H = _lhscentered(n, samples, rng)
+    else:
+        H = _lhsclassic(n, samples, rng)
+    if lhstype == 'correlation':
+        return -_maxabscorr(H), H
+    return np.min(_pdist(H)), H
+
+
+def _lhsscore(args):
+    return _lhscandidate(args)[0]
+
+
+def _lhsoptimize(n, samples, iterations, lhstype, rng=np.random, workers=1):
+    # Maximize the minimum distance between points, or minimize the components
+    #   correlation coefficients, among `iterations` candidates
+    seeds = rng.randint(0, MAX_SEED, size=max(1, iterations))
+    tasks = [(n, samples, lhstype, int(s)) for s in seeds]
+    if workers > 1 and len(tasks) > 1:
+        pool = Pool(min(workers, len(tasks)))
+        try:
+            scores = pool.map(_lhsscore, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        scores = [_lhsscore(t) for t in tasks]
+    # Only the scores are transferred between processes, the best is regenerated
+    return _lhscandidate(tasks[int(np.argmax(scores))])[1]
 
 
 ################################################################################
 
-def _lhscorrelate(n, samples, iterations):
-    mincorr = np.inf
-
-    # Minimize the components correlation coefficients
-    for i in range(iterations):
-        # Generate a random LHS
-        Hcandidate = _lhsclassic(n, samples)
-        R = np.corrcoef(Hcandidate)
-        if np.max(np.abs(R[R != 1])) < mincorr:
-            mincorr = np.max(np.abs(R - np.eye(R.shape[0])))
-            print('new candidate solution found with max,abs corrcoef = {}'.format(mincorr))
-            H = Hcandidate.copy()
-
-    return H
+def _maxabscorr(x):
+    """Maximum absolute correlation coefficient between the columns (factors)."""
+    if x.shape[1] < 2:
+        return 0.
+    R = np.corrcoef(x, rowvar=False)
+    return np.max(np.abs(R[~np.eye(R.shape[0], dtype=bool)]))
 
 
 ################################################################################
@@ -213,8 +220,8 @@ def _pdist(x):
     -------
     d : array
         A 1-by-b array of scalars, where b = m*(m - 1)/2. This array contains
-        all the pair-wise point distances, arranged in the order (1, 0),
-        (2, 0), ..., (m-1, 0), (2, 1), ..., (m-1, 1), ..., (m-1, m-2).
+        all the pair-wise point distances, arranged in the order (0, 1),
+        (0, 2), ..., (0, m-1), (1, 2), ..., (1, m-1), ..., (m-2, m-1).
 
     Examples
     --------
@@ -236,11 +243,10 @@ def _pdist(x):
 
     m, n = x.shape
     if m < 2:
-        return []
-
-    d = []
-    for i in range(m - 1):
-        for j in range(i + 1, m):
-            d.append((sum((x[j, :] - x[i, :]) ** 2)) ** 0.5)
+        return np.array([])
 
-    return np.array(d)
+    # |xi - xj|^2 = |xi|^2 + |xj|^2 - 2 * xi.xj, computed by matrix product
+    sq = np.einsum('ij,ij->i', x, x)
+    d2 = sq[:, np.newaxis] + sq[np.newaxis, :] - 2. * np.dot(x, x.T)
+    iu = np.triu_indices(m, 1)
+    return np.sqrt(np.maximum(d2[iu], 0.))
@@ -7,6 +7,11 @@
     - 18-01-22  - lj - initial implementation.
     - 18-02-09  - lj - compatible with Python3.
     - 19-01-07  - lj - incorporated with PlotConfig
+    - 26-10-18  - st - Optionally keep CALI_VALUES of other calibration IDs when writing.
+    - 26-10-18  - st - Write CALI_VALUES of all parameters in one bulk_write.
+    - 26-10-18  - st - Append population details to the columnar store.
+    - 26-10-18  - st - Optionally submit 95PPU plots to the background plotter.
+    - 26-10-18  - st - Vectorized 95PPU band, P-factor and R-factor.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -14,6 +19,7 @@ import json
 import pickle
 import os
 import sys
+from datetime import datetime
 from io import open
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
@@ -29,80 +35,152 @@ if os.name != 'nt':  # Force matplotlib to not use any Xwindows backend.
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 
-from typing import Optional
+from typing import Optional, List
 from pygeoc.utils import StringClass, is_string
 
-from utility import save_png_eps, PlotConfig
+from utility import save_png_eps, PlotConfig, TimeseriesArray
+from utility.population_store import PopulationStore, stack_timeseries
+from utility.background_plot import BackgroundPlotter
 # import global_mongoclient as MongoDBObj
 from preprocess.db_mongodb import MongoClient, ConnectMongoDB
+from preprocess.db_read_model import write_calibration_values
 from parameters_sensitivity.sensitivity import SpecialJsonEncoder
 
 
-def write_param_values_to_mongodb(host, port, spatial_db, param_defs, param_values):
-    # update Parameters collection in MongoDB
+def write_param_values_to_mongodb(host, port, spatial_db, param_defs, param_values,
+                                  unset_previous=True):
+    """Update Parameters collection in MongoDB, see `write_calibration_values`."""
     # conn = MongoDBObj.client  # type: MongoClient
+    # unset_previous should be False if other models are running, e.g., steady-state NSGA-II,
+    #   in which case the values of the running calibration IDs must not be changed.
     conn = ConnectMongoDB(host, port).get_conn()
-    db = conn[spatial_db]
-    collection = db['PARAMETERS']
-    collection.update_many({}, {'$unset': {'CALI_VALUES': ''}})
-    for idx, pname in enumerate(param_defs['names']):
-        v2str = ','.join(str(v) for v in param_values[:, idx])
-        collection.find_one_and_update({'NAME': pname}, {'$set': {'CALI_VALUES': v2str}})
+    write_calibration_values(conn, spatial_db, param_defs['names'], param_values,
+                             unset_previous=unset_previous)
+
+
+def population_columns(pops):
+    """Columns and metadata of the population to be appended to `PopulationStore`.
+
+    Columns (one row per individual):
+        id, gen, genes, fitness (NaN if not assigned), runtime,
+        cali_valid, cali_objvalues (NaN if missing), vali_valid, vali_objvalues,
+        sim (nind, ntime, nvars), i.e., the simulation data of the entire simulation period.
+    Metadata:
+        sim_vars, dates, cali_objnames, vali_objnames, and the matched observations of each
+        variable, i.e., <period>_obs_dates_<var> and <period>_obs_<var>.
+    """
+    fitness = numpy.full((len(pops), len(pops[0].fitness.weights)), numpy.nan)
+    for i, ind in enumerate(pops):
+        if ind.fitness.valid:
+            fitness[i, :len(ind.fitness.values)] = ind.fitness.values
+    columns = {'id': [ind.id for ind in pops],
+               'gen': [ind.gen for ind in pops],
+               'genes': [list(ind) for ind in pops],
+               'fitness': fitness,
+               'runtime': [ind.runtime for ind in pops]}
+    meta = dict()
+    sim_vars = list()
+    series = list()
+    for ind in pops:
+        if not sim_vars and ind.sim.vars:
+            sim_vars = ind.sim.vars[:]
+        ts = ind.sim.data
+        if isinstance(ts, dict):  # e.g., loaded from checkpoint of previous version
+            ts = TimeseriesArray.from_dict(ts) if ts else None
+        series.append(ts)
+    meta['dates'], columns['sim'] = stack_timeseries(series)
+    meta['sim_vars'] = sim_vars
+    for period in ['cali', 'vali']:
+        objnames = list()
+        for ind in pops:
+            if getattr(ind, period).valid:
+                objnames = getattr(ind, period).objnames[:]
+                break
+        objvalues = numpy.full((len(pops), len(objnames)), numpy.nan)
+        for i, ind in enumerate(pops):
+            period_data = getattr(ind, period)
+            for j, name in enumerate(period_data.objnames):
+                if name in objnames:
+                    objvalues[i, objnames.index(name)] = period_data.objvalues[j]
+        columns['%s_valid' % period] = [getattr(ind, period).valid for ind in pops]
+        columns['%s_objvalues' % period] = objvalues
+        meta['%s_objnames' % period] = objnames
+        for ind in pops:  # The matched observations are the same for all individuals
+            if not getattr(ind, period).valid:
+                continue
+            for var, values in getattr(ind, period).sim_obs_data.items():
+                if not isinstance(values, dict) or 'Obs' not in values:
+                    continue
+                meta['%s_obs_dates_%s' % (period, var)] = numpy.array(values['UTCDATETIME'],
+                                                                      dtype='datetime64[s]')
+                meta['%s_obs_%s' % (period, var)] = values['Obs']
+            break
+    return columns, meta
 
 
 def output_population_details(pops, outdir, gen_num,
-                              plot_cfg=None  # type: Optional[PlotConfig]
+                              plot_cfg=None,  # type: Optional[PlotConfig]
+                              store=None,  # type: Optional[PopulationStore]
+                              plotter=None  # type: Optional[BackgroundPlotter]
                               ):
-    """Output population details, i.e., the simulation data, etc."""
-    # Save as json, which can be loaded by json.load()
-    # 1. Save the time series simulation data of the entire simulation period
-    all_sim_data = list()
-    pickle_file = outdir + os.path.sep + 'gen%d_allSimData.pickle' % gen_num
-    with open(pickle_file, 'wb') as f:
-        for ind in pops:
-            all_sim_data.append(ind.sim.data)
-        pickle.dump(all_sim_data, f)
+    """Output population details, i.e., the simulation data, etc.
 
-    # 2. Save the matched observation-simulation data of validation period,
-    #      and the simulation data separately.
+    If `store` is given, the gene values, objectives, and simulation data are appended to the
+      columnar store as a shard of the generation, see `population_columns`. Otherwise, they
+      are saved as pickle and json files.
+    If `plotter` is given, the 95PPU plot is submitted to it rather than plotted immediately.
+    """
     cali_sim_obs_data = list()
     cali_sim_data = list()
-    json_file = outdir + os.path.sep + 'gen%d_caliObsData.json' % gen_num
-    with open(json_file, 'w', encoding='utf-8') as f:
-        for ind in pops:
-            ind.cali.sim_obs_data['Gen'] = ind.gen
-            ind.cali.sim_obs_data['ID'] = ind.id
-            ind.cali.sim_obs_data['var_name'] = ind.cali.vars
-            cali_sim_obs_data.append(ind.cali.sim_obs_data)
-        json_data = json.dumps(cali_sim_obs_data, indent=4, cls=SpecialJsonEncoder)
-        f.write('%s' % json_data)
-    pickle_file = outdir + os.path.sep + 'gen%d_caliSimData.pickle' % gen_num
-    with open(pickle_file, 'wb') as f:
-        for ind in pops:
-            cali_sim_data.append(ind.cali.data)
-        pickle.dump(cali_sim_data, f)
-    # 3. Save the matched observation-simulation data of calibration period,
-    #      and the simulation data separately.
     vali_sim_obs_data = list()
     vali_sim_data = list()
-    if pops[0].vali.valid:
-        json_file = outdir + os.path.sep + 'gen%d_valiObsData.json' % gen_num
+    for ind in pops:
+        ind.cali.sim_obs_data['Gen'] = ind.gen
+        ind.cali.sim_obs_data['ID'] = ind.id
+        ind.cali.sim_obs_data['var_name'] = ind.cali.vars
+        cali_sim_obs_data.append(ind.cali.sim_obs_data)
+        cali_sim_data.append(ind.cali.data)
+        if pops[0].vali.valid:
+            ind.vali.sim_obs_data['Gen'] = ind.gen
+            ind.vali.sim_obs_data['ID'] = ind.id
+            ind.vali.sim_obs_data['var_name'] = ind.vali.vars
+            vali_sim_obs_data.append(ind.vali.sim_obs_data)
+            vali_sim_data.append(ind.vali.data)
+    if store is not None:
+        columns, meta = population_columns(pops)
+        store.append(gen_num, columns, meta)
+    else:
+        # Save as json, which can be loaded by json.load()
+        # 1. Save the time series simulation data of the entire simulation period
+        pickle_file = outdir + os.path.sep + 'gen%d_allSimData.pickle' % gen_num
+        with open(pickle_file, 'wb') as f:
+            pickle.dump([ind.sim.data for ind in pops], f)
+        # 2. Save the matched observation-simulation data of calibration period,
+        #      and the simulation data separately.
+        json_file = outdir + os.path.sep + 'gen%d_caliObsData.json' % gen_num
         with open(json_file, 'w', encoding='utf-8') as f:
-            for ind in pops:
-                ind.vali.sim_obs_data['Gen'] = ind.gen
-                ind.vali.sim_obs_data['ID'] = ind.id
-                ind.vali.sim_obs_data['var_name'] = ind.vali.vars
-                vali_sim_obs_data.append(ind.vali.sim_obs_data)
-            json_data = json.dumps(vali_sim_obs_data, indent=4, cls=SpecialJsonEncoder)
+            json_data = json.dumps(cali_sim_obs_data, indent=4, cls=SpecialJsonEncoder)
             f.write('%s' % json_data)
-        pickle_file = outdir + os.path.sep + 'gen%d_valiSimData.pickle' % gen_num
+        pickle_file = outdir + os.path.sep + 'gen%d_caliSimData.pickle' % gen_num
         with open(pickle_file, 'wb') as f:
-            for ind in pops:
-                vali_sim_data.append(ind.vali.data)
-            pickle.dump(vali_sim_data, f)
+            pickle.dump(cali_sim_data, f)
+        # 3. Save the matched observation-simulation data of validation period,
+        #      and the simulation data separately.
+        if pops[0].vali.valid:
+            json_file = outdir + os.path.sep + 'gen%d_valiObsData.json' % gen_num
+            with open(json_file, 'w', encoding='utf-8') as f:
+                json_data = json.dumps(vali_sim_obs_data, indent=4, cls=SpecialJsonEncoder)
+                f.write('%s' % json_data)
+            pickle_file = outdir + os.path.sep + 'gen%d_valiSimData.pickle' % gen_num
+            with open(pickle_file, 'wb') as f:
+                pickle.dump(vali_sim_data, f)
     # 4. Try to plot.
     if plot_cfg is None:
         plot_cfg = PlotConfig()
+    if plotter is not None:
+        plotter.submit(gen_num, calculate_95ppu, cali_sim_obs_data, cali_sim_data, outdir,
+                       gen_num, vali_sim_obs_data, vali_sim_data, plot_cfg=plot_cfg)
+        return
     try:
         # Calculate 95PPU for current generation, and plot the desired variables, e.g., Q and SED
         calculate_95ppu(cali_sim_obs_data, cali_sim_data, outdir, gen_num,
@@ -112,6 +190,74 @@ def output_population_details(pops, outdir, gen_num,
         pass
 
 
+def _as_timeseries(data):
+    """Simulation data of an individual as `TimeseriesArray`, e.g., loaded from pickle file."""
+    if isinstance(data, TimeseriesArray) or data is None:
+        return data
+    if not data:
+        return TimeseriesArray()
+    if is_string(next(iter(data))):
+        data = dict((StringClass.get_datetime(k), v) for k, v in data.items())
+    return TimeseriesArray.from_dict(data)
+
+
+def _as_datetimes(dates):
+    """Dates as a list of datetime, e.g., the strings loaded from json file."""
+    if dates and is_string(dates[0]):
+        return [StringClass.get_datetime(s) for s in dates]
+    return list(dates)
+
+
+def ppu95_band(sim_values, lower=2.5, upper=97.5):
+    # type: (numpy.ndarray, float, float) -> (numpy.ndarray, numpy.ndarray)
+    """Lower and upper bounds of the 95PPU band at each time step of all variables.
+
+    Args:
+        sim_values: Simulation data of individuals, (nind, ntime) or (nind, ntime, nvars),
+                    the individuals without any simulation data (all NaN) are excluded.
+        lower: Lower percentile, 2.5 by default.
+        upper: Upper percentile, 97.5 by default.
+
+    Returns:
+        Lower and upper bounds with the shape of sim_values[0].
+    """
+    sim_values = numpy.asarray(sim_values, dtype=float)
+    valid = ~numpy.isnan(sim_values.reshape(sim_values.shape[0], -1)).all(axis=1)
+    if valid.any():
+        sim_values = sim_values[valid]
+    func = numpy.nanpercentile if numpy.isnan(sim_values).any() else numpy.percentile
+    try:
+        bounds = func(sim_values, [lower, upper], axis=0, method='nearest')
+    except TypeError:  # numpy < 1.22
+        bounds = func(sim_values, [lower, upper], axis=0, interpolation='nearest')
+    return bounds[0], bounds[1]
+
+
+def ppu95_factors(ylows, yups, sim_dates, obs_values, obs_dates):
+    # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray, List[float], List[datetime]) -> (float, float)
+    """P-factor and R-factor of the 95PPU band of a variable.
+
+    P-factor is the fraction of observations bracketed by the band, and R-factor is the mean
+      width of the band at the observed time steps divided by the standard deviation of the
+      observations. The observations are matched with the sorted `sim_dates` by binary search.
+    """
+    obs_values = numpy.asarray(obs_values, dtype=float)
+    if obs_values.size == 0 or len(sim_dates) == 0:
+        return 0., 0.
+    sim_dates = numpy.asarray(sim_dates, dtype='datetime64[s]')
+    obs_dates = numpy.array(obs_dates, dtype='datetime64[s]')
+    sidx = numpy.searchsorted(sim_dates, obs_dates)
+    sidx[sidx >= len(sim_dates)] = 0
+    matched = sim_dates[sidx] == obs_dates
+    sidx = sidx[matched]
+    bracketed = (ylows[sidx] <= obs_values[matched]) & (obs_values[matched] <= yups[sidx])
+    p = float(numpy.count_nonzero(bracketed)) / obs_values.size
+    if sidx.size == 0:
+        return p, 0.
+    r = float(numpy.mean(yups[sidx] - ylows[sidx]) / numpy.std(obs_values))
+    return p, r
+
+
 def calculate_95ppu(sim_obs_data, sim_data, outdir, gen_num,
                     vali_sim_obs_data=None, vali_sim_data=None,
                     plot_cfg=None  # type: Optional[PlotConfig]
@@ -128,11 +274,38 @@ def calculate_95ppu(sim_obs_data, sim_data, outdir, gen_num,
     plt.rcParams['mathtext.bf'] = 'STIXGeneral:italic:bold'
     if len(sim_data) < 2:
         return
-    var_name = sim_obs_data[0]['var_name']
+    # The matched observations are the same for all individuals, except the invalid ones
+    cali_ref = next((d for d in sim_obs_data if d.get('var_name')), sim_obs_data[0])
+    vali_ref = next((d for d in vali_sim_obs_data or list() if d.get('var_name')), None)
+    var_name = cali_ref['var_name']
+    has_validation = bool(vali_ref and vali_sim_data)
+    # Stack the simulation data of all individuals as (nind, ntime, nvars) arrays
+    cali_dates, cali_values = stack_timeseries([_as_timeseries(d) for d in sim_data])
+    if has_validation:
+        vali_dates, vali_values = stack_timeseries([_as_timeseries(d) for d in vali_sim_data])
+        # By default, the calibration period is before the validation period.
+        order = 0 if len(vali_dates) and len(cali_dates) and \
+                     vali_dates[-1] <= cali_dates[0] else 1
+        periods = [(cali_dates, cali_values), (vali_dates, vali_values)]
+        if not order:
+            periods.reverse()
+        nvars = min(cali_values.shape[2], vali_values.shape[2])
+        all_dates = numpy.concatenate([d for d, _ in periods])
+        all_values = numpy.concatenate([v[:, :, :nvars] for _, v in periods], axis=1)
+    else:
+        order = 1
+        all_dates, all_values = cali_dates, cali_values
+    # The 95PPU band of all variables at each time step
+    ylows_all, yups_all = ppu95_band(all_values)
+    cali_sim_dates = cali_dates.astype(datetime).tolist()
+    vali_sim_dates = vali_dates.astype(datetime).tolist() if has_validation else list()
+
     for idx, var in enumerate(var_name):
-        plot_validation = False
-        if vali_sim_obs_data and vali_sim_data and var in vali_sim_obs_data[0]['var_name']:
-            plot_validation = True
+        if idx >= all_values.shape[2]:
+            break
+        if var not in cali_ref:
+            continue
+        plot_validation = has_validation and var in vali_ref['var_name'] and var in vali_ref
         ylabel_str = var
         if var in ['Q', 'QI', 'QG', 'QS']:
             ylabel_str += ' (m$^3$/s)'
@@ -143,93 +316,35 @@ def calculate_95ppu(sim_obs_data, sim_data, outdir, gen_num,
                 ylabel_str += ' (mg/L)'
         elif 'SED' in var.upper():  # amount
             ylabel_str += ' (kg)'
-        cali_obs_dates = sim_obs_data[0][var]['UTCDATETIME'][:]
-        if is_string(cali_obs_dates[0]):
-            cali_obs_dates = [StringClass.get_datetime(s) for s in cali_obs_dates]
+        cali_obs_dates = _as_datetimes(cali_ref[var]['UTCDATETIME'])
         obs_dates = cali_obs_dates[:]
-        order = 1  # By default, the calibration period is before the validation period.
-        if plot_validation:
-            vali_obs_dates = vali_sim_obs_data[0][var]['UTCDATETIME']
-            if is_string(vali_obs_dates[0]):
-                vali_obs_dates = [StringClass.get_datetime(s) for s in vali_obs_dates]
-            if vali_obs_dates[-1] <= cali_obs_dates[0]:
-                order = 0
-                obs_dates = vali_obs_dates + obs_dates
-            else:
-                obs_dates += vali_obs_dates
-        obs_data = sim_obs_data[0][var]['Obs'][:]
+        obs_data = list(cali_ref[var]['Obs'])
         if plot_validation:
+            vali_obs_dates = _as_datetimes(vali_ref[var]['UTCDATETIME'])
             if order:
-                obs_data += vali_sim_obs_data[0][var]['Obs'][:]
+                obs_dates += vali_obs_dates
+                obs_data += list(vali_ref[var]['Obs'])
             else:
-                obs_data = vali_sim_obs_data[0][var]['Obs'][:] + obs_data
+                obs_dates = vali_obs_dates + obs_dates
+                obs_data = list(vali_ref[var]['Obs']) + obs_data
 
-        cali_sim_dates = list(sim_data[0].keys())
-        if is_string(cali_sim_dates[0]):
-            cali_sim_dates = [StringClass.get_datetime(s) for s in cali_sim_dates]
-        sim_dates = cali_sim_dates[:]
-        if plot_validation:
-            vali_sim_dates = list(vali_sim_data[0].keys())
-            if is_string(vali_sim_dates[0]):
-                vali_sim_dates = [StringClass.get_datetime(s) for s in vali_sim_dates]
-            if order:
-                sim_dates += vali_sim_dates
-            else:
-                sim_dates = vali_sim_dates + sim_dates
-        sim_data_list = list()
-        caliBestIdx = -1
-        caliBestNSE = -9999.
-        for idx2, ind in enumerate(sim_data):
-            tmp = numpy.array(list(ind.values()))
-            tmp = tmp[:, idx]
-            if sim_obs_data[idx2][var]['NSE'] > caliBestNSE:
-                caliBestNSE = sim_obs_data[idx2][var]['NSE']
-                caliBestIdx = idx2
-            tmpsim = tmp.tolist()
-            if plot_validation:
-                tmp_data = numpy.array(list(vali_sim_data[idx2].values()))[:, idx].tolist()
-                if order:
-                    tmpsim += tmp_data
-                else:
-                    tmpsim = tmp_data + tmpsim
-            sim_data_list.append(tmpsim)
-
-        sim_best = numpy.array(list(sim_data[caliBestIdx].values()))[:, idx]
-        sim_best = sim_best.tolist()
-        if plot_validation:
-            tmp_data = numpy.array(list(vali_sim_data[caliBestIdx].values()))[:, idx].tolist()
-            if order:
-                sim_best += tmp_data
-            else:
-                sim_best = tmp_data + sim_best
-        sim_data_list = numpy.array(sim_data_list)
-        ylows = numpy.percentile(sim_data_list, 2.5, 0, interpolation='nearest')
-        yups = numpy.percentile(sim_data_list, 97.5, 0, interpolation='nearest')
-
-        def calculate_95ppu_efficiency(obs_data_list, obs_dates_list, sim_dates_list):
-            # type: (...) -> (float, float)
-            count = 0
-            ylows_obs = list()
-            yups_obs = list()
-            for oi, ov in enumerate(obs_data_list):
-                try:
-                    si = sim_dates_list.index(obs_dates_list[oi])
-                    ylows_obs.append(ylows[si])
-                    yups_obs.append(yups[si])
-                    if ylows[si] <= ov <= yups[si]:
-                        count += 1
-                except Exception:
-                    continue
-            p = float(count) / len(obs_data_list)
-            ylows_obs = numpy.array(ylows_obs)
-            yups_obs = numpy.array(yups_obs)
-            r = numpy.mean(yups_obs - ylows_obs) / numpy.std(numpy.array(obs_data_list))
-            return p, r
+        # Time steps to be plotted, i.e., the calibration period if no validation of var
+        tsl = slice(None)
+        if has_validation and not plot_validation:
+            tsl = slice(0, len(cali_dates)) if order else slice(len(vali_dates), None)
+        plot_dates = all_dates[tsl]
+        sim_dates = plot_dates.astype(datetime).tolist()
+        ylows = ylows_all[tsl, idx]
+        yups = yups_all[tsl, idx]
+        # The best simulation is selected by NSE of the calibration period
+        nse_values = numpy.array([d[var]['NSE'] if var in d and 'NSE' in d[var] else -9999.
+                                  for d in sim_obs_data])
+        caliBestIdx = int(numpy.argmax(nse_values))
+        sim_best = all_values[caliBestIdx, tsl, idx].tolist()
 
         # concatenate text
-        p_value, r_value = calculate_95ppu_efficiency(sim_obs_data[0][var]['Obs'],
-                                                      cali_obs_dates,
-                                                      list(sim_data[0].keys()))
+        p_value, r_value = ppu95_factors(ylows, yups, plot_dates,
+                                         cali_ref[var]['Obs'], cali_obs_dates)
         txt = 'P-factor: %.2f\nR-factor: %.2f\n' % (p_value, r_value)
         txt += u'某一最优模拟\n' if plot_cfg.plot_cn else 'One best simulation:\n'
         txt += '    $\mathit{NSE}$: %.2f\n' \
@@ -242,9 +357,8 @@ def calculate_95ppu(sim_obs_data, sim_data, outdir, gen_num,
         # concatenate text of validation if needed
         vali_txt = ''
         if plot_validation:
-            p_value, r_value = calculate_95ppu_efficiency(vali_sim_obs_data[0][var]['Obs'],
-                                                          vali_obs_dates,
-                                                          list(vali_sim_data[0].keys()))
+            p_value, r_value = ppu95_factors(ylows, yups, plot_dates,
+                                             vali_ref[var]['Obs'], vali_obs_dates)
             vali_txt = 'P-factor: %.2f\nR-factor: %.2f\n\n' % (p_value, r_value)
             vali_txt += '    $\mathit{NSE}$: %.2f\n' \
                         '    $\mathit{RSR}$: %.2f\n' \
@@ -1,8 +1,9 @@
-"""Create a connection to MongoDB as a global module used in SCOOP-based parallel applications
+"""Access a MongoDB client as a global module used in SCOOP-based parallel applications
 
-    Note that, this is a temporary and not elegant solution.
-      Before running such applications such as scenarios_analysis/spatialunits/main_nsga2.py,
-      users MUST update the host and port manually.
+    The client is managed by `preprocess.db_mongodb.ConnectMongoDB`, i.e., it is created lazily
+      once for each process (and re-created after fork), and shared by all operations.
+      The host and port can be set by the environment variables SEIMS_MONGODB_HOST and
+      SEIMS_MONGODB_PORT, or by `set_server` before using `get_client`.
 
     References:
         Explicit access to module level variables by accessing them explicitly on the module.
@@ -12,19 +13,30 @@
 
     @changelog:
     - 20-07-21  lj - separated from preprocess.db_mongodb.py to make it more likely a global module
+    - 26-10-18  st - configurable host and port, lazy and fork-safe client.
 """
 from __future__ import absolute_import, unicode_literals
 
+import os
 import sys
 
-from preprocess.db_mongodb import ConnectMongoDB
+from preprocess.db_mongodb import MongoClient, ConnectMongoDB
 
 # this is a pointer to the module object instance itself
 this = sys.modules[__name__]
 
 # user specific parameters for their MongoDB server
-this.host = '127.0.0.1'
-this.port = 27017
+this.host = os.environ.get('SEIMS_MONGODB_HOST', '127.0.0.1')
+this.port = int(os.environ.get('SEIMS_MONGODB_PORT', 27017))
 
-# this client will be created once for each process in the entire application
-this.client = ConnectMongoDB(ip=this.host, port=this.port).get_conn()
+
+def set_server(host, port):
+    """Set the host and port of MongoDB server."""
+    this.host = host
+    this.port = int(port)
+
+
+def get_client():
+    # type: (...) -> MongoClient
+    """Get the MongoClient of the current process."""
+    return ConnectMongoDB(this.host, this.port).get_conn()
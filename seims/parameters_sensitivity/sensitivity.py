@@ -10,6 +10,8 @@
     - 18-02-09  - lj - compatible with Python3.
     - 18-07-04  - lj - support MPI version of SEIMS, and bugs fixed.
     - 18-08-24  - lj - Gather the execute time of all model runs.
+    - 26-10-18  - st - Execute models by the executor configured in [Computing_Resources].
+    - 26-10-18  - st - Write CALI_VALUES of all parameters in one bulk_write.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -48,9 +50,11 @@ from utility import read_data_items_from_txt
 from utility import save_png_eps
 from utility import SpecialJsonEncoder
 # import global_mongoclient as MongoDBObj
+from utility.executor import create_executor
 from run_seims import MainSEIMS
 from preprocess.text import DBTableNames
 from preprocess.db_mongodb import MongoClient, ConnectMongoDB
+from preprocess.db_read_model import invalidate_model_metadata, write_calibration_values
 from parameters_sensitivity.config import PSAConfig
 from parameters_sensitivity.figure import sample_histograms, empirical_cdf
 from run_seims import ParseSEIMSConfig, create_run_model
@@ -103,6 +107,9 @@ class Sensitivity(object):
                                                          {'$set': {'VALUE': stime_str}})
         db[DBTableNames.main_filein].find_one_and_update({'TAG': 'ENDTIME'},
                                                          {'$set': {'VALUE': etime_str}})
+        # The simulation period has been changed, re-read model metadata in the next query
+        invalidate_model_metadata(self.cfg.model.host, self.cfg.model.port, self.model.db_name,
+                                  self.model.metadata_file)
 
     def read_param_ranges(self):
         """Read param_rng.def file
@@ -207,7 +214,7 @@ class Sensitivity(object):
     def write_param_values_to_mongodb(self):
         """Update Parameters collection in MongoDB.
         Notes:
-            The field value of 'CALI_VALUES' of all parameters will be deleted first.
+            The field value of 'CALI_VALUES' of other parameters will be deleted.
         """
         if not self.param_defs:
             self.read_param_ranges()
@@ -215,12 +222,8 @@ class Sensitivity(object):
             self.generate_samples()
         # conn = MongoDBObj.client  # type: MongoClient
         conn = ConnectMongoDB(self.cfg.model.host, self.cfg.model.port).get_conn()
-        db = conn[self.model.db_name]
-        collection = db['PARAMETERS']
-        collection.update_many({}, {'$unset': {'CALI_VALUES': ''}})
-        for idx, pname in enumerate(self.param_defs['names']):
-            v2str = ','.join(str(v) for v in self.param_values[:, idx])
-            collection.find_one_and_update({'NAME': pname}, {'$set': {'CALI_VALUES': v2str}})
+        write_calibration_values(conn, self.model.db_name, self.param_defs['names'],
+                                 self.param_values)
 
     def evaluate_models(self):
         """Run SEIMS for objective output variables, and write out.
@@ -233,6 +236,9 @@ class Sensitivity(object):
 
         # model configurations
         model_cfg_dict = self.model.ConfigDict
+        # Read model metadata from MongoDB once, which will be shared by all models of
+        #   the current process, and other processes if `metadata_file` is specified.
+        MainSEIMS(args_dict=model_cfg_dict).ReadMongoDBData()
         # model_cfg_dict.setdefault('do_execute', True)  # By default, the model will be executed
 
         # Parameters to be evaluated
@@ -266,6 +272,10 @@ class Sensitivity(object):
             split_seqs = numpy.array_split(numpy.arange(self.run_count), task_num + 1)
             split_seqs = [a.tolist() for a in split_seqs]
 
+        # Executor of model runs, e.g., SCOOP, process pool, or Slurm job
+        executor = create_executor(self.cfg.resource, ncores_pertask=arg_c * self.model.nprocess,
+                                   scripts_dir=self.cfg.outfiles.psa_scripts_dir,
+                                   log_dir=self.cfg.outfiles.psa_logs_dir)
         # Loop partitioned tasks
         run_model_stime = time.time()
         exec_times = list()  # execute time of all model runs
@@ -279,60 +289,22 @@ class Sensitivity(object):
                 tmpcfg['calibration_id'] = caliid
                 model_cfg_dict_list.append(tmpcfg)
 
-            if self.cfg.resource.workload.lower() == 'slurm' or \
-                self.cfg.resource.workload.lower() == 'bash':
-                from utility.slurmpy import Slurm
-                output_models = list()
-                model_cmd_list = list()
-                for ii_model_cfg in model_cfg_dict_list:
-                    output_models.append(create_run_model(ii_model_cfg, do_execute=False))
-                for ii_model in output_models:
-                    model_cmd_list.append(ii_model.CommandString)
-
-                slurmjob = Slurm('sensitivity_%d' % idx,  # Job name
-                                 {
-                                     'W': '',  # -W, --wait. Do not exit until all jobs terminate
-                                     'partition': self.cfg.resource.partition,
-                                     'N': arg_N,  # -N, --nodes. Request N nodes to the job
-                                 },
-                                 scripts_dir=self.cfg.outfiles.psa_scripts_dir,
-                                 log_dir=self.cfg.outfiles.psa_logs_dir,
-                                 bash_strict=False if self.cfg.resource.workload.lower() == 'slurm'
-                                 else True)
-                slurmjob.run('%s &\nwait' % ' &\n'.join(model_cmd_list)
-                             if self.cfg.resource.workload.lower() == 'slurm'
-                             else '%s\nwait' % '\n'.join(model_cmd_list),
-                             _cmd='sbatch' if self.cfg.resource.workload.lower() == 'slurm'
-                             else 'bash',
-                             name_addition='psa')
-                print('Slurm job index %d done!' % idx)
-
-                # Postprocess the models that executed by Slurm job
-                for iii in range(len(output_models)):
-                    output_models[iii].executed = True
-                    output_models[iii].ParseTimespan()
-            elif self.cfg.resource.workload.lower() == 'cmd' and (
-                self.model.workload.lower() == 'mpi' or self.model.workload == ''):
-                # For function testing on Windows
+            if self.cfg.resource.workload.lower() in ['slurm', 'bash', 'cmd']:
+                # Execute the commands of models by Slurm job, bash, or sequentially (cmd)
                 output_models = list()
-                model_cmd_list = list()
                 for ii_model_cfg in model_cfg_dict_list:
                     output_models.append(create_run_model(ii_model_cfg, do_execute=False))
-                for ii_model in output_models:
-                    model_cmd_list.append(ii_model.CommandString)
-                # Run model sequentially
+                executor.run_commands([ii_model.CommandString for ii_model in output_models],
+                                      name='sensitivity_%d' % idx)
+                print('%s job index %d done!' % (executor.name, idx))
+
+                # Postprocess the models that executed by commands
                 for iii in range(len(output_models)):
-                    UtilClass.run_command(model_cmd_list[iii])
                     output_models[iii].executed = True
                     output_models[iii].ParseTimespan()
-            else:
-                try:  # parallel on multiprocessor or clusters using SCOOP
-                    from scoop import futures
-                    output_models = list(futures.map(create_run_model,
-                                                     model_cfg_dict_list))  # type: List[MainSEIMS]
-                except ImportError or ImportWarning:  # serial
-                    output_models = list(map(create_run_model,
-                                             model_cfg_dict_list))  # type: List[MainSEIMS]
+            else:  # SCOOP, process pool, or serial
+                output_models = executor.map(create_run_model,
+                                             model_cfg_dict_list)  # type: List[MainSEIMS]
             time.sleep(0.1)  # Wait a moment in case of unpredictable file system error
             # Read observation data from MongoDB only once
             if len(output_models) < 1:  # Although this is not gonna happen, just for insurance.
@@ -345,7 +317,6 @@ class Sensitivity(object):
             if (len(obs_vars)) < 1:  # Make sure the observation data exists.
                 continue
             # Loop the executed models
-            eva_values = list()
             for imod, mod_obj in enumerate(output_models):
                 mod_obj.SetMongoClient()
                 # Read executable timespan of each model run
@@ -355,12 +326,27 @@ class Sensitivity(object):
                     mod_obj.SetOutletObservations(obs_vars, obs_data_dict)
                 # Read simulation
                 mod_obj.ReadTimeseriesSimulations(self.cfg.psa_stime, self.cfg.psa_etime)
-                # Calculate NSE, R2, RMSE, PBIAS, RSR, ln(NSE), NSE1, and NSE3
-                self.objnames, obj_values = mod_obj.CalcTimeseriesStatistics(mod_obj.sim_obs_dict)
-                eva_values.append(obj_values)
                 # delete model output directory and GridFS files for saving storage
                 mod_obj.clean()
                 mod_obj.UnsetMongoClient()
+            if output_models[0].defer_gridfs_cleanup:
+                output_models[0].CleanOutputGridFsBatch([(mod_obj.scenario_id,
+                                                          mod_obj.calibration_id)
+                                                         for mod_obj in output_models],
+                                                        background=True)
+            # Calculate NSE, R2, RMSE, PBIAS, RSR, ln(NSE), NSE1, and NSE3 of all models at once
+            eva_values = list()
+            stat_stime = time.time()
+            for objnames, obj_values in MainSEIMS.CalcTimeseriesStatisticsBatch(
+                [mod_obj.sim_obs_dict for mod_obj in output_models]):
+                if objnames is not None:
+                    self.objnames = objnames
+                eva_values.append(obj_values)
+            # The time of batch statistics is shared by all models equally
+            stat_time = (time.time() - stat_stime) / len(output_models)
+            for mod_obj in output_models:
+                mod_obj.phases['statistics'] = stat_time
+                mod_obj.RecordTelemetry(tag='sensitivity')
             if not isinstance(eva_values, numpy.ndarray):
                 eva_values = numpy.array(eva_values)
             numpy.savetxt(cur_out_file, eva_values, delimiter=str(' '), fmt=str('%.4f'))
@@ -368,6 +354,7 @@ class Sensitivity(object):
             cur_model_out_file = '%s/models_%d.pickle' % (self.cfg.outfiles.output_values_dir, idx)
             with open(cur_model_out_file, 'wb') as f:
                 pickle.dump(output_models, f)
+        executor.shutdown()
         exec_times = numpy.array(exec_times)
         numpy.savetxt('%s/exec_time_allmodelruns.txt' % self.cfg.psa_outpath,
                       exec_times, delimiter=str(' '), fmt=str('%.4f'))
@@ -7,36 +7,60 @@
     - 17-06-27  - lj - reorganize as basic class other than Global variables
     - 18-02-08  - lj - compatible with Python3.
     - 20-07-20  - lj - no need to invoke close() of MongoClient after use
+    - 26-10-18  - st - Fork-safe MongoClient shared by each process instead of singleton.
 """
 from __future__ import absolute_import, unicode_literals
 
+import json
 import os
 import sys
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
+from typing import Dict, Tuple, Optional, AnyStr
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, InvalidOperation
 from preprocess.text import DBTableNames, ModelParamFields
 
 
-def singleton(cls):
-    instances = dict()
+# Default options of MongoClient, which can be updated by `configure_mongodb_client` or
+#   the environment variable SEIMS_MONGODB_OPTIONS (JSON string, inherited by SCOOP workers).
+#   maxIdleTimeMS is set to close the idle connections in the pool of each process.
+MONGODB_CLIENT_OPTIONS = {'maxPoolSize': 100, 'maxIdleTimeMS': 60000}
+if os.environ.get('SEIMS_MONGODB_OPTIONS'):
+    MONGODB_CLIENT_OPTIONS.update(json.loads(os.environ.get('SEIMS_MONGODB_OPTIONS')))
 
-    def wrapper(*args, **kwargs):
-        if cls not in instances:
-            instances[cls] = cls(*args, **kwargs)
-        return instances[cls]
+# MongoClient of each server in the current process, the key is (ip, port),
+#   the value is (pid, MongoClient).
+_MONGODB_CLIENTS = dict()  # type: Dict[Tuple[AnyStr, int], Tuple[int, MongoClient]]
 
-    return wrapper
+
+def configure_mongodb_client(**options):
+    """Update the default options of MongoClient, e.g., maxPoolSize, connectTimeoutMS.
+
+    The clients that have been created are not affected, use `reset_mongodb_clients` if needed.
+    """
+    MONGODB_CLIENT_OPTIONS.update(options)
+
+
+def reset_mongodb_clients():
+    """Close and forget all MongoClient objects created by the current process."""
+    for key in list(_MONGODB_CLIENTS.keys()):
+        pid, client = _MONGODB_CLIENTS.pop(key)
+        if pid == os.getpid():
+            client.close()
 
 
-@singleton
 class ConnectMongoDB(object):
-    """Connect to MongoDB, and close when finished."""
-    client = None
+    """Connection manager of MongoDB.
+
+    One pooled MongoClient is created lazily for each (ip, port) in each process and reused
+      by all `ConnectMongoDB` objects. Since MongoClient is not fork-safe, a new client will be
+      created when it is requested in a forked process, e.g., workers of SCOOP or multiprocessing.
+    """
 
     def __init__(self, ip, port, maxPoolSize=None):
+        # type: (AnyStr, int, Optional[int]) -> None
         """initial mongodb client by hostname and port.
 
         Starting with version 3.0 the MongoClient constructor no longer blocks while connecting to
@@ -46,12 +70,28 @@ class ConnectMongoDB(object):
           background threads.
         --https://api.mongodb.com/python/current/api/pymongo/mongo_client.html
         """
-        self.conn = MongoClient(ip, port, maxPoolSize=maxPoolSize)
+        self.ip = ip
+        self.port = int(port)
+        self.maxPoolSize = maxPoolSize
+
+    @property
+    def conn(self):  # type: (...) -> MongoClient
+        key = (self.ip, self.port)
+        pid = os.getpid()
+        if key in _MONGODB_CLIENTS and _MONGODB_CLIENTS[key][0] == pid:
+            return _MONGODB_CLIENTS[key][1]
+        # Do not close the client inherited from the parent process, just discard it.
+        options = dict(MONGODB_CLIENT_OPTIONS)
+        if self.maxPoolSize is not None:
+            options['maxPoolSize'] = self.maxPoolSize
+        client = MongoClient(self.ip, self.port, **options)
         try:
-            self.conn.admin.command('ismaster')
+            client.admin.command('ismaster')
         except ConnectionFailure as err:
             sys.stderr.write('Could not connect to MongoDB: %s' % err)
             sys.exit(1)
+        _MONGODB_CLIENTS[key] = (pid, client)
+        return client
 
     def get_conn(self):  # type: (...) -> MongoClient
         """get MongoDB connection."""
@@ -64,9 +104,8 @@ class ConnectMongoDB(object):
         It is a common mistake to create a new client for each request, which is very inefficient.
         --https://stackoverflow.com/questions/41015490/how-can-i-force-pymongo-to-close-sockets
 
-        So, for now, I will comment the close operation. By lj.
+        So, the shared client will not be closed here, see `reset_mongodb_clients`.
         """
-        # self.conn.close()
         pass
 
 
@@ -6,10 +6,15 @@
     - 18-01-02  - lj - separated from plot_timeseries.
     - 18-02-09  - lj - compatible with Python3.
     - 20-07-20  - lj - take MongoClient object as argument of ReadModelData class.
+    - 26-10-18  - st - Process-level snapshot of model metadata.
+    - 26-10-18  - st - Bulk cleanup of OUTPUT GridFS files by indexed metadata.
+    - 26-10-18  - st - Write calibrated parameter values of all parameters in one bulk_write.
 """
 from __future__ import absolute_import, unicode_literals
 from future.utils import viewitems
 
+from io import open
+import json
 import os
 import sys
 from datetime import datetime
@@ -19,11 +24,13 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
 from gridfs import GridFS
+import numpy
+from pymongo import ASCENDING, UpdateMany, UpdateOne
 from pygeoc.utils import StringClass, is_string
-from typing import Dict, List, Tuple, Union, AnyStr, Optional
-from preprocess.db_mongodb import MongoClient, MongoQuery
+from typing import Dict, List, Tuple, Union, AnyStr, Optional, Any
+from preprocess.db_mongodb import MongoClient, MongoQuery, MongoUtil
 from preprocess.text import DBTableNames, ModelCfgFields, FieldNames, SubbsnStatsName, \
-    DataValueFields, DataType, StationFields
+    DataValueFields, DataType, StationFields, ModelParamFields
 
 
 class ReadModelData(object):
@@ -288,28 +295,60 @@ class ReadModelData(object):
                                                                    end_time.strftime('%c')))
         return vars_existed, data_dict
 
+    def EnsureOutputGridFsIndexes(self):
+        """Create index of scenario ID and calibration ID on OUTPUT GridFS files, once per process.
+
+        The metadata fields `SCENARIO_ID` and `CALIBRATION_ID` are written by SEIMS.
+        """
+        key = (id(self.maindb.client), self.maindb.name)
+        if key in _INDEXED_OUTPUT_GRIDFS:
+            return
+        self.maindb['%s.files' % DBTableNames.gridfs_output].create_index(
+            [('metadata.SCENARIO_ID', ASCENDING), ('metadata.CALIBRATION_ID', ASCENDING)])
+        _INDEXED_OUTPUT_GRIDFS.add(key)
+
     def CleanOutputGridFs(self, scenario_id=-1, calibration_id=-1):
-        # type: (int, int) -> None
+        # type: (int, int) -> int
         """Delete Output GridFS files in OUTPUT collection."""
-        self.OutputItems()
-        if self._output_items is None:  # No outputs
-            return
-        output_gfs = GridFS(self.maindb, DBTableNames.gridfs_output)
-        for corename, types in viewitems(self._output_items):
-            if types is None:
-                continue
-            # The format of filename of OUTPUT by SEIMS MPI version is:
-            #   <SubbasinID>_CoreFileName_ScenarioID_CalibrationID
-            #   If no ScenarioID or CalibrationID, i.e., with a value of -1, just left blank.
-            #  e.g.,
-            #    - 1_SED_OL_SUM_1_ means ScenarioID is 1 and Calibration ID is -1
-            #    - 1_SED_OL_SUM__ means ScenarioID is -1 and Calibration ID is -1
-            #    - 1_SED_OL_SUM_0_2 means ScenarioID is 0 and Calibration ID is 2
-            regex_str = '(|\\d+_)%s(|_\\S+)' % corename
-            regex_str += '_' if scenario_id < 0 else '_%d' % scenario_id
-            regex_str += '_' if calibration_id < 0 else '_%d' % calibration_id
-            for i in output_gfs.find({'filename': {'$regex': regex_str}}):
-                output_gfs.delete(i._id)
+        return self.CleanOutputGridFsBatch([(scenario_id, calibration_id)])
+
+    def CleanOutputGridFsBatch(self, ids):
+        # type: (List[Tuple[int, int]]) -> int
+        """Delete Output GridFS files of several models, i.e., (ScenarioID, CalibrationID) pairs,
+        by set-based operations. Returns the count of deleted files.
+
+        The files are queried by the indexed metadata fields, and files without metadata are
+          matched by their filenames. The format of filename of OUTPUT by SEIMS MPI version is:
+          <SubbasinID>_CoreFileName_ScenarioID_CalibrationID
+          If no ScenarioID or CalibrationID, i.e., with a value of -1, just left blank.
+          e.g.,
+            - 1_SED_OL_SUM_1_ means ScenarioID is 1 and Calibration ID is -1
+            - 1_SED_OL_SUM__ means ScenarioID is -1 and Calibration ID is -1
+            - 1_SED_OL_SUM_0_2 means ScenarioID is 0 and Calibration ID is 2
+        """
+        if not ids:
+            return 0
+        self.EnsureOutputGridFsIndexes()
+        cali_ids = OrderedDict()  # type: Dict[int, List[int]]
+        suffixes = list()
+        for sce_id, cali_id in ids:
+            cali_ids.setdefault(sce_id, list())
+            if cali_id not in cali_ids[sce_id]:
+                cali_ids[sce_id].append(cali_id)
+            suffixes.append('%s_%s' % ('' if sce_id < 0 else '%d' % sce_id,
+                                       '' if cali_id < 0 else '%d' % cali_id))
+        conds = [{'metadata.SCENARIO_ID': sce_id, 'metadata.CALIBRATION_ID': {'$in': cids}}
+                 for sce_id, cids in viewitems(cali_ids)]
+        conds.append({'metadata.SCENARIO_ID': None,
+                      'filename': {'$regex': '_(%s)$' % '|'.join(set(suffixes))}})
+        files = self.maindb['%s.files' % DBTableNames.gridfs_output]
+        chunks = self.maindb['%s.chunks' % DBTableNames.gridfs_output]
+        file_ids = [doc['_id'] for doc in files.find({'$or': conds}, {'_id': 1})]
+        if not file_ids:
+            return 0
+        files.delete_many({'_id': {'$in': file_ids}})
+        chunks.delete_many({'files_id': {'$in': file_ids}})
+        return len(file_ids)
 
     def CleanSpatialGridFs(self, scenario_id):
         # type: (int) -> None
@@ -333,6 +372,133 @@ class ReadModelData(object):
             print('Delete scenario: %d in MongoDB completed!' % _id)
 
 
+# OUTPUT GridFS that has been indexed in the current process, i.e., (id of MongoClient, dbname)
+_INDEXED_OUTPUT_GRIDFS = set()
+
+# Process-level snapshots of model metadata, the key is (host, port, dbname).
+#   The metadata will not change during calibration, sensitivity analysis, or scenario analysis,
+#   thus it can be shared by all `MainSEIMS` objects instead of querying MongoDB every time.
+_MODEL_METADATA = dict()  # type: Dict[Tuple[AnyStr, int, AnyStr], Dict[AnyStr, Any]]
+TIME_FMT = '%Y-%m-%d %H:%M:%S'
+
+
+def read_model_metadata(read_model):
+    # type: (ReadModelData) -> Dict[AnyStr, Any]
+    """Read the model metadata used by `MainSEIMS` from MongoDB."""
+    output_ids, output_items = read_model.OutputItems()
+    return {'OutletID': read_model.OutletID,
+            'SubbasinCount': read_model.SubbasinCount,
+            'ScenarioDBName': read_model.ScenarioDBName,
+            'SimulationPeriod': list(read_model.SimulationPeriod),
+            'OutputIDs': output_ids,
+            'OutputItems': output_items}
+
+
+def _save_metadata_snapshot(snapshot_file, host, port, dbname, metadata):
+    # type: (AnyStr, AnyStr, int, AnyStr, Dict[AnyStr, Any]) -> None
+    data = dict(metadata)
+    data['SimulationPeriod'] = [t.strftime(TIME_FMT) for t in metadata['SimulationPeriod']]
+    data.update({'host': host, 'port': port, 'db_name': dbname})
+    tmpfile = '%s.%d.tmp' % (snapshot_file, os.getpid())
+    try:
+        with open(tmpfile, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, indent=2, ensure_ascii=False))
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+        os.rename(tmpfile, snapshot_file)
+    except (IOError, OSError) as err:
+        print('Warning: Save model metadata snapshot failed! %s' % str(err))
+
+
+def _load_metadata_snapshot(snapshot_file, host, port, dbname):
+    # type: (AnyStr, AnyStr, int, AnyStr) -> Optional[Dict[AnyStr, Any]]
+    if not snapshot_file or not os.path.isfile(snapshot_file):
+        return None
+    try:
+        with open(snapshot_file, 'r', encoding='utf-8') as f:
+            data = json.loads(f.read())
+        if data.pop('host') != host or data.pop('port') != port or data.pop('db_name') != dbname:
+            return None  # Snapshot of other database
+        data['SimulationPeriod'] = [datetime.strptime(t, TIME_FMT)
+                                    for t in data['SimulationPeriod']]
+        return data
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def get_model_metadata(host, port, dbname, snapshot_file=None):
+    # type: (AnyStr, int, AnyStr, Optional[AnyStr]) -> Optional[Dict[AnyStr, Any]]
+    """Get the model metadata from the process-level snapshot, or the snapshot file if given.
+
+    Returns:
+        Metadata dict, or None if not cached yet.
+    """
+    key = (host, port, dbname)
+    if key not in _MODEL_METADATA:
+        metadata = _load_metadata_snapshot(snapshot_file, host, port, dbname)
+        if metadata is None:
+            return None
+        _MODEL_METADATA[key] = metadata
+    return _MODEL_METADATA[key]
+
+
+def set_model_metadata(host, port, dbname, metadata, snapshot_file=None):
+    # type: (AnyStr, int, AnyStr, Dict[AnyStr, Any], Optional[AnyStr]) -> None
+    """Set (or update) the process-level snapshot, and save to the snapshot file if given."""
+    key = (host, port, dbname)
+    if key in _MODEL_METADATA:
+        _MODEL_METADATA[key].update(metadata)
+    else:
+        _MODEL_METADATA[key] = dict(metadata)
+    if snapshot_file:
+        _save_metadata_snapshot(snapshot_file, host, port, dbname, _MODEL_METADATA[key])
+
+
+def invalidate_model_metadata(host=None, port=None, dbname=None, snapshot_file=None):
+    # type: (Optional[AnyStr], Optional[int], Optional[AnyStr], Optional[AnyStr]) -> None
+    """Invalidate the snapshots matching the given arguments (None matches all).
+    The snapshot file will be deleted if given."""
+    for key in list(_MODEL_METADATA.keys()):
+        if (host is None or key[0] == host) and (port is None or key[1] == port) and \
+            (dbname is None or key[2] == dbname):
+            del _MODEL_METADATA[key]
+    if snapshot_file and os.path.isfile(snapshot_file):
+        os.remove(snapshot_file)
+
+
+def write_calibration_values(conn, dbname, param_names, param_values, unset_previous=True):
+    # type: (MongoClient, AnyStr, List[AnyStr], Union[numpy.ndarray, List[List[float]]], bool) -> None
+    """Write calibrated values of parameters to the PARAMETERS collection in one bulk_write.
+
+    The model reads CALI_VALUES as a comma-separated string indexed by calibration ID,
+      i.e., `param_values[calibration_id][param_idx]`, so the values of each parameter are
+      formatted by the shortest representation that round-trips, e.g., 0.1 rather than
+      0.10000000000000001.
+
+    Args:
+        conn: `MongoClient` instance
+        dbname: Main spatial database name
+        param_names: Parameter names
+        param_values: 2D array of shape (number of calibration IDs, number of parameters)
+        unset_previous: Unset CALI_VALUES of other parameters, which should be False if other
+                        models are running, e.g., steady-state NSGA-II, in which case the
+                        values of the running calibration IDs must not be changed.
+    """
+    param_values = numpy.asarray(param_values, dtype=float)
+    if param_values.ndim != 2 or param_values.shape[1] != len(param_names):
+        raise ValueError('The shape of param_values %s does not match %d parameters!' %
+                         (repr(param_values.shape), len(param_names)))
+    requests = list()
+    if unset_previous:
+        # Parameters to be written are excluded, so that CALI_VALUES are always available.
+        requests.append(UpdateMany({ModelParamFields.name: {'$nin': list(param_names)}},
+                                   {'$unset': {'CALI_VALUES': ''}}))
+    for pname, values in zip(param_names, param_values.T.tolist()):
+        requests.append(UpdateOne({ModelParamFields.name: pname},
+                                  {'$set': {'CALI_VALUES': ','.join(map(repr, values))}}))
+    MongoUtil.run_bulk_write(conn[dbname][DBTableNames.main_parameter], requests)
+
+
 def main():
     """Functional tests."""
     import datetime
@@ -8,9 +8,9 @@ Configure and run SEIMS model.
       model.ReadOutletObservations()
       model.UnsetMongoClient()
 
-      These functions are: `run()`, `clean()`, `ResetSimulationPeriod()`, `ResetOutputsPeriod()`,
-                           `ReadMongoDBData()`, `ReadTimeseriesSimulations()`,
-                           `ReadOutletObservations()`.
+      These functions are: `run()`, `prepare_run()`, `clean()`, `ResetSimulationPeriod()`,
+                           `ResetOutputsPeriod()`, `ReadMongoDBData()`,
+                           `ReadTimeseriesSimulations()`, `ReadOutletObservations()`.
 
     @author   : Liangjun Zhu
 
@@ -26,12 +26,20 @@ Configure and run SEIMS model.
     - 2020-08-11 - lj - Separate actually execution from run() and add CommandString property.
     - 2020-09-22 - lj - Add workload (slurm, mpi, etc.) mode. Functions improved.
     - 2023-05-22 - lj - Add cfg_name and fdir_mtd arguments.
+    - 2026-10-18 - st - Record Python-side phases and telemetry of model runs.
+    - 2026-10-18 - st - Add scratch output root with automatic cleanup.
+    - 2026-10-18 - st - Bulk and deferred cleanup of OUTPUT GridFS files.
+    - 2026-10-18 - st - Add bounded retries of failed model runs.
+    - 2026-10-18 - st - Optionally reference shared observations rather than copying.
+    - 2026-10-18 - st - Execute the model with timeout in the current process.
+    - 2026-10-18 - st - Add runtime ratio limit of model runs for early termination.
 """
 from __future__ import absolute_import, unicode_literals
 
+import atexit
 import bisect
+from contextlib import contextmanager
 from copy import deepcopy
-from collections import OrderedDict
 from configparser import ConfigParser
 from datetime import datetime
 from io import open
@@ -39,8 +47,11 @@ import math
 import os
 import sys
 from shutil import rmtree
+import subprocess
+import tempfile
+import threading
 import time
-from typing import Optional, Union, Dict, List, AnyStr
+from typing import Optional, Union, Dict, List, Tuple, AnyStr
 from subprocess import CalledProcessError
 
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
@@ -53,9 +64,12 @@ from pygeoc.utils import UtilClass, FileClass, StringClass, \
 
 from preprocess.text import DBTableNames
 from preprocess.db_mongodb import MongoClient, ConnectMongoDB
-from preprocess.db_read_model import ReadModelData
-from utility import read_simulation_from_txt, get_option_value, parse_datetime_from_ini
-from utility import match_simulation_observation, calculate_statistics
+from preprocess.db_read_model import ReadModelData, read_model_metadata
+from preprocess.db_read_model import get_model_metadata, set_model_metadata
+from utility import read_simulation_columns_from_txt, get_option_value, parse_datetime_from_ini
+from utility import match_simulation_observation, calculate_statistics, TimeseriesArray
+from utility import calculate_statistics_batch
+from utility import RunTelemetry
 
 
 class ParseSEIMSConfig(object):
@@ -89,6 +103,17 @@ class ParseSEIMSConfig(object):
         out_stime (datetime): Start time of output data (UTCTIME)
         out_etime (datetime): End time of output data (UTCTIME)
         workload (str): Use workload manager to run multiple models simultaneously, e.g., Slurm
+        metadata_file (str): (Optional) JSON file to share the model metadata read from MongoDB
+                             among processes, e.g., workers of SCOOP
+        telemetry_db (str): (Optional) SQLite database file to record the telemetry of model runs
+        scratch_root (str): (Optional) Root directory of model outputs instead of MODEL_DIR,
+                            e.g., /dev/shm or node-local disk. The outputs in scratch root are
+                            temporary, i.e., removed by `clean()` or at exit of the process
+        keep_parsed_only (bool): Remove the output files once they are parsed by
+                                 `ReadTimeseriesSimulations()`, default is False
+        defer_gridfs_cleanup (bool): Skip the cleanup of OUTPUT GridFS files in `clean()`,
+                                     which should be done by `CleanOutputGridFsBatch()` for
+                                     a batch of models later, default is False
         config_dict (dict): Dict of all configurations
         runtime (float): Running time counted by `time.time()` of Python,
                            in case of `GetTimespan()` failed
@@ -120,6 +145,11 @@ class ParseSEIMSConfig(object):
         self.out_stime = None  # type: Optional[datetime]
         self.out_etime = None  # type: Optional[datetime]
         self.workload = ''  # type: AnyStr
+        self.metadata_file = ''  # type: AnyStr
+        self.telemetry_db = ''  # type: AnyStr
+        self.scratch_root = ''  # type: AnyStr
+        self.keep_parsed_only = False  # type: bool
+        self.defer_gridfs_cleanup = False  # type: bool
 
         self.config_dict = dict()  # type: Dict[AnyStr, Optional[AnyStr, datetime, int, float]]
         self.runtime = 0.  # type: float
@@ -191,6 +221,21 @@ class ParseSEIMSConfig(object):
             raise ValueError('Wrong output time settings in [%s]!' % sec_name)
 
         self.workload = get_option_value(cf, sec_name, 'workload')
+        self.metadata_file = get_option_value(cf, sec_name, ['metadata_file', 'metadatafile'])
+        if self.metadata_file and not os.path.isabs(self.metadata_file):
+            self.metadata_file = self.model_dir + os.sep + self.metadata_file
+        self.telemetry_db = get_option_value(cf, sec_name, ['telemetry_db', 'telemetrydb'])
+        if self.telemetry_db and not os.path.isabs(self.telemetry_db):
+            self.telemetry_db = self.model_dir + os.sep + self.telemetry_db
+        self.scratch_root = get_option_value(cf, sec_name, ['scratch_root', 'scratchroot'])
+        if self.scratch_root:
+            self.scratch_root = os.path.abspath(os.path.expandvars(self.scratch_root))
+        self.keep_parsed_only = get_option_value(cf, sec_name,
+                                                 ['keep_parsed_only', 'keepparsedonly'],
+                                                 bool, False)
+        self.defer_gridfs_cleanup = get_option_value(cf, sec_name,
+                                                     ['defer_gridfs_cleanup',
+                                                      'defergridfscleanup'], bool, False)
 
     @property
     def ConfigDict(self):  # type: () -> Dict[AnyStr, Optional[AnyStr, datetime, int, float]]
@@ -209,12 +254,72 @@ class ParseSEIMSConfig(object):
                                 'subbasin_id': self.subbasin_id,
                                 'simu_stime': self.simu_stime, 'simu_etime': self.simu_etime,
                                 'out_stime': self.out_stime, 'out_etime': self.out_etime,
-                                'workload': self.workload
+                                'workload': self.workload,
+                                'metadata_file': self.metadata_file,
+                                'telemetry_db': self.telemetry_db,
+                                'scratch_root': self.scratch_root,
+                                'keep_parsed_only': self.keep_parsed_only,
+                                'defer_gridfs_cleanup': self.defer_gridfs_cleanup
                                 }
         print(self.config_dict)
         return self.config_dict
 
 
+# Output directories created in scratch root by processes, i.e., {output_dir: pid}
+_SCRATCH_OUTPUT_DIRS = dict()  # type: Dict[AnyStr, int]
+
+
+def remove_output_dir(output_dir):
+    # type: (AnyStr) -> None
+    """Remove the output directory of model and unregister it from scratch outputs."""
+    rmtree(output_dir, ignore_errors=True)
+    _SCRATCH_OUTPUT_DIRS.pop(output_dir, None)
+
+
+@atexit.register
+def _remove_scratch_outputs():
+    """Remove the remaining scratch outputs created by the current process at exit."""
+    pid = os.getpid()
+    for output_dir, creator in list(_SCRATCH_OUTPUT_DIRS.items()):
+        if creator == pid:
+            remove_output_dir(output_dir)
+
+
+class RuntimeRatioLimit(object):
+    """Runtime limit of model runs, i.e., `ratio` times of the median runtime of the
+    successfully finished runs (at least `min_samples` runs are required), which can be used
+    as `max_runtime` of `MainSEIMS.run()` to terminate the stragglers.
+
+    Only the runtime is limited: the outputs of SEIMS are written when the simulation
+      finished, so whether a running model would be dominated cannot be known. Runs of the
+      same model configuration have similar runtime, and the ones lasting much longer (e.g.,
+      unrealistic parameters resulting in numerical problems) are usually poor, but a slow
+      run with good objectives is terminated as well.
+    """
+
+    def __init__(self, ratio=3., min_samples=3, min_runtime=0.):
+        # type: (float, int, float) -> None
+        self.ratio = ratio
+        self.min_samples = min_samples
+        self.min_runtime = min_runtime  # never terminate runs shorter than this
+        self.runtimes = list()  # type: List[float]
+
+    @property
+    def limit(self):
+        # type: (...) -> Optional[float]
+        if len(self.runtimes) < max(1, self.min_samples):
+            return None
+        rts = sorted(self.runtimes)
+        mid = len(rts) // 2
+        median = rts[mid] if len(rts) % 2 else (rts[mid - 1] + rts[mid]) / 2.
+        return max(self.min_runtime, self.ratio * median)
+
+    def add(self, runtime):
+        # type: (float) -> None
+        """Add the runtime of a successfully finished run."""
+        self.runtimes.append(runtime)
+
+
 class MainSEIMS(object):
     """Main entrance to SEIMS model."""
     def __init__(self,
@@ -243,7 +348,12 @@ class MainSEIMS(object):
                  simu_etime=None,  # type: Optional[datetime, AnyStr] # End time of simulation
                  out_stime=None,  # type: Optional[datetime, AnyStr] # Start time of outputs
                  out_etime=None,  # type: Optional[datetime, AnyStr] # End time of outputs
-                 workload=''  # type: AnyStr # Type of workload manager
+                 workload='',  # type: AnyStr # Type of workload manager
+                 metadata_file='',  # type: AnyStr # JSON file of model metadata shared by processes
+                 telemetry_db='',  # type: AnyStr # SQLite database to record telemetry of runs
+                 scratch_root='',  # type: AnyStr # Root directory of temporary outputs
+                 keep_parsed_only=False,  # type: bool # Remove output files once parsed
+                 defer_gridfs_cleanup=False  # type: bool # Clean OUTPUT GridFS in batch later
                  ):
         # type: (...) -> None
         #  Derived from input arguments
@@ -301,6 +411,16 @@ class MainSEIMS(object):
             self.out_etime = StringClass.get_datetime(self.out_etime)
 
         self.workload = args_dict['workload'] if 'workload' in args_dict else workload  # type: AnyStr
+        self.metadata_file = args_dict['metadata_file'] if 'metadata_file' in args_dict \
+            else metadata_file  # type: AnyStr
+        self.telemetry_db = args_dict['telemetry_db'] if 'telemetry_db' in args_dict \
+            else telemetry_db  # type: AnyStr
+        self.scratch_root = args_dict['scratch_root'] if 'scratch_root' in args_dict \
+            else scratch_root  # type: AnyStr
+        self.keep_parsed_only = args_dict['keep_parsed_only'] if 'keep_parsed_only' in args_dict \
+            else keep_parsed_only  # type: bool
+        self.defer_gridfs_cleanup = args_dict['defer_gridfs_cleanup'] \
+            if 'defer_gridfs_cleanup' in args_dict else defer_gridfs_cleanup  # type: bool
 
         # Concatenate output directory name, which is also the name of runtime log
         # The format of OUTPUT directory is: OUTPUT_<FDIR>_<LYR>-<ScenarioID>-<CalibrationID>
@@ -313,6 +433,8 @@ class MainSEIMS(object):
         self.cmd = list()
         self.executed = False  # The model has been executed or not, no matter success.
         self.run_success = False  # The model executed successfully or not.
+        self.terminated = False  # The model was terminated since exceeding the maximum runtime.
+        self.attempts = 0  # Count of executions, including retries.
 
         # Model data read from MongoDB
         self.outlet_id = -1
@@ -328,7 +450,7 @@ class MainSEIMS(object):
         self.obs_vars = list()  # type: List[AnyStr]  # Observation types at the outlet
         self.obs_value = dict()  # type: Dict[datetime, List[float]] # Observation value
         self.sim_vars = list()  # type: List[AnyStr]  # Simulation types, part of `obs_vars`
-        self.sim_value = dict()  # type: Dict[datetime, List[float]] # Simulation value
+        self.sim_value = TimeseriesArray()  # type: TimeseriesArray # Simulation value
         # The format of sim_obs_dict:
         #         {VarName: {'UTCDATETIME': [t1, t2, ..., tn],
         #                    'Obs': [o1, o2, ..., on],
@@ -338,6 +460,8 @@ class MainSEIMS(object):
         self.sim_obs_dict = dict()  # type: Dict[AnyStr, Dict[AnyStr, Union[float, List[Union[datetime, float]]]]]
         self.runtime = 0.
         self.runlogs = list()  # type: List[AnyStr]
+        # Elapsed time of Python-side phases, e.g., setup, read_output, statistics, and cleanup
+        self.phases = dict()  # type: Dict[AnyStr, float]
 
         self.mongoclient = None  # type: Union[MongoClient, None]  # Set to None after use
 
@@ -377,6 +501,8 @@ class MainSEIMS(object):
             self.cmd += ['-cali', str(self.calibration_id)]
         if self.subbasin_id >= 0:
             self.cmd += ['-id', str(self.subbasin_id)]
+        if self.scratch_root:
+            self.cmd += ['-out', self.output_root]
         # self.cmd += ['-ll Debug'] # todo, should be set in ini file
         return self.cmd
 
@@ -386,12 +512,34 @@ class MainSEIMS(object):
         return ' '.join(repr(aa) if isinstance(aa, int) or isinstance(aa, float) else aa
                         for aa in self.Command)
 
+    @contextmanager
+    def phase(self, name):
+        """Accumulate the elapsed time of a Python-side phase into `phases`.
+
+        Examples:
+            with model.phase('statistics'):
+                model.CalcTimeseriesStatistics(model.sim_obs_dict)
+        """
+        stime = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + time.time() - stime
+
+    def RecordTelemetry(self, tag=''):
+        # type: (AnyStr) -> bool
+        """Record the telemetry of this model run if `telemetry_db` is specified."""
+        if not self.telemetry_db:
+            return False
+        RunTelemetry(self.telemetry_db).record(self, tag=tag)
+        return True
+
     def SetMongoClient(self):
         """Should be invoked outset of this script and followed by `UnsetMongoClient`
+
+        The pooled client of the current process is reused, see `ConnectMongoDB`.
         """
-        if self.mongoclient is None:
-            self.mongoclient = ConnectMongoDB(ip=self.host, port=self.port).get_conn()
-            # self.mongoclient = MongoDBObj.client  # type: MongoClient
+        self.mongoclient = ConnectMongoDB(ip=self.host, port=self.port).get_conn()
 
     def UnsetMongoClient(self):
         """Should be invoked together with `SetMongoClient`
@@ -399,7 +547,13 @@ class MainSEIMS(object):
         self.mongoclient = None
 
     def ReadMongoDBData(self):
-        """
+        """Read model metadata, i.e., OutletID, SubbasinCount, ScenarioDBName, SimulationPeriod,
+        and OutputItems.
+
+        The metadata is queried from MongoDB only once in each process (or only once for all
+          processes if `metadata_file` is specified) and shared by all `MainSEIMS` objects,
+          see `preprocess.db_read_model.get_model_metadata`.
+
         Examples:
             model.SetMongoClient()
             model.ReadMongoDBData()
@@ -408,15 +562,20 @@ class MainSEIMS(object):
         if self.outlet_id >= 0:
             return
 
-        self.SetMongoClient()
-        read_model = ReadModelData(self.mongoclient, self.db_name)
-
-        self.outlet_id = read_model.OutletID
-        self.subbasin_count = read_model.SubbasinCount
-        self.scenario_dbname = read_model.ScenarioDBName
-        self.start_time, self.end_time = read_model.SimulationPeriod
-        self.output_ids, self.output_items = read_model.OutputItems()
-        self.UnsetMongoClient()
+        metadata = get_model_metadata(self.host, self.port, self.db_name, self.metadata_file)
+        if metadata is None:
+            self.SetMongoClient()
+            read_model = ReadModelData(self.mongoclient, self.db_name)
+            metadata = read_model_metadata(read_model)
+            self.UnsetMongoClient()
+            set_model_metadata(self.host, self.port, self.db_name, metadata, self.metadata_file)
+
+        self.outlet_id = metadata['OutletID']
+        self.subbasin_count = metadata['SubbasinCount']
+        self.scenario_dbname = metadata['ScenarioDBName']
+        self.start_time, self.end_time = metadata['SimulationPeriod']
+        self.output_ids = metadata['OutputIDs'][:]
+        self.output_items = deepcopy(metadata['OutputItems'])
 
     @property
     def OutletID(self):  # type: (...) -> int
@@ -467,11 +626,15 @@ class MainSEIMS(object):
         self.UnsetMongoClient()
         return self.obs_vars, self.obs_value
 
-    def SetOutletObservations(self, vars_list, vars_value):
-        # type: (List[AnyStr], Dict[datetime, List[float]]) -> None
-        """Set observation data from the inputs."""
+    def SetOutletObservations(self, vars_list, vars_value, copy=True):
+        # type: (List[AnyStr], Union[Dict[datetime, List[float]], TimeseriesArray], bool) -> None
+        """Set observation data from the inputs.
+
+        If `copy` is False, `vars_value` is referenced rather than copied, which should be
+          read-only and may be shared by other models, e.g., of the same worker process.
+        """
         self.obs_vars = vars_list[:]
-        self.obs_value = deepcopy(vars_value)
+        self.obs_value = deepcopy(vars_value) if copy else vars_value
 
     def ReadTimeseriesSimulations(self, stime=None, etime=None):
         # type: (Optional[datetime], Optional[datetime]) -> bool
@@ -485,39 +648,46 @@ class MainSEIMS(object):
             stime = startt
         if etime is None:
             etime = endt
-        self.sim_vars, self.sim_value = read_simulation_from_txt(self.output_dir,
-                                                                 self.obs_vars,
-                                                                 self.OutletID,
-                                                                 stime, etime)
-        if len(self.sim_vars) < 1:  # No match simulation results
-            return False
-        self.sim_obs_dict = match_simulation_observation(self.sim_vars, self.sim_value,
-                                                         self.obs_vars, self.obs_value)
+        with self.phase('read_output'):
+            self.sim_vars, sim_dates, sim_data = read_simulation_columns_from_txt(self.output_dir,
+                                                                                  self.obs_vars,
+                                                                                  self.OutletID,
+                                                                                  stime, etime)
+            self.sim_value = TimeseriesArray(sim_dates, sim_data)
+            if len(self.sim_vars) < 1:  # No match simulation results
+                return False
+            self.sim_obs_dict = match_simulation_observation(self.sim_vars, self.sim_value,
+                                                             self.obs_vars, self.obs_value)
+        if self.keep_parsed_only:
+            if not self.timespan:
+                self.ParseTimespan()
+            remove_output_dir(self.output_dir)
         return True
 
     def ExtractSimData(self, stime=None, etime=None):
-        # type: (Optional[datetime], Optional[datetime]) -> (List[AnyStr], Dict[datetime, List[float]])
+        # type: (Optional[datetime], Optional[datetime]) -> (List[AnyStr], TimeseriesArray)
+        """Extract simulation data of the given period, which shares data with `sim_value`."""
         if stime is None and etime is None:
             return self.sim_vars, self.sim_value
-
-        sidx = bisect.bisect_left(list(self.sim_value.keys()), stime)
-        eidx = bisect.bisect_right(list(self.sim_value.keys()), etime)
-
-        def slice_odict(odict, start=None, end=None):
-            return OrderedDict([(k, v) for (k, v) in odict.items()
-                                if k in list(odict.keys())[start:end]])
-
-        return self.sim_vars, slice_odict(self.sim_value, sidx, eidx)
+        return self.sim_vars, self.sim_value.slice(stime, etime)
 
     def ExtractSimObsData(self, stime=None, etime=None):
         # type: (Optional[datetime], Optional[datetime]) -> Dict[AnyStr, Dict[AnyStr, List[Union[datetime, float]]]]
-        if stime is None and etime is None:
-            return deepcopy(self.sim_obs_dict)
+        """Extract the matched simulation and observation data of the given period.
+
+        The returned dicts are new objects that can be updated, e.g., by `calculate_statistics`,
+          while the data lists are not deep copied.
+        """
         ext_dict = dict()
         for param, values in self.sim_obs_dict.items():
             ext_dict[param] = dict()
-            sidx = bisect.bisect_left(values['UTCDATETIME'], stime)
-            eidx = bisect.bisect_right(values['UTCDATETIME'], etime)
+            if stime is None and etime is None:
+                for k in ['UTCDATETIME', 'Obs', 'Sim']:
+                    ext_dict[param][k] = values[k]
+                continue
+            sidx = 0 if stime is None else bisect.bisect_left(values['UTCDATETIME'], stime)
+            eidx = len(values['UTCDATETIME']) if etime is None \
+                else bisect.bisect_right(values['UTCDATETIME'], etime)
             ext_dict[param]['UTCDATETIME'] = values['UTCDATETIME'][sidx:eidx]
             ext_dict[param]['Obs'] = values['Obs'][sidx:eidx]
             ext_dict[param]['Sim'] = values['Sim'][sidx:eidx]
@@ -533,6 +703,37 @@ class MainSEIMS(object):
         objnames = calculate_statistics(sim_obs_dict, stime, etime)
         if objnames is None:
             return None, None
+        return MainSEIMS.CombineStatistics(sim_obs_dict, objnames)
+
+    @staticmethod
+    def CalcTimeseriesStatisticsBatch(sim_obs_dicts,
+                                      # type: List[Optional[Dict[AnyStr, Dict[AnyStr, Union[float, List[Union[datetime, float]]]]]]]
+                                      stime=None,  # type: Optional[datetime]
+                                      etime=None  # type: Optional[datetime]
+                                      ):
+        # type: (...) -> List[(Optional[List[AnyStr]], Optional[List[float]])]
+        """Calculate statistics of a batch of models (e.g., one generation) at once.
+
+        Returns:
+            List of (comb_vars, obj_values) with the same order of `sim_obs_dicts`,
+              (None, None) for the invalid `sim_obs_dict`.
+        """
+        objnames = calculate_statistics_batch(sim_obs_dicts, stime, etime)
+        results = list()
+        for sim_obs_dict in sim_obs_dicts:
+            if objnames is None or not sim_obs_dict:
+                results.append((None, None))
+            else:
+                results.append(MainSEIMS.CombineStatistics(sim_obs_dict, objnames))
+        return results
+
+    @staticmethod
+    def CombineStatistics(sim_obs_dict,
+                          # type: Dict[AnyStr, Dict[AnyStr, Union[float, List[Union[datetime, float]]]]]
+                          objnames  # type: List[AnyStr]
+                          ):
+        # type: (...) -> (List[AnyStr], List[float])
+        """Flatten the calculated statistics to `VarName-StatName` and values."""
         comb_vars = list()
         obj_values = list()
         for var in sim_obs_dict.keys():
@@ -655,6 +856,11 @@ class MainSEIMS(object):
                                                              {'$set': {'VALUE': etime_str}})
         self.UnsetMongoClient()
         self.start_time, self.end_time = read_model.SimulationPeriod
+        # Keep the shared metadata snapshot up to date
+        if get_model_metadata(self.host, self.port, self.db_name) is not None:
+            set_model_metadata(self.host, self.port, self.db_name,
+                               {'SimulationPeriod': [self.start_time, self.end_time]},
+                               self.metadata_file)
 
     def ResetOutputsPeriod(self, output_ids,  # type: Union[AnyStr, List[AnyStr]]
                            stime,  # type: Union[datetime, List[datetime]]
@@ -690,66 +896,169 @@ class MainSEIMS(object):
                                                               {'$set': {'STARTTIME': cur_stime_str,
                                                                         'ENDTIME': cur_etime_str}})
 
-    def run(self, do_execute=True):
-        """Run SEIMS model
+    def prepare_run(self):
+        """Prepare the OUTPUT directory and simulation period before executing the model.
 
         Examples:
             model.SetMongoClient()
-            model.run()
+            model.prepare_run()
             model.UnsetMongoClient()
         """
-        stime = time.time()
-        if not os.path.isdir(self.output_dir) or not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-        # If the input time period is not consistent with the predefined time period in FILE_IN.
-        if self.simu_stime and self.simu_etime and self.simu_stime != self.start_time \
-            and self.simu_etime != self.end_time:
-            self.ResetSimulationPeriod()
+        with self.phase('setup'):
+            if not os.path.isdir(self.output_dir) or not os.path.exists(self.output_dir):
+                os.makedirs(self.output_dir)
+            if self.scratch_root:
+                _SCRATCH_OUTPUT_DIRS[self.output_dir] = os.getpid()
+            # If the input time period is not consistent with the predefined time period
+            startt, endt = self.SimulatedPeriod
+            if self.simu_stime and self.simu_etime and self.simu_stime != startt \
+                and self.simu_etime != endt:
+                self.ResetSimulationPeriod()
         # If the output time period is specified, reset the time period of all output IDs
         # if self.out_stime and self.out_etime:
         #     self.ResetOutputsPeriod(self.OutputIDs, self.out_stime, self.out_etime)
 
+    def run(self, do_execute=True, max_runtime=None, max_retries=0):
+        # type: (bool, Optional[float], int) -> bool
+        """Run SEIMS model
+
+        Args:
+            do_execute: Execute the model or just prepare the model run.
+            max_runtime: If specified (seconds), the model will be terminated when exceeded,
+                         and `run_success` is set to False.
+            max_retries: Execute the failed model again at most `max_retries` times. The
+                         terminated model will not be retried since it would probably last
+                         long again.
+
+        Examples:
+            model.SetMongoClient()
+            model.run()
+            model.UnsetMongoClient()
+        """
+        stime = time.time()
+        self.prepare_run()
+
         if not do_execute:
             self.executed = False
             self.run_success = False
             return self.executed
 
+        self.attempts = 0
+        while True:
+            self.attempts += 1
+            self.execute(max_runtime)
+            if self.run_success or self.terminated or self.attempts > max_retries:
+                break
+            print('Retry SEIMS model (%s), attempt %d of %d...' % (self.output_name,
+                                                                  self.attempts + 1,
+                                                                  max_retries + 1))
+            self.runlogs = list()
+            self.timespan = dict()
+        self.runtime = time.time() - stime
+        return self.executed
+
+    def execute(self, max_runtime=None):
+        # type: (Optional[float]) -> bool
+        """Execute the prepared SEIMS model once, see `run()`."""
+        self.terminated = False
         try:
-            self.runlogs = UtilClass.run_command(self.Command)
-            self.ParseTimespan()
+            if max_runtime is not None and max_runtime > 0:
+                self.runlogs = self.run_command_with_timeout(max_runtime)
+            else:
+                self.runlogs = UtilClass.run_command(self.Command)
+            if self.terminated:
+                print('Terminate SEIMS model (%s) after %.1fs!' % (self.output_name, max_runtime))
+                self.run_success = False
+            else:
+                self.ParseTimespan()
         except CalledProcessError or IOError or Exception as err:
             # 1. SEIMS-based model running failed
             # 2. The OUTPUT directory was not been created successfully by SEIMS-based model
             # 3. Other unpredictable errors
             print('Run SEIMS model failed! %s' % str(err))
             self.run_success = False
-        self.runtime = time.time() - stime
         self.executed = True
         return self.executed
 
+    def run_command_with_timeout(self, max_runtime):
+        # type: (float) -> List[AnyStr]
+        """Execute the model command and terminate it if exceeds `max_runtime` seconds, in
+        which case `terminated` is set to True. Returns the output lines."""
+        cmd = [repr(v) if isinstance(v, (int, float)) else v for v in self.Command]
+        if sysstr == 'Windows':
+            cmd = ' '.join(cmd)
+        with tempfile.TemporaryFile(mode='w+') as logfile, open(os.devnull, 'r') as devnull:
+            process = subprocess.Popen(cmd, stdout=logfile, stderr=subprocess.STDOUT,
+                                       stdin=devnull, universal_newlines=True)
+            try:
+                process.wait(timeout=max_runtime)
+            except TypeError:  # Python 2 does not support `timeout`
+                stime = time.time()
+                while process.poll() is None and time.time() - stime < max_runtime:
+                    time.sleep(0.1)
+            except subprocess.TimeoutExpired:
+                pass
+            if process.poll() is None:
+                self.terminated = True
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except TypeError:
+                    process.wait()
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            logfile.seek(0)
+            runlogs = logfile.read().split('\n')
+        if process.returncode != 0 and not self.terminated:
+            raise CalledProcessError(process.returncode, cmd, '\n'.join(runlogs))
+        return runlogs
+
     def clean(self, scenario_id=None, calibration_id=None, delete_scenario=False,
               delete_spatial_gfs=False):
         """Clean model outputs in OUTPUT<ScenarioID>-<CalibrationID> directory and/or
-        GridFS files in OUTPUT collection.
+        GridFS files in OUTPUT collection (unless `defer_gridfs_cleanup` is True).
 
         Examples:
             model.SetMongoClient()
             model.clean()
             model.UnsetMongoClient()
         """
-        rmtree(self.output_dir, ignore_errors=True)
-        self.SetMongoClient()
-        read_model = ReadModelData(self.mongoclient, self.db_name)
-        if scenario_id is None:
-            scenario_id = self.scenario_id
-        if calibration_id is None:
-            calibration_id = self.calibration_id
-        read_model.CleanOutputGridFs(scenario_id, calibration_id)
-        if delete_scenario:
-            read_model.CleanScenariosConfiguration(scenario_id)
-            if delete_spatial_gfs:
-                read_model.CleanSpatialGridFs(scenario_id)
-        self.UnsetMongoClient()
+        with self.phase('cleanup'):
+            remove_output_dir(self.output_dir)
+            self.SetMongoClient()
+            read_model = ReadModelData(self.mongoclient, self.db_name)
+            if scenario_id is None:
+                scenario_id = self.scenario_id
+            if calibration_id is None:
+                calibration_id = self.calibration_id
+            if not self.defer_gridfs_cleanup:
+                read_model.CleanOutputGridFs(scenario_id, calibration_id)
+            if delete_scenario:
+                read_model.CleanScenariosConfiguration(scenario_id)
+                if delete_spatial_gfs:
+                    read_model.CleanSpatialGridFs(scenario_id)
+            self.UnsetMongoClient()
+
+    def CleanOutputGridFsBatch(self, ids, background=False):
+        # type: (List[Tuple[int, int]], bool) -> Optional[threading.Thread]
+        """Clean OUTPUT GridFS files of a batch of models, i.e., (ScenarioID, CalibrationID) pairs.
+
+        Args:
+            ids: (ScenarioID, CalibrationID) pairs of models
+            background: Run in a background thread and return it, which will be completed
+                        before the exit of the main thread.
+        """
+        if not background:
+            self.SetMongoClient()
+            count = ReadModelData(self.mongoclient, self.db_name).CleanOutputGridFsBatch(ids)
+            self.UnsetMongoClient()
+            print('Deleted %d OUTPUT GridFS files of %d models.' % (count, len(ids)))
+            return None
+        thread = threading.Thread(target=self.CleanOutputGridFsBatch, args=(list(ids), False),
+                                  name='CleanOutputGridFs')
+        thread.start()
+        return thread
 
     def UpdateScenarioID(self):
         """
@@ -768,10 +1077,18 @@ class MainSEIMS(object):
         self.output_name += '-'
         if self.calibration_id >= 0:
             self.output_name += '%d' % self.calibration_id
-        if self.cfg_name:
-            self.output_dir = '%s/%s/%s' % (self.model_dir, self.cfg_name, self.output_name)
+        if self.scratch_root:
+            # Outputs of different models (and configurations) are separated in the scratch root
+            self.output_root = os.path.join(self.scratch_root, 'seims_%s' % (
+                '_'.join(v for v in [self.db_name or os.path.basename(self.model_dir),
+                                     self.cfg_name] if v)))
+            self.output_dir = '%s/%s' % (self.output_root, self.output_name)
+        elif self.cfg_name:
+            self.output_root = '%s/%s' % (self.model_dir, self.cfg_name)
+            self.output_dir = '%s/%s' % (self.output_root, self.output_name)
         else:
-            self.output_dir = '%s/%s' % (self.model_dir, self.output_name)
+            self.output_root = self.model_dir
+            self.output_dir = '%s/%s' % (self.output_root, self.output_name)
         self.runlog_name = os.path.join(self.output_dir, '%s.log' % self.output_name)
 
 
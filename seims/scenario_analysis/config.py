@@ -7,6 +7,7 @@
     - 17-08-18  - lj - reorganize as basic class.
     - 18-02-09  - lj - compatible with Python3.
     - 18-10-29  - lj - Redesign the code structure.
+    - 26-10-18  - st - Add computing resources for the executor of model runs.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -23,7 +24,7 @@ from typing import Union, Optional, Dict, List, AnyStr
 from pygeoc.utils import UtilClass, StringClass
 from run_seims import ParseSEIMSConfig
 from utility import get_optimization_config, parse_datetime_from_ini
-from utility import ParseNSGA2Config, PlotConfig
+from utility import ParseNSGA2Config, PlotConfig, ParseResourceConfig
 from scenario_analysis import BMPS_CFG_UNITS, BMPS_CFG_METHODS, BMPS_CFG_PAIR
 
 
@@ -33,6 +34,8 @@ class SAConfig(object):
     def __init__(self, cf, method='nsga2'):
         # type: (ConfigParser, str) -> None
         """Initialization."""
+        # 0. Computing resources related, i.e., executor of model runs
+        self.resource = ParseResourceConfig(cf)  # type: ParseResourceConfig
         # 1. SEIMS model related
         self.model = ParseSEIMSConfig(cf)  # type: ParseSEIMSConfig
 
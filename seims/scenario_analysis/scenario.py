@@ -8,6 +8,7 @@ Base class of Scenario for coupling NSGA-II.
     - 17-08-18  - lj - redesign and rewrite.
     - 18-02-09  - lj - compatible with Python3.
     - 18-10-30  - lj - Update according to new config parser structure.
+    - 26-10-18  - st - Timeout and retries of model runs.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -97,12 +98,22 @@ class Scenario(object):
         self.modelcfg = cfg.model
         self.modelcfg_dict = self.modelcfg.ConfigDict
         self.model = MainSEIMS(args_dict=self.modelcfg_dict)
-
+        # Timeout and retries of model run
+        self.max_runtime = None  # type: Optional[float]
+        self.max_retries = 0  # type: int
+        if cfg.opt is not None:
+            if cfg.opt.run_timeout > 0:
+                self.max_runtime = cfg.opt.run_timeout
+            self.max_retries = cfg.opt.run_retries
+
+        # Model metadata is read from MongoDB only once and shared by all scenarios
         self.model.ReadMongoDBData()
 
         self.model.SetMongoClient()
         self.scenario_db = self.model.ScenarioDBName
-        self.model.ResetSimulationPeriod()  # Reset the simulation period
+        startt, endt = self.model.SimulatedPeriod
+        if self.model.simu_stime != startt or self.model.simu_etime != endt:
+            self.model.ResetSimulationPeriod()  # Reset the simulation period
         # Reset the starttime and endtime of the desired outputs according to evaluation period
         if ModelCfgFields.output_id in self.eval_info:
             self.model.ResetOutputsPeriod(self.eval_info[ModelCfgFields.output_id],
@@ -255,7 +266,7 @@ class Scenario(object):
         self.modelout_dir = self.model.output_dir
 
         self.model.SetMongoClient()
-        self.model.run()
+        self.model.run(max_runtime=self.max_runtime, max_retries=self.max_retries)
         self.model.UnsetMongoClient()
 
         self.modelrun = True
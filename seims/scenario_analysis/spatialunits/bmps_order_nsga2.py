@@ -36,6 +36,7 @@ if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
 
 from typing import List
 from utility.scoop_func import scoop_log
+from utility.executor import create_executor
 from scenario_analysis import BMPS_CFG_UNITS, BMPS_CFG_METHODS
 from scenario_analysis.config import SAConfig
 from scenario_analysis.userdef import initIterateWithCfgIndv, initRepeatWithCfgIndv, \
@@ -185,6 +186,10 @@ def main(scenario_obj):
         pop = toolbox.population(scenario_obj.cfg, scenario_obj.gene_values, n=pop_size)  # type: List
         print(pop)
 
+    # Executor of model runs, e.g., SCOOP, process pool, or Slurm job array
+    executor = create_executor(scenario_obj.cfg.resource, scenario_obj.cfg.opt.out_dir,
+                               scenario_obj.modelcfg.nprocess * scenario_obj.modelcfg.nthread)
+
     init_time = time.time() - stime
 
     def delete_fitness(new_ind):
@@ -215,13 +220,7 @@ def main(scenario_obj):
     def evaluate_parallel(invalid_pops):
         """Evaluate model by SCOOP or map, and get fitness of individuals."""
         popnum = len(invalid_pops)
-        try:
-            # parallel on multiprocesor or clusters using SCOOP
-            from scoop import futures
-            invalid_pops = list(futures.map(toolbox.evaluate, [scenario_obj.cfg] * popnum, invalid_pops))
-        except ImportError or ImportWarning:
-            # serial
-            invalid_pops = list(toolbox.map(toolbox.evaluate, [scenario_obj.cfg] * popnum, invalid_pops))
+        invalid_pops = executor.map(toolbox.evaluate, [scenario_obj.cfg] * popnum, invalid_pops)
 
         # Filter for a valid solution
         if filter_ind:
@@ -416,6 +415,7 @@ def main(scenario_obj):
               'Sum of model runs timespan: %.4f\n'
               'Plot Pareto graphs timespan: %.4f' % (init_time, exec_time,
                                                      exec_time_sum, plot_time))
+    executor.shutdown()
 
     return pop, logbook
 
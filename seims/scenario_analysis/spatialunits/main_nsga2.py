@@ -10,6 +10,13 @@
     - 18-11-02  - lj - Optimization.
     - 18-12-04  - lj - Updates of crossover operation of UPDOWN method.
     - 19-03-13  - lj - Support using input Pareto fronts to initialize population.
+    - 26-10-18  - st - Surrogate-assisted pre-screening of offspring.
+    - 26-10-18  - st - Periodic checkpoints and resume from the last complete generation.
+    - 26-10-18  - st - Stop by hypervolume convergence or computing budgets.
+    - 26-10-18  - st - Plot in a background process at the configured frequency.
+    - 26-10-18  - st - Warm start from the archive of a previous run, revalidated by current BMPs.
+    - 26-10-18  - st - Wait for the deferred GridFS cleanup before the next batch of model runs.
+    - 26-10-18  - st - Skip the initialization of population when resuming from checkpoint.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -17,6 +24,7 @@ import array
 import os
 import sys
 import random
+import threading
 import time
 import pickle
 from typing import Dict, List
@@ -35,17 +43,25 @@ from deap import base
 from deap import creator
 from deap import tools
 from deap.benchmarks.tools import hypervolume
-from pygeoc.utils import UtilClass, get_config_parser
+from pygeoc.utils import UtilClass
 
 if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '../..')))
 
 from utility.scoop_func import scoop_log
+from utility.eval_cache import EvaluationCache
+from utility.executor import create_executor
+from utility.surrogate import SurrogateModel
+from utility.checkpoint import save_checkpoint, load_checkpoint, restore_log_files
+from utility.convergence import ConvergenceMonitor
+from utility.background_plot import BackgroundPlotter
+from utility.warm_start import load_archive_genes, revalidate_choices
+from utility.parse_config import get_optimization_config
+from run_seims import MainSEIMS
 from scenario_analysis import BMPS_CFG_UNITS, BMPS_CFG_METHODS
 from scenario_analysis.config import SAConfig
 from scenario_analysis.userdef import initIterateWithCfg, initRepeatWithCfg,\
     initRepeatWithCfgFromList, initIterateWithCfgWithInput
-from scenario_analysis.visualization import read_pareto_solutions_from_txt
 from scenario_analysis.spatialunits.config import SASlpPosConfig, SAConnFieldConfig,\
     SACommUnitConfig
 from scenario_analysis.spatialunits.scenario import SUScenario
@@ -68,7 +84,7 @@ creator.create('FitnessMulti', base.Fitness, weights=multi_weight)
 #      the typecode=str('d') MUST NOT changed to typecode='d', since
 #      the latter will raise TypeError that 'must be char, not unicode'!
 creator.create('Individual', array.array, typecode=str('d'), fitness=creator.FitnessMulti,
-               gen=-1, id=-1,
+               gen=-1, id=-1, run_success=False,
                io_time=0., comp_time=0., simu_time=0., runtime=0.)
 
 # Register NSGA-II related operations
@@ -114,8 +130,11 @@ def main(sceobj):
 
     # Initial timespan variables
     stime = time.time()
-    plot_time = 0.
+    plot_time = 0.  # Submitting plots and waiting for the final ones, not the rendering
     allmodels_exect = list()  # execute time of all model runs
+    # Plots of Pareto fronts are rendered off the critical path of model evaluations
+    plotter = BackgroundPlotter(sceobj.cfg.opt.plot_frequency, sceobj.cfg.opt.background_plot,
+                                sceobj.cfg.opt.plot_queue_size)
 
     pop_size = sceobj.cfg.opt.npop
     gen_num = sceobj.cfg.opt.ngens
@@ -155,21 +174,84 @@ def main(sceobj):
     logbook = tools.Logbook()
     logbook.header = 'gen', 'evals', 'min', 'max', 'avg', 'std'
 
-    # Initialize population
-    initialize_byinputs = False
-    if sceobj.cfg.initial_byinput and sceobj.cfg.input_pareto_file is not None and \
-        sceobj.cfg.input_pareto_gen > 0:  # Initial by input Pareto solutions
-        inpareto_file = sceobj.modelcfg.model_dir + os.sep + sceobj.cfg.input_pareto_file
-        if os.path.isfile(inpareto_file):
-            inpareto_solutions = read_pareto_solutions_from_txt(inpareto_file,
-                                                                sce_name='scenario',
-                                                                field_name='gene_values')
-            if sceobj.cfg.input_pareto_gen in inpareto_solutions:
-                pareto_solutions = inpareto_solutions[sceobj.cfg.input_pareto_gen]
-                pop = toolbox.population_byinputs(sceobj.cfg, pareto_solutions)  # type: List
-                initialize_byinputs = True
-    if not initialize_byinputs:
-        pop = toolbox.population(sceobj.cfg, n=pop_size)  # type: List
+    # Persistent cache of evaluated scenarios, keyed by gene values and configuration
+    eval_cache = None
+    if sceobj.cfg.opt.eval_cache:
+        cache_cfg = dict(sceobj.modelcfg.ConfigDict)
+        cache_cfg.update({'bmps_info': sceobj.cfg.bmps_info,
+                          'bmps_retain': sceobj.cfg.bmps_retain,
+                          'eval_info': sceobj.cfg.eval_info,
+                          'bmps_cfg_unit': cfg_unit, 'bmps_cfg_method': cfg_method,
+                          'eval_stime': sceobj.cfg.eval_stime,
+                          'eval_etime': sceobj.cfg.eval_etime})
+        eval_cache = EvaluationCache(sceobj.cfg.opt.eval_cache_dir, cache_cfg)
+
+    # Resume from the last checkpoint, i.e., the state after a complete generation, in which
+    #   case the initial population is not sampled
+    checkpoint = None
+    if sceobj.cfg.opt.resume:
+        checkpoint = load_checkpoint(sceobj.cfg.opt.checkpoint_file)
+    if checkpoint is not None:
+        pop = checkpoint['pop']
+    else:
+        # Initialize population, warm start from the archive of a previous run if specified,
+        #   the Pareto solutions specified by InputPopulation, ParetoFrontsFile, and
+        #   GenerationSelected are also supported
+        warm_start_file = sceobj.cfg.opt.warm_start_file
+        warm_start_gen = sceobj.cfg.opt.warm_start_gen
+        if not warm_start_file and sceobj.cfg.initial_byinput and \
+            sceobj.cfg.input_pareto_file is not None and sceobj.cfg.input_pareto_gen > 0:
+            warm_start_file = sceobj.modelcfg.model_dir + os.sep + sceobj.cfg.input_pareto_file
+            warm_start_gen = sceobj.cfg.input_pareto_gen
+        pop = list()  # type: List
+        if warm_start_file:
+            archive_genes, archive_inds = load_archive_genes(warm_start_file, warm_start_gen,
+                                                             sce_name='scenario')
+            # Available values of each gene, i.e., no BMP, the current BMPs, and thresholds
+            gene_choices = list()
+            for gidx in range(sceobj.cfg.genes_num):
+                if gidx in sceobj.cfg.gene_to_unit:
+                    gene_choices.append(set([0] + list(sceobj.cfg.bmps_subids)))
+                else:
+                    gene_choices.append(set([0] + list(sceobj.cfg.boundary_adaptive_threshs)))
+            if sceobj.cfg.genes_num > sceobj.cfg.units_num:
+                # Gene values of slope position units only, i.e., without boundary thresholds
+                typenum = sceobj.cfg.slppos_types_num
+                tnum = sceobj.cfg.thresh_num
+                for aidx, genes in enumerate(archive_genes):
+                    if len(genes) != sceobj.cfg.units_num:
+                        continue
+                    full_genes = [0] * sceobj.cfg.genes_num
+                    for idx, gv in enumerate(genes):
+                        full_genes[idx // typenum * (typenum + tnum) + idx % typenum] = gv
+                    archive_genes[aidx] = full_genes
+            inputs, kept = revalidate_choices(archive_genes, gene_choices,
+                                              sceobj.cfg.opt.warm_start_bounds, replacement=0)
+            inputs = inputs[:pop_size]
+            scoop_log('Warm start: %d of %d scenarios in %s are valid for the current BMPs, '
+                      '%d are used.' % (len(kept), len(archive_genes), warm_start_file,
+                                        len(inputs)))
+            pop = toolbox.population_byinputs(sceobj.cfg, inputs)
+            if sceobj.cfg.opt.warm_start_cache and eval_cache is not None and \
+                archive_inds is not None:
+                seeded = 0
+                for genes, idx in zip(inputs, kept):
+                    tmpind = archive_inds[idx]
+                    if list(tmpind) == genes and tmpind.run_success and tmpind not in eval_cache:
+                        eval_cache.put(tmpind, {'id': tmpind.id,
+                                                'fitness': list(tmpind.fitness.values)})
+                        seeded += 1
+                scoop_log('Warm start: %d evaluated scenarios are put into cache.' % seeded)
+        if len(pop) < pop_size:
+            pop += toolbox.population(sceobj.cfg, n=pop_size - len(pop))
+    # Surrogate of fitness values to pre-screen offspring, trained on evaluated scenarios
+    surrogate = None
+    if sceobj.cfg.opt.surrogate:
+        surrogate = SurrogateModel(sceobj.cfg.opt.surrogate)
+
+    # Executor of model runs, e.g., SCOOP, process pool, or Slurm job array
+    executor = create_executor(sceobj.cfg.resource, sceobj.cfg.opt.out_dir,
+                               sceobj.modelcfg.nprocess * sceobj.modelcfg.nthread)
 
     init_time = time.time() - stime
 
@@ -193,16 +275,47 @@ def main(sceobj):
                 flag = False
         return flag
 
+    # Background thread deleting the OUTPUT GridFS files of the last batch of model runs
+    gridfs_cleanup = list()  # type: List[threading.Thread]
+
+    def wait_gridfs_cleanup():
+        """Wait for the deferred cleanup of the last batch before executing the next one."""
+        while gridfs_cleanup:
+            gridfs_cleanup.pop().join()
+
     def evaluate_parallel(invalid_pops):
         """Evaluate model by SCOOP or map, and get fitness of individuals."""
-        popnum = len(invalid_pops)
-        try:
-            # parallel on multiprocesor or clusters using SCOOP
-            from scoop import futures
-            invalid_pops = list(futures.map(toolbox.evaluate, [sceobj.cfg] * popnum, invalid_pops))
-        except ImportError or ImportWarning:
-            # serial
-            invalid_pops = list(map(toolbox.evaluate, [sceobj.cfg] * popnum, invalid_pops))
+        # Restore the scenarios that have been evaluated from cache
+        new_idx = list(range(len(invalid_pops)))
+        if eval_cache is not None:
+            new_idx = list()
+            for idx, tmpind in enumerate(invalid_pops):
+                record = eval_cache.get(tmpind)
+                if record is None:
+                    new_idx.append(idx)
+                    continue
+                tmpind.id = record['id']
+                tmpind.fitness.values = record['fitness']
+                tmpind.run_success = True  # The cached records are successful model runs
+                tmpind.io_time, tmpind.comp_time, tmpind.simu_time, tmpind.runtime = [0.] * 4
+        new_pops = [invalid_pops[idx] for idx in new_idx]
+        popnum = len(new_pops)
+        wait_gridfs_cleanup()
+        new_pops = executor.map(toolbox.evaluate, [sceobj.cfg] * popnum, new_pops)
+        if sceobj.modelcfg.defer_gridfs_cleanup and new_pops:
+            cleanup = MainSEIMS(args_dict=sceobj.modelcfg.ConfigDict).CleanOutputGridFsBatch(
+                [(tmpind.id, sceobj.modelcfg.calibration_id) for tmpind in new_pops],
+                background=True)
+            gridfs_cleanup.append(cleanup)
+        for idx, tmpind in zip(new_idx, new_pops):
+            invalid_pops[idx] = tmpind
+            # The failed model run should be re-evaluated
+            if eval_cache is not None and tmpind.run_success:
+                eval_cache.put(tmpind, {'id': tmpind.id,
+                                        'fitness': list(tmpind.fitness.values)})
+        if eval_cache is not None:
+            scoop_log('Scenarios restored from cache: %d, newly evaluated: %d. %s' %
+                      (len(invalid_pops) - popnum, popnum, eval_cache.summary()))
 
         # Filter for a valid solution
         if filter_ind:
@@ -214,40 +327,25 @@ def main(sceobj):
                 exit(2)
         return invalid_pops  # Currently, `invalid_pops` contains evaluated individuals
 
-    # Record the count and execute timespan of model runs during the optimization
-    modelruns_count = {0: len(pop)}
-    modelruns_time = {0: 0.}  # Total time counted according to evaluate_parallel()
-    modelruns_time_sum = {0: 0.}  # Summarize time of every model runs according to pop
-
-    # Generation 0 before optimization
-    stime = time.time()
-    pop = evaluate_parallel(pop)
-    modelruns_time[0] = time.time() - stime
-    for ind in pop:
-        ind.gen = 0
-        allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
-        modelruns_time_sum[0] += ind.runtime
-
-    # Currently, len(pop) may less than pop_select_num
-    pop = toolbox.select(pop, pop_select_num)
-    record = stats.compile(pop)
-    logbook.record(gen=0, evals=len(pop), **record)
-    scoop_log(logbook.stream)
-    front = numpy.array([ind.fitness.values for ind in pop])
-    # save front for further possible use
-    numpy.savetxt(sceobj.scenario_dir + os.sep + 'pareto_front_gen0.txt',
-                  front, delimiter=str(' '), fmt=str('%.4f'))
-
-    # Begin the generational process
-    output_str = '### Generation number: %d, Population size: %d ###\n' % (gen_num, pop_size)
-    scoop_log(output_str)
-    UtilClass.writelog(sceobj.cfg.opt.logfile, output_str, mode='replace')
-
-    modelsel_count = {0: len(pop)}  # type: Dict[int, int] # newly added Pareto fronts
-
-    for gen in range(1, gen_num + 1):
-        output_str = '###### Generation: %d ######\n' % gen
-        scoop_log(output_str)
+    def train_surrogate(evaluated_inds):
+        """Add the successfully evaluated scenarios to surrogate and retrain it."""
+        if surrogate is None:
+            return
+        for tmpind in evaluated_inds:
+            if tmpind.run_success:
+                surrogate.add(tmpind, tmpind.fitness.values)
+        if surrogate.size >= sceobj.cfg.opt.surrogate_min_samples:
+            surrogate.fit()
+
+    def prescreen_offspring(candidates, num):
+        """Select `num` most promising candidates by surrogate, or the first `num` ones."""
+        if surrogate is None or not surrogate.trained or num >= len(candidates):
+            return candidates[:num]
+        selected = surrogate.prescreen(candidates, num, multi_weight)
+        return [candidates[idx] for idx in selected]
+
+    def vary_population(pop):
+        """Generate offspring by mate and mutate, the changed ones have invalid fitness."""
         offspring = [toolbox.clone(ind) for ind in pop]
         if len(offspring) >= 2:  # when offspring size greater than 2, mate can be done
             for ind1, ind2 in zip(offspring[::2], offspring[1::2]):
@@ -284,6 +382,96 @@ def main(sceobj):
                     delete_fitness(ind1)
                 if check_individual_diff(old_ind2, ind2):
                     delete_fitness(ind2)
+        return offspring
+
+    # Record the count and execute timespan of model runs during the optimization
+    modelruns_count = {0: len(pop)}
+    modelruns_time = {0: 0.}  # Total time counted according to evaluate_parallel()
+    modelruns_time_sum = {0: 0.}  # Summarize time of every model runs according to pop
+    modelsel_count = dict()  # type: Dict[int, int] # newly added Pareto fronts
+    # Hypervolume convergence and computing budgets
+    convergence = ConvergenceMonitor(sceobj.cfg.opt.conv_window, sceobj.cfg.opt.conv_tolerance,
+                                     sceobj.cfg.opt.max_walltime, sceobj.cfg.opt.max_evaluations)
+
+    def save_state(gen, pop, plot_time):
+        """Save checkpoint after a complete generation, see `utility.checkpoint`."""
+        if sceobj.cfg.opt.checkpoint_interval <= 0 or \
+            (gen % sceobj.cfg.opt.checkpoint_interval != 0 and gen < gen_num):
+            return
+        save_checkpoint(sceobj.cfg.opt.checkpoint_file,
+                        {'gen': gen, 'pop': pop, 'logbook': logbook, 'plot_time': plot_time,
+                         'allmodels_exect': allmodels_exect,
+                         'modelruns_count': modelruns_count, 'modelruns_time': modelruns_time,
+                         'modelruns_time_sum': modelruns_time_sum,
+                         'modelsel_count': modelsel_count, 'surrogate': surrogate,
+                         'convergence': convergence},
+                        log_files=[sceobj.cfg.opt.logfile, sceobj.cfg.opt.hypervlog])
+
+    # Restore the state of the last complete generation from checkpoint
+    if checkpoint is not None:
+        restore_log_files(checkpoint)
+        start_gen = checkpoint['gen'] + 1
+        logbook = checkpoint['logbook']
+        plot_time = checkpoint['plot_time']
+        allmodels_exect = checkpoint['allmodels_exect']
+        surrogate = checkpoint['surrogate']
+        convergence = checkpoint['convergence']
+        convergence.restart()
+        modelruns_count.update(checkpoint['modelruns_count'])
+        modelruns_time.update(checkpoint['modelruns_time'])
+        modelruns_time_sum.update(checkpoint['modelruns_time_sum'])
+        modelsel_count.update(checkpoint['modelsel_count'])
+        scoop_log('Resume from the checkpoint of generation %d.' % checkpoint['gen'])
+    else:
+        if sceobj.cfg.opt.resume:
+            scoop_log('No valid checkpoint found, start a new optimization.')
+        start_gen = 1
+        # Generation 0 before optimization
+        stime = time.time()
+        pop = evaluate_parallel(pop)
+        modelruns_time[0] = time.time() - stime
+        train_surrogate(pop)
+        for ind in pop:
+            ind.gen = 0
+            allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
+            modelruns_time_sum[0] += ind.runtime
+
+        # Currently, len(pop) may less than pop_select_num
+        pop = toolbox.select(pop, pop_select_num)
+        record = stats.compile(pop)
+        logbook.record(gen=0, evals=len(pop), **record)
+        scoop_log(logbook.stream)
+        front = numpy.array([ind.fitness.values for ind in pop])
+        # save front for further possible use
+        numpy.savetxt(sceobj.scenario_dir + os.sep + 'pareto_front_gen0.txt',
+                      front, delimiter=str(' '), fmt=str('%.4f'))
+
+        # Begin the generational process
+        output_str = '### Generation number: %d, Population size: %d ###\n' % (gen_num, pop_size)
+        scoop_log(output_str)
+        UtilClass.writelog(sceobj.cfg.opt.logfile, output_str, mode='replace')
+
+        modelsel_count[0] = len(pop)
+        convergence.update(hypervolume(pop, ref_pt), modelruns_count[0])
+        save_state(0, pop, plot_time)
+
+    for gen in range(start_gen, gen_num + 1):
+        if convergence.stop_reason:
+            scoop_log('%s The NSGA2 will be terminated!' % convergence.stop_reason)
+            break
+        output_str = '###### Generation: %d ######\n' % gen
+        scoop_log(output_str)
+        offspring = vary_population(pop)
+        if surrogate is not None and surrogate.trained:
+            # Generate more candidates and evaluate the most promising ones by surrogate
+            candidates = [ind for ind in offspring if not ind.fitness.valid]
+            eval_num = len(candidates)
+            for _ in range(sceobj.cfg.opt.surrogate_ratio - 1):
+                candidates += [ind for ind in vary_population(pop) if not ind.fitness.valid]
+            offspring = [ind for ind in offspring if ind.fitness.valid] + \
+                        prescreen_offspring(candidates, eval_num)
+            scoop_log('Surrogate pre-screening: %d of %d candidates are selected.' %
+                      (eval_num, len(candidates)))
 
         # Evaluate the individuals with an invalid fitness
         invalid_inds = [ind for ind in offspring if not ind.fitness.valid]
@@ -296,6 +484,7 @@ def main(sceobj):
         stime = time.time()
         invalid_inds = evaluate_parallel(invalid_inds)
         curtimespan = time.time() - stime
+        train_surrogate(invalid_inds)
         modelruns_time.setdefault(gen, curtimespan)
         modelruns_time_sum.setdefault(gen, 0.)
         for ind in invalid_inds:
@@ -320,11 +509,12 @@ def main(sceobj):
             pop.append(tmpind)
         pop = toolbox.select(pop, pop_select_num)
 
+        hyper_v = hypervolume(pop, ref_pt)
+        convergence.update(hyper_v, invalid_ind_size)
         hyper_str = 'Gen: %d, New model runs: %d, ' \
                     'Execute timespan: %.4f, Sum of model run timespan: %.4f, ' \
                     'Hypervolume: %.4f\n' % (gen, invalid_ind_size,
-                                             curtimespan, modelruns_time_sum[gen],
-                                             hypervolume(pop, ref_pt))
+                                             curtimespan, modelruns_time_sum[gen], hyper_v)
         scoop_log(hyper_str)
         UtilClass.writelog(sceobj.cfg.opt.hypervlog, hyper_str, mode='append')
 
@@ -356,9 +546,9 @@ def main(sceobj):
                 xlabel = r'经济净投入'
                 ylabel = r'环境效益'
                 pareto_title = r'近似最优Pareto解集'
-            plot_pareto_front_single(front, [xlabel, ylabel],
-                                     ws, gen, pareto_title,
-                                     plot_cfg=sceobj.cfg.plot_cfg)
+            plotter.submit(gen, plot_pareto_front_single, front, [xlabel, ylabel],
+                           ws, gen, pareto_title,
+                           plot_cfg=sceobj.cfg.plot_cfg)
         except Exception as e:
             scoop_log('Exception caught: %s' % str(e))
         plot_time += time.time() - stime
@@ -373,14 +563,20 @@ def main(sceobj):
         pklfile_str = 'gen%d.pickle' % (gen,)
         with open(sceobj.cfg.opt.simdata_dir + os.path.sep + pklfile_str, 'wb') as pklfp:
             pickle.dump(pop, pklfp)
+        save_state(gen, pop, plot_time)
 
-    # Plot hypervolume and newly executed model count
+    # Plot the pending graphs of the final generation, hypervolume and newly executed model count
     # Comment out the following plot code if matplotlib does not work.
+    stime = time.time()
+    plotter.close()
     try:
         from scenario_analysis.visualization import plot_hypervolume_single
-        plot_hypervolume_single(sceobj.cfg.opt.hypervlog, ws, plot_cfg=sceobj.cfg.plot_cfg)
+        if plotter.enabled:
+            plot_hypervolume_single(sceobj.cfg.opt.hypervlog, ws, plot_cfg=sceobj.cfg.plot_cfg)
     except Exception as e:
         scoop_log('Exception caught: %s' % str(e))
+    plot_time += time.time() - stime
+    wait_gridfs_cleanup()
 
     # Save newly added Pareto fronts of each generations
     new_fronts_count = numpy.array(list(modelsel_count.items()))
@@ -414,14 +610,15 @@ def main(sceobj):
     scoop_log('Initialization timespan: %.4f\n'
               'Model execution timespan: %.4f\n'
               'Sum of model runs timespan: %.4f\n'
-              'Plot Pareto graphs timespan: %.4f' % (init_time, exec_time,
+              'Plot timespan on the critical path: %.4f' % (init_time, exec_time,
                                                      exec_time_sum, plot_time))
+    executor.shutdown()
 
     return pop, logbook
 
 
 if __name__ == "__main__":
-    in_cf = get_config_parser()
+    in_cf, _ = get_optimization_config()
     base_cfg = SAConfig(in_cf)  # type: SAConfig
 
     if base_cfg.bmps_cfg_unit == BMPS_CFG_UNITS[3]:  # SLPPOS
@@ -6,6 +6,8 @@
     - 16-10-29  - hr - initial implementation.
     - 17-08-18  - lj - redesign and rewrite.
     - 18-02-09  - lj - compatible with Python3.
+    - 26-10-18  - st - Isolate failed evaluations of scenarios.
+    - 26-10-18  - st - Penalize unsuccessful model runs and always clean the scenario data.
 """
 from __future__ import absolute_import, division, unicode_literals
 from future.utils import viewitems
@@ -946,12 +948,51 @@ def initialize_scenario_with_bmps_order(cf, opt_genes, input_genes=False):
     return sce.initialize_with_bmps_order(opt_genes, input_genes=input_genes)
 
 
+def scenario_penalty_fitness(cf):
+    # type: (Union[SASlpPosConfig, SAConnFieldConfig, SACommUnitConfig]) -> List[float]
+    """Fitness values of the scenarios whose evaluations failed, i.e., `PenaltyFitness` of
+    [NSGA2] if configured, otherwise the worst economic and environmental values."""
+    opt = getattr(cf, 'opt', None)
+    if opt is not None and len(opt.penalty_fitness) == 2:
+        return list(opt.penalty_fitness)
+    return [cf.worst_econ, cf.worst_env]
+
+
 def scenario_effectiveness(cf, ind):
     # type: (Union[SASlpPosConfig, SAConnFieldConfig, SACommUnitConfig], array.array) -> (float, float, int)
-    """Run SEIMS-based model and calculate economic and environmental effectiveness."""
-    # 1. instantiate the inherited Scenario class.
-    sce = SUScenario(cf)
-    ind.id = sce.set_unique_id()
+    """Run SEIMS-based model and calculate economic and environmental effectiveness.
+
+    If the model run failed (including timed out or terminated) or any error raised during
+      the evaluation, the penalty fitness is assigned, see `scenario_penalty_fitness`, so that
+      the other evaluations are not affected. The intermediate data of the scenario is always
+      cleaned.
+    """
+    ind.run_success = False
+    ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = [0.] * 4
+    sce = None
+    try:
+        # 1. instantiate the inherited Scenario class.
+        sce = SUScenario(cf)
+        ind.id = sce.set_unique_id()
+        _scenario_effectiveness(sce, ind)
+    except Exception as err:
+        print('Evaluate scenario %d failed! %s' % (ind.id, str(err)))
+        ind.run_success = False
+    finally:
+        if sce is not None:
+            # 7. Clean the intermediate data of current scenario
+            try:
+                sce.clean(scenario_id=sce.ID, delete_scenario=True, delete_spatial_gfs=True)
+            except Exception as err:
+                print('Clean scenario %d failed! %s' % (ind.id, str(err)))
+            sce.model.RecordTelemetry(tag='scenario')
+    if not ind.run_success:
+        ind.fitness.values = scenario_penalty_fitness(cf)
+    return ind
+
+
+def _scenario_effectiveness(sce, ind):
+    # type: (SUScenario, array.array) -> array.array
     setattr(sce, 'gene_values', ind)
     # 2. update BMP configuration units and related data according to gene_values,
     #      i.e., bmps_info and units_infos
@@ -960,18 +1001,22 @@ def scenario_effectiveness(cf, ind):
     sce.decoding()
     sce.export_to_mongodb()
     # 4. execute the SEIMS-based watershed model and get the timespan
-    sce.execute_seims_model()
+    if not sce.execute_seims_model():
+        print('Run SEIMS model of scenario %d failed%s!' %
+              (ind.id, ' (terminated)' if sce.model.terminated else ''))
+        ind.runtime = sce.model.runtime
+        return ind
     ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = sce.model.GetTimespan()
     # 5. calculate scenario effectiveness and delete intermediate data
-    sce.calculate_economy()
-    sce.calculate_environment()
+    with sce.model.phase('statistics'):
+        sce.calculate_economy()
+        sce.calculate_environment()
     # 6. Export scenarios information
     sce.export_scenario_to_txt()
     sce.export_scenario_to_gtiff()
-    # 7. Clean the intermediate data of current scenario
-    sce.clean(scenario_id=sce.ID, delete_scenario=True, delete_spatial_gfs=True)
     # 8. Assign fitness values
     ind.fitness.values = [sce.economy, sce.environment]
+    ind.run_success = True
 
     return ind
 
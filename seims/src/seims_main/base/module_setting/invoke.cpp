@@ -18,6 +18,7 @@ void Usage(const string& appname, const string& error_msg) {
             " -host <IP> -port <port>"
             " -sce <scenarioID> -cali <calibrationID>"
             " -id <subbasinID>" // For MPI version or testing execution of a single subbasin
+            " -out <outputRoot>"
             // " -grp <groupMethod> -skd <scheduleMethdo> -ts <timeSlices>"
             " -ll <logLevel>"
             "]\n";
@@ -38,6 +39,8 @@ void Usage(const string& appname, const string& error_msg) {
     // cout << "\t<scheduleMethod> can be 0 and 1, which means "
     //         "SPATIAL (default) and TEMPOROSPATIAL, respectively.\n";
     // cout << "\t<timeSlices> should be greater than 1, required when <scheduleMethod> is 1.\n";
+    cout << "\t<outputRoot> is the root directory of outputs, e.g., /dev/shm or node-local disk.\n";
+    cout << "\t\tBy default, outputs are located in <modelPath>(/<configName>).\n";
     cout << "\t<logLevel> is the logging level: Trace, Debug, Info (default), Warning, Error, and Fatal.\n\n";
     exit(1);
 }
@@ -58,6 +61,7 @@ InputArgs* InputArgs::Init(const int argc, const char** argv, bool mpi_version/*
     ScheduleMethod schedule_method = SPATIAL;
     int time_slices = -1;
     string log_level = "Info";
+    string output_root = "";
     /// Parse input arguments.
     int i = 1;
     char* strend = nullptr;
@@ -195,6 +199,15 @@ InputArgs* InputArgs::Init(const int argc, const char** argv, bool mpi_version/*
                 Usage(argv[0]);
                 return nullptr;
             }
+        } else if (StringMatch(argv[i], "-out")) {
+            i++;
+            if (argc > i) {
+                output_root = argv[i];
+                i++;
+            } else {
+                Usage(argv[0]);
+                return nullptr;
+            }
         }
     }
     /// Check the validation of input arguments
@@ -223,7 +236,7 @@ InputArgs* InputArgs::Init(const int argc, const char** argv, bool mpi_version/*
                          scenario_id, calibration_id,
                          subbasin_id,
                          group_method, schedule_method, time_slices,
-                         log_level, mpi_version);
+                         log_level, mpi_version, output_root);
 }
 
 InputArgs::InputArgs(const string& model_path, const string& model_cfgname,
@@ -233,7 +246,8 @@ InputArgs::InputArgs(const string& model_path, const string& model_cfgname,
                      const int scenario_id, const int calibration_id,
                      const int subbasin_id, const GroupMethod grp_mtd,
                      const ScheduleMethod skd_mtd, const int time_slices,
-                     const string& log_level, bool mpi_version/* = false*/)
+                     const string& log_level, bool mpi_version/* = false*/,
+                     const string& output_root/* = ""*/)
     : model_path(model_path), model_cfgname(model_cfgname), output_scene(DB_TAB_OUT_SPATIAL),
       thread_num(thread_num), fdir_mtd(fdir_mtd), lyr_mtd(lyr_mtd),
       host(host), port(port), scenario_id(scenario_id), calibration_id(calibration_id),
@@ -257,7 +271,11 @@ InputArgs::InputArgs(const string& model_path, const string& model_cfgname,
         // -1 means no calibration setting will be used.
         output_scene += ValueToString(calibration_id);
     }
-    if (!model_cfgname.empty()) {
+    if (!output_root.empty()) {
+        // e.g., scratch directory on tmpfs or node-local disk managed by the runner
+        if (!DirectoryExists(output_root)) MakeDirectory(output_root);
+        output_path = output_root + SEP + output_scene + SEP;
+    } else if (!model_cfgname.empty()) {
         output_path = model_path + SEP + model_cfgname + SEP + output_scene + SEP;
     } else {
         output_path = model_path + SEP + output_scene + SEP;
@@ -45,6 +45,7 @@ public:
      * \param[in] time_slices (TESTED) should be greater than 1, required when <skd_mtd> is 1
      * \param[in] log_level logging level, the default is Info
      * \param[in] mpi_version Optional, is running the MPI version?
+     * \param[in] output_root Optional, root directory of outputs instead of model path
      */
     InputArgs(const string& model_path, const string& model_cfgname,
               int thread_num, FlowDirMethod fdir_mtd, LayeringMethod lyr_mtd, 
@@ -52,7 +53,8 @@ public:
               int scenario_id, int calibration_id,
               int subbasin_id, GroupMethod grp_mtd,
               ScheduleMethod skd_mtd, int time_slices,
-              const string& log_level, bool mpi_version = false);
+              const string& log_level, bool mpi_version = false,
+              const string& output_root = "");
 
     /*!
      * \brief Initializer.
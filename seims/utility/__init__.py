@@ -32,3 +32,12 @@ from utility.parse_config import *
 from utility.timeseries_data import *
 from utility.plot import *
 from utility.slurmpy import Slurm
+from utility.eval_cache import EvaluationCache
+from utility.telemetry import RunTelemetry
+from utility.executor import create_executor
+from utility.surrogate import SurrogateModel
+from utility.checkpoint import save_checkpoint, load_checkpoint, restore_log_files
+from utility.convergence import ConvergenceMonitor
+from utility.population_store import PopulationStore
+from utility.background_plot import BackgroundPlotter
+from utility.warm_start import load_archive_genes, revalidate_bounds, revalidate_choices
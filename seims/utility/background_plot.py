@@ -0,0 +1,136 @@
+"""Plotting off the critical path of optimization algorithms, e.g., NSGA-II.
+
+    The plot jobs, i.e., functions with arguments, are pickled and put into a bounded queue
+      which is consumed by a background process, so that the figure rendering does not delay
+      the model evaluations of the next generation. If the queue is full, the job is kept as
+      pending rather than waiting, which is replaced by the later job of the same function or
+      plotted by `close()`, i.e., the plots of the final generation are always available.
+
+      plotter = BackgroundPlotter(frequency=5)  # every 5 generations and the final one
+      for gen in range(1, ngens + 1):
+          ...
+          plotter.submit(gen, plot_pareto_front_single, front, labels, ws, gen, title)
+      plotter.close()  # plot the latest jobs not plotted yet, and wait for the worker
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import multiprocessing
+import pickle
+from collections import OrderedDict
+
+try:
+    from queue import Full
+except ImportError:  # Python 2 without `future` package
+    from Queue import Full
+
+from typing import Optional, Callable, Any
+
+
+def _plot_worker(jobs):
+    """Run the pickled plot jobs until None is received."""
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        name, func, args, kwargs = pickle.loads(job)
+        try:
+            func(*args, **kwargs)
+        except Exception as err:
+            print('Warning: Plot %s failed! %s' % (name, str(err)))
+
+
+class BackgroundPlotter(object):
+    """Plotter of optimization results in a background process with a bounded queue.
+
+    Args:
+        frequency: Plot every `frequency` generations and the final one if positive,
+                   the final one only if 0, and never if negative.
+        background: Plot in a background process, otherwise plot in the current process,
+                    e.g., for the platforms on which matplotlib cannot work in subprocess.
+        queue_size: Maximum plot jobs waiting in the queue.
+    """
+
+    def __init__(self, frequency=1, background=True, queue_size=2):
+        # type: (int, bool, int) -> None
+        self.frequency = frequency
+        self.background = background
+        self.queue_size = max(1, queue_size)
+        self.deferred = 0
+        self._pending = OrderedDict()  # Latest job of each function not plotted yet
+        self._jobs = None  # type: Optional[multiprocessing.Queue]
+        self._worker = None  # type: Optional[multiprocessing.Process]
+
+    @property
+    def enabled(self):
+        # type: (...) -> bool
+        return self.frequency >= 0
+
+    def due(self, gen):
+        # type: (int) -> bool
+        """Whether the plots of the generation should be plotted immediately."""
+        return self.frequency > 0 and gen % self.frequency == 0
+
+    def submit(self, gen, func, *args, **kwargs):
+        # type: (int, Callable, Any, Any) -> bool
+        """Plot by `func(*args, **kwargs)` if the generation is due, returns True if submitted.
+
+        Otherwise, or if the queue is full, the job is kept as pending and plotted by `close()`
+          if it is the latest one of `func`, i.e., the plots of the final generation are always
+          available.
+        """
+        if not self.enabled:
+            return False
+        name = '%s.%s' % (func.__module__, func.__name__)
+        job = (name, func, args, kwargs)
+        if not self.due(gen):
+            self._pending[name] = job
+            return False
+        self._pending.pop(name, None)
+        return self._put(job, block=False)
+
+    def _put(self, job, block):
+        # type: (tuple, bool) -> bool
+        if not self.background:
+            name, func, args, kwargs = job
+            try:
+                func(*args, **kwargs)
+            except Exception as err:
+                print('Warning: Plot %s failed! %s' % (name, str(err)))
+            return True
+        try:
+            # Pickle immediately, since the arguments may be changed by the caller later
+            data = pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL)
+        except (TypeError, AttributeError, pickle.PicklingError) as err:
+            print('Warning: Plot %s cannot be submitted! %s' % (job[0], str(err)))
+            return False
+        if self._worker is None:
+            self._jobs = multiprocessing.Queue(self.queue_size)
+            self._worker = multiprocessing.Process(target=_plot_worker, args=(self._jobs,))
+            self._worker.daemon = True
+            self._worker.start()
+        try:
+            self._jobs.put(data, block=block)
+        except Full:
+            self.deferred += 1
+            self._pending[job[0]] = job
+            print('Warning: Plot %s is deferred since the plot queue is full.' % job[0])
+            return False
+        return True
+
+    def close(self):
+        # type: (...) -> None
+        """Plot the pending jobs, and wait for the background process to finish."""
+        for job in list(self._pending.values()):
+            self._put(job, block=True)
+        self._pending.clear()
+        if self._worker is not None:
+            self._jobs.put(None)
+            self._worker.join()
+            self._jobs.close()
+            self._worker = None
+            self._jobs = None
@@ -0,0 +1,84 @@
+"""Checkpoints of long-running optimizations, e.g., NSGA-II, for resuming killed jobs.
+
+    A checkpoint is a pickled dict of the state after a complete generation, e.g., population,
+      logbook, states of random number generators, and the sizes of append-only log files.
+      It is written atomically, i.e., to a temporary file and then renamed, thus a job killed
+      while writing leaves the previous checkpoint intact. When resuming, the log files are
+      truncated to the recorded sizes to remove the outputs of the incomplete generation.
+
+      save_checkpoint(ckpt_file, {'gen': gen, 'pop': pop, ...}, log_files=[logfile])
+      state = load_checkpoint(ckpt_file)  # None if not existed or damaged
+      if state is not None:
+          restore_log_files(state)
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import os
+import pickle
+import random
+import tempfile
+
+import numpy
+from typing import Optional, Dict, List, Any, AnyStr
+
+CHECKPOINT_LOG_SIZES = '__log_sizes__'
+CHECKPOINT_RANDOM_STATES = '__random_states__'
+
+
+def save_checkpoint(ckpt_file, state, log_files=None):
+    # type: (AnyStr, Dict[AnyStr, Any], Optional[List[AnyStr]]) -> bool
+    """Save state with the states of random number generators and sizes of log files."""
+    state = dict(state)
+    state[CHECKPOINT_RANDOM_STATES] = (random.getstate(), numpy.random.get_state())
+    state[CHECKPOINT_LOG_SIZES] = dict()
+    for log_file in log_files or list():
+        size = os.path.getsize(log_file) if os.path.isfile(log_file) else 0
+        state[CHECKPOINT_LOG_SIZES][log_file] = size
+    ckpt_dir = os.path.dirname(os.path.abspath(ckpt_file))
+    fd, tmpname = tempfile.mkstemp(suffix='.tmp', dir=ckpt_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(ckpt_file):  # os.rename cannot overwrite on Windows
+            os.remove(ckpt_file)
+        os.rename(tmpname, ckpt_file)
+    except (IOError, OSError, TypeError, AttributeError, pickle.PicklingError) as err:
+        print('Warning: Save checkpoint failed! %s' % str(err))
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return False
+    return True
+
+
+def load_checkpoint(ckpt_file, restore_random=True):
+    # type: (AnyStr, bool) -> Optional[Dict[AnyStr, Any]]
+    """Load state from checkpoint and restore the states of random number generators."""
+    if not os.path.isfile(ckpt_file):
+        return None
+    try:
+        with open(ckpt_file, 'rb') as f:
+            state = pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError) as err:
+        print('Warning: Load checkpoint %s failed! %s' % (ckpt_file, str(err)))
+        return None
+    if restore_random and CHECKPOINT_RANDOM_STATES in state:
+        py_state, np_state = state[CHECKPOINT_RANDOM_STATES]
+        random.setstate(py_state)
+        numpy.random.set_state(np_state)
+    return state
+
+
+def restore_log_files(state):
+    # type: (Dict[AnyStr, Any]) -> None
+    """Truncate log files to the sizes recorded in checkpoint."""
+    for log_file, size in state.get(CHECKPOINT_LOG_SIZES, dict()).items():
+        if os.path.isfile(log_file) and os.path.getsize(log_file) > size:
+            with open(log_file, 'rb+') as f:
+                f.truncate(size)
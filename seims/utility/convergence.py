@@ -0,0 +1,91 @@
+"""Convergence criteria and computing budgets of optimization algorithms, e.g., NSGA-II.
+
+    The optimization is supposed to stop before the configured generations if any of the
+      following criteria is satisfied, which is checked after each generation:
+
+      - The relative improvement of hypervolume over the last `window` generations is less
+        than `tolerance`, i.e., the (near) Pareto front has stabilized.
+      - The elapsed wall-clock time exceeds `max_walltime` seconds.
+      - The count of evaluations (i.e., model runs) exceeds `max_evaluations`.
+
+      monitor = ConvergenceMonitor(window=5, tolerance=1.e-3)
+      for gen in range(1, ngens + 1):
+          ...
+          if monitor.update(hypervolume(pop, ref_pt), len(invalid_inds)):
+              print(monitor.stop_reason)
+              break
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from typing import List
+
+
+class ConvergenceMonitor(object):
+    """Monitor of hypervolume history and computing budgets.
+
+    The monitor can be pickled with checkpoints, the elapsed time is accumulated
+      across resumed runs, see `restart()`.
+
+    Args:
+        window: Count of generations to calculate the relative improvement of hypervolume,
+                0 to disable the convergence criterion.
+        tolerance: Minimum relative improvement of hypervolume over `window` generations.
+        max_walltime: Maximum wall-clock time in seconds, 0 for no limit.
+        max_evaluations: Maximum count of evaluations, 0 for no limit.
+    """
+
+    def __init__(self, window=0, tolerance=1.e-3, max_walltime=0., max_evaluations=0):
+        # type: (int, float, float, int) -> None
+        self.window = window
+        self.tolerance = tolerance
+        self.max_walltime = max_walltime
+        self.max_evaluations = max_evaluations
+        self.hypervolumes = list()  # type: List[float]
+        self.evaluations = 0
+        self.elapsed = 0.
+        self.stop_reason = ''
+        self._tick = time.time()
+
+    def restart(self):
+        """Restart the timer, e.g., after resuming from checkpoint."""
+        self._tick = time.time()
+
+    def relative_improvement(self):
+        # type: (...) -> float
+        """Relative improvement of hypervolume over the last `window` generations."""
+        if self.window <= 0 or len(self.hypervolumes) <= self.window:
+            return float('inf')
+        previous = self.hypervolumes[-self.window - 1]
+        improvement = self.hypervolumes[-1] - previous
+        if previous == 0.:
+            return float('inf') if improvement > 0. else 0.
+        return improvement / abs(previous)
+
+    def update(self, hypervolume, nevals=0):
+        # type: (float, int) -> bool
+        """Update by the hypervolume and evaluations of a generation, returns True to stop."""
+        now = time.time()
+        self.elapsed += now - self._tick
+        self._tick = now
+        self.hypervolumes.append(hypervolume)
+        self.evaluations += nevals
+
+        improvement = self.relative_improvement()
+        if improvement < self.tolerance:
+            self.stop_reason = 'Converged: relative improvement of hypervolume over the last ' \
+                               '%d generations is %g, less than %g.' % (self.window, improvement,
+                                                                         self.tolerance)
+        elif 0. < self.max_walltime <= self.elapsed:
+            self.stop_reason = 'Wall-clock budget exhausted: %.1fs elapsed, ' \
+                               'the budget is %.1fs.' % (self.elapsed, self.max_walltime)
+        elif 0 < self.max_evaluations <= self.evaluations:
+            self.stop_reason = 'Evaluation budget exhausted: %d evaluations, ' \
+                               'the budget is %d.' % (self.evaluations, self.max_evaluations)
+        return self.stop_reason != ''
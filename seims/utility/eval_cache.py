@@ -0,0 +1,123 @@
+"""Persistent cache of evaluation results for optimization algorithms, e.g., NSGA-II.
+
+    Individuals whose gene values have already been evaluated (in earlier generations or
+      previous runs) under the same model configuration can reuse the stored results
+      instead of running SEIMS-based model again.
+
+    Each record is stored as a pickle file named by the canonical hash of gene values and
+      model configuration, thus the cache can be shared among SCOOP workers and runs.
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime
+
+from typing import Optional, Dict, List, Union, Any, AnyStr
+from pygeoc.utils import UtilClass
+
+# Model configuration items that vary between individuals and should not be part of the key
+VOLATILE_CONFIG_KEYS = ['scenario_id', 'calibration_id', 'metadata_file', 'telemetry_db',
+                        'scratch_root', 'keep_parsed_only', 'defer_gridfs_cleanup']
+
+
+def _json_default(obj):
+    """Serialize objects that are not JSON serializable by default, e.g., datetime."""
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    return str(obj)
+
+
+def canonical_config(config):
+    # type: (Optional[Dict[AnyStr, Any]]) -> AnyStr
+    """Canonical string of model configuration, volatile items are excluded."""
+    if not config:
+        return ''
+    config = dict((k, v) for k, v in config.items() if k not in VOLATILE_CONFIG_KEYS)
+    return json.dumps(config, sort_keys=True, default=_json_default)
+
+
+def canonical_hash(genes, config_str='', ndigits=10):
+    # type: (List[Union[int, float]], AnyStr, int) -> AnyStr
+    """Hash of gene values (rounded to `ndigits`) and the canonical configuration string."""
+    genes_str = ','.join(repr(round(float(v), ndigits)) for v in genes)
+    return hashlib.sha1(('%s|%s' % (genes_str, config_str)).encode('utf-8')).hexdigest()
+
+
+class EvaluationCache(object):
+    """File-based evaluation cache.
+
+    Args:
+        cache_dir: Directory to store records, created if not existed.
+        config: Model configuration related to the evaluation, e.g.,
+                `ParseSEIMSConfig.ConfigDict` updated with calibration periods.
+        ndigits: Digits to round the float gene values.
+    """
+
+    def __init__(self, cache_dir, config=None, ndigits=10):
+        # type: (AnyStr, Optional[Dict[AnyStr, Any]], int) -> None
+        self.cache_dir = os.path.abspath(cache_dir)
+        UtilClass.mkdir(self.cache_dir)
+        self.config_str = canonical_config(config)
+        self.ndigits = ndigits
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, genes):
+        # type: (List[Union[int, float]]) -> AnyStr
+        return canonical_hash(genes, self.config_str, self.ndigits)
+
+    def record_file(self, key):
+        # type: (AnyStr) -> AnyStr
+        return os.path.join(self.cache_dir, key[:2], '%s.pickle' % key)
+
+    def get(self, genes):
+        # type: (List[Union[int, float]]) -> Optional[Dict[AnyStr, Any]]
+        """Return the stored record of the given gene values, or None if not found."""
+        fname = self.record_file(self.key(genes))
+        record = None
+        if os.path.isfile(fname):
+            try:
+                with open(fname, 'rb') as f:
+                    record = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                record = None  # Damaged record will be overwritten later
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def put(self, genes, record):
+        # type: (List[Union[int, float]], Dict[AnyStr, Any]) -> None
+        """Store the record atomically, i.e., write to a temporary file and then rename."""
+        fname = self.record_file(self.key(genes))
+        UtilClass.mkdir(os.path.dirname(fname))
+        fd, tmpname = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(fname))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(record, f, protocol=2)
+            if os.path.exists(fname):  # os.rename cannot overwrite on Windows
+                os.remove(fname)
+            os.rename(tmpname, fname)
+        except (IOError, OSError) as err:
+            print('Warning: Save evaluation cache failed! %s' % str(err))
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    def __contains__(self, genes):
+        return os.path.isfile(self.record_file(self.key(genes)))
+
+    def summary(self):
+        # type: (...) -> AnyStr
+        total = self.hits + self.misses
+        return 'Evaluation cache: %d hits, %d misses, hit rate %.2f%%' % \
+               (self.hits, self.misses, 100. * self.hits / total if total else 0.)
@@ -0,0 +1,319 @@
+"""Pluggable executors of independent tasks, e.g., evaluations of SEIMS-based models.
+
+    Calibration, scenario analysis, and parameters sensitivity analysis share the same
+      executor selected by the WORKLOAD option of [Computing_Resources] section, see
+      `utility.parse_config.ParseResourceConfig`. Available backends are:
+
+      - scoop: `scoop.futures.map` on multiprocessors or clusters (default), fallback to
+               serial if SCOOP is not available.
+      - process: `concurrent.futures.ProcessPoolExecutor` on the local machine, which avoids the
+                 startup cost and the broker of SCOOP.
+      - slurm: Each task is executed by one task of a Slurm job array.
+      - bash: The same job script as slurm but executed by bash sequentially, for testing.
+      - serial (or cmd): Python build-in map in the current process.
+
+      executor = create_executor(ParseResourceConfig(cf), work_dir)
+      results = executor.map(func, args1, args2)  # the same as list(map(func, args1, args2))
+      executor.shutdown()
+
+    The function and arguments are pickled for all backends except serial, thus the function
+      should be defined at the top level of a module.
+
+    Tasks can also be submitted one by one for asynchronous algorithms, e.g., the steady-state
+      NSGA-II of calibration. Serial and Slurm executors run each submitted task immediately.
+
+      future = executor.submit(func, arg1, arg2)
+      done, not_done = executor.wait_any([future, ...])
+      result = future.result()
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+    - 26-10-18  - st - Submit and wait tasks asynchronously.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import os
+import pickle
+import runpy
+import sys
+import tempfile
+import types
+from shutil import rmtree
+
+from typing import Optional, List, Callable, Iterable, Any, AnyStr
+
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+from pygeoc.utils import UtilClass
+
+from utility.slurmpy import Slurm
+
+SLURM_TASKS_FILE = 'tasks.pickle'
+SLURM_MAIN_FILE = 'main_file.txt'
+SLURM_RESULT_FILE = 'result_%d.pickle'
+
+
+def run_command(cmd):
+    # type: (AnyStr) -> Optional[List[AnyStr]]
+    """Run a shell command and return the outputs, None if failed."""
+    try:
+        return UtilClass.run_command(cmd)
+    except Exception as err:
+        print('Run command failed! %s\n  %s' % (str(err), cmd))
+        return None
+
+
+class CompletedFuture(object):
+    """Future-like object of a task that has been executed."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self._result
+
+
+class Executor(object):
+    """Serial executor, and the base class of other executors."""
+    name = 'serial'
+
+    def __init__(self, max_workers=0):
+        # type: (int) -> None
+        self.max_workers = max_workers  # 0 means determined by the backend
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def map(self, func, *iterables):
+        # type: (Callable, Iterable) -> List[Any]
+        """Apply `func` to every item of iterables, returns the results in order."""
+        return list(map(func, *iterables))
+
+    def submit(self, func, *args):
+        # type: (Callable, Any) -> Any
+        """Submit a task, returns a future-like object that has `done()` and `result()`."""
+        return CompletedFuture(self.map(func, *[[arg] for arg in args])[0])
+
+    def wait_any(self, futures):
+        # type: (List[Any]) -> (List[Any], List[Any])
+        """Wait until any of the futures is done, returns the done and not done futures."""
+        done = [fut for fut in futures if fut.done()]
+        return done, [fut for fut in futures if fut not in done]
+
+    def run_commands(self, commands, name='commands'):
+        # type: (List[AnyStr], AnyStr) -> List[Optional[List[AnyStr]]]
+        """Execute shell commands, e.g., `MainSEIMS.CommandString`, returns the outputs."""
+        return self.map(run_command, commands)
+
+    def shutdown(self):
+        pass
+
+
+class ProcessExecutor(Executor):
+    """Executor based on `concurrent.futures.ProcessPoolExecutor` of the local machine."""
+    name = 'process'
+
+    def __init__(self, max_workers=0):
+        # type: (int) -> None
+        super(ProcessExecutor, self).__init__(max_workers)
+        self.pool = None
+
+    def _pool(self):
+        if self.pool is None:  # Created lazily, so that workers are forked with the latest state
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(self.max_workers if self.max_workers > 0 else None)
+        return self.pool
+
+    def map(self, func, *iterables):
+        return list(self._pool().map(func, *iterables))
+
+    def submit(self, func, *args):
+        return self._pool().submit(func, *args)
+
+    def wait_any(self, futures):
+        from concurrent.futures import wait, FIRST_COMPLETED
+        done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+        return list(done), list(not_done)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+class ScoopExecutor(Executor):
+    """Executor based on `scoop.futures.map`, the number of workers is determined by SCOOP."""
+    name = 'scoop'
+
+    def map(self, func, *iterables):
+        try:  # parallel on multiprocessors or clusters using SCOOP
+            from scoop import futures
+        except ImportError:  # serial
+            return list(map(func, *iterables))
+        return list(futures.map(func, *iterables))
+
+    def submit(self, func, *args):
+        try:
+            from scoop import futures
+        except ImportError:
+            return CompletedFuture(func(*args))
+        return futures.submit(func, *args)
+
+    def wait_any(self, futures_list):
+        if all(isinstance(fut, CompletedFuture) for fut in futures_list):
+            return list(futures_list), list()
+        from scoop import futures
+        done, not_done = futures.wait(futures_list, return_when=futures.FIRST_COMPLETED)
+        return list(done), list(not_done)
+
+
+class SlurmExecutor(Executor):
+    """Executor based on Slurm.
+
+    `map()` submits a job array with one task per item and waits for it. The function and
+      arguments are pickled into a temporary directory under `scripts_dir`, and each task
+      loads them, executes `func` and pickles the result. If the objects to be unpickled are
+      created when the main script is imported, e.g., classes created by `deap.creator`,
+      the main script is executed (without its `if __name__ == '__main__'` block) before.
+
+    `run_commands()` submits one job that runs all commands simultaneously on `nnodes` nodes.
+
+    Args:
+        max_workers: Maximum tasks of a job array running simultaneously, 0 for no limit.
+        partition: Nodes partition.
+        nnodes: Nodes count of the job running commands.
+        ncores_pertask: Cores allocated to each task of a job array.
+        scripts_dir: Directory of job scripts and temporary data.
+        log_dir: Directory of the logs of jobs.
+        submit: `sbatch`, or `bash` for testing.
+        main_file: The main script to be executed before unpickling, default is the
+                   `__main__` module of the current process.
+    """
+    name = 'slurm'
+
+    def __init__(self, max_workers=0, partition='', nnodes=1, ncores_pertask=1,
+                 scripts_dir='slurm-scripts', log_dir='logs', submit='sbatch', main_file=None):
+        # type: (int, AnyStr, int, int, AnyStr, AnyStr, AnyStr, Optional[AnyStr]) -> None
+        super(SlurmExecutor, self).__init__(max_workers)
+        self.partition = partition
+        self.nnodes = nnodes
+        self.ncores_pertask = ncores_pertask
+        self.scripts_dir = os.path.abspath(scripts_dir)
+        self.log_dir = os.path.abspath(log_dir)
+        self.submit = submit
+        if main_file is None:
+            main_file = getattr(sys.modules['__main__'], '__file__', '')
+        self.main_file = os.path.abspath(main_file) if main_file else ''
+        if self.submit == 'bash':
+            self.name = 'bash'
+
+    def _job(self, name, slurm_kwargs):
+        if self.partition:
+            slurm_kwargs['partition'] = self.partition
+        return Slurm(name, slurm_kwargs, scripts_dir=self.scripts_dir, log_dir=self.log_dir,
+                     bash_strict=self.submit != 'sbatch')
+
+    def map(self, func, *iterables):
+        items = list(zip(*iterables))
+        if not items:
+            return list()
+        UtilClass.mkdir(self.scripts_dir)
+        task_dir = tempfile.mkdtemp(prefix='map_', dir=self.scripts_dir)
+        with open(os.path.join(task_dir, SLURM_MAIN_FILE), 'w') as f:
+            f.write(self.main_file)
+        with open(os.path.join(task_dir, SLURM_TASKS_FILE), 'wb') as f:
+            pickle.dump({'func': func, 'items': items}, f, protocol=2)
+
+        task_cmd = '%s %s %s' % (sys.executable, os.path.abspath(__file__), task_dir)
+        array = '0-%d' % (len(items) - 1)
+        if self.max_workers > 0:
+            array += '%%%d' % self.max_workers
+        job = self._job('map-%s' % getattr(func, '__name__', 'func'),
+                        {'W': '',  # -W, --wait. Do not exit until all jobs terminate
+                         'array': array, 'ntasks': 1, 'cpus-per-task': self.ncores_pertask})
+        if self.submit == 'sbatch':
+            job.run('%s $SLURM_ARRAY_TASK_ID' % task_cmd, _cmd=self.submit, name_addition='map')
+        else:
+            job.run('\n'.join('%s %d' % (task_cmd, i) for i in range(len(items))),
+                    _cmd=self.submit, name_addition='map')
+
+        results = list()
+        for i in range(len(items)):
+            result_file = os.path.join(task_dir, SLURM_RESULT_FILE % i)
+            if not os.path.isfile(result_file):
+                raise RuntimeError('The result of task %d of Slurm job array is not found! '
+                                   'Please check the logs in %s.' % (i, self.log_dir))
+            with open(result_file, 'rb') as f:
+                results.append(pickle.load(f))
+        rmtree(task_dir, ignore_errors=True)
+        return results
+
+    def run_commands(self, commands, name='commands'):
+        if not commands:
+            return list()
+        job = self._job(name, {'W': '',  # -W, --wait. Do not exit until all jobs terminate
+                               'N': self.nnodes})  # -N, --nodes. Request N nodes to the job
+        if self.submit == 'sbatch':
+            job.run('%s &\nwait' % ' &\n'.join(commands), _cmd=self.submit, name_addition=name)
+        else:
+            job.run('%s\nwait' % '\n'.join(commands), _cmd=self.submit, name_addition=name)
+        return [None] * len(commands)  # The outputs are written to the logs of job
+
+
+def run_slurm_task(task_dir, index):
+    # type: (AnyStr, int) -> None
+    """Execute one task of `SlurmExecutor.map()`, i.e., the entrance of each task of job array."""
+    with open(os.path.join(task_dir, SLURM_MAIN_FILE), 'r') as f:
+        main_file = f.read().strip()
+    if main_file and os.path.isfile(main_file):
+        # Objects defined in the main script are pickled as attributes of `__main__`
+        main_module = types.ModuleType(str('__main__'))
+        main_module.__dict__.update(runpy.run_path(main_file, run_name='__seims_worker__'))
+        sys.modules['__main__'] = main_module
+    with open(os.path.join(task_dir, SLURM_TASKS_FILE), 'rb') as f:
+        tasks = pickle.load(f)
+    result = tasks['func'](*tasks['items'][index])
+    fd, tmpname = tempfile.mkstemp(suffix='.tmp', dir=task_dir)
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(result, f, protocol=2)
+    os.rename(tmpname, os.path.join(task_dir, SLURM_RESULT_FILE % index))
+
+
+def create_executor(resource, work_dir='', ncores_pertask=1, scripts_dir='', log_dir=''):
+    # type: (Any, AnyStr, int, AnyStr, AnyStr) -> Executor
+    """Create executor according to `ParseResourceConfig`.
+
+    Args:
+        resource: `ParseResourceConfig` object.
+        work_dir: Directory to store the scripts and logs of Slurm jobs.
+        ncores_pertask: Cores required by each task, e.g., processes x threads of SEIMS.
+        scripts_dir: Directory of Slurm job scripts, default is `work_dir`/slurm_scripts.
+        log_dir: Directory of Slurm job logs, default is `work_dir`/slurm_logs.
+    """
+    workload = resource.workload.lower()
+    if workload == 'process':
+        return ProcessExecutor(resource.max_workers)
+    if workload in ['slurm', 'bash']:
+        if not work_dir:
+            work_dir = os.getcwd()
+        return SlurmExecutor(resource.max_workers, resource.partition, resource.nnodes,
+                             max(1, ncores_pertask),
+                             scripts_dir=scripts_dir or os.path.join(work_dir, 'slurm_scripts'),
+                             log_dir=log_dir or os.path.join(work_dir, 'slurm_logs'),
+                             submit='sbatch' if workload == 'slurm' else 'bash')
+    if workload in ['serial', 'cmd']:
+        return Executor(resource.max_workers)
+    return ScoopExecutor(resource.max_workers)
+
+
+if __name__ == '__main__':
+    run_slurm_task(sys.argv[1], int(sys.argv[2]))
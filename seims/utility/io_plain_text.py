@@ -10,14 +10,20 @@ from __future__ import absolute_import, unicode_literals
 
 import json
 from io import open
+import mmap
 import os
+import re
 from collections import OrderedDict
 from datetime import datetime
 
-from typing import List, Dict, Union, AnyStr
+from typing import List, Dict, Union, Optional, AnyStr
+import numpy
 from numpy import ndarray as np_array
 from pygeoc.utils import StringClass, UtilClass, FileClass
 
+# Header line of each subbasin block in time series outputs, e.g., `Subbasin: 4`
+SUBBASIN_HEADER = re.compile(br'^(?:Subbasin|Watershed):[ \t]*(\d*)[ \t\r]*$', re.M)
+
 
 class SpecialJsonEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -60,6 +66,108 @@ def read_data_items_from_txt(txt_file):
     return data_items
 
 
+def read_subbasin_block_from_txt(txt_file, subbsn_id, use_mmap=False):
+    # type: (AnyStr, int, bool) -> Optional[AnyStr]
+    """Read the text block of the given subbasin from a time series output file.
+
+    The block starts after the line `Subbasin: <subbsn_id>` and ends before the next
+      `Subbasin: ` or `Watershed: ` line. If `use_mmap` is True, the file is memory-mapped
+      and only the matched block will be decoded.
+    """
+    with open(txt_file, 'rb') as f:
+        if use_mmap:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+        try:
+            block = None
+            for m in SUBBASIN_HEADER.finditer(buf):
+                if block is not None:
+                    block = buf[block:m.start()]
+                    break
+                if m.group(1) and int(m.group(1)) == subbsn_id:
+                    block = m.end()
+            if isinstance(block, int):
+                block = buf[block:]
+        finally:
+            if use_mmap:
+                buf.close()
+    if block is None:
+        return None
+    return block.decode('utf-8', 'ignore')
+
+
+def read_simulation_columns_from_txt(ws,  # type: AnyStr
+                                     plot_vars,  # type: List[AnyStr]
+                                     subbsnID,  # type: int
+                                     stime=None,  # type: Optional[datetime]
+                                     etime=None,  # type: Optional[datetime]
+                                     use_mmap=False  # type: bool
+                                     ):
+    # type: (...) -> (List[AnyStr], np_array, np_array)
+    """Read simulation data of all variables as columns according to subbasin ID.
+
+    Each line of the time series output is `YYYY-MM-DD HH:MM:SS value`, so the datetime is
+      sliced by fixed positions and parsed by numpy as `datetime64[s]` instead of being
+      parsed line by line.
+
+    Returns:
+        1. Matched variable names, [var1, var2, ...]
+        2. Sorted UTCDATETIME as `numpy.datetime64[s]` array with the shape of (n,)
+        3. Simulation values as float array with the shape of (n, len(var names)),
+           `numpy.nan` means the date is missing in the corresponding variable.
+    """
+    vars_existed = list()
+    vars_dates = list()
+    vars_values = list()
+    for v in plot_vars:
+        txtfile = ws + os.path.sep + v + '.txt'
+        if not FileClass.is_file_exists(txtfile):
+            print('WARNING: Simulation variable file: %s is not existed!' % txtfile)
+            continue
+        block = read_subbasin_block_from_txt(txtfile, subbsnID, use_mmap=use_mmap)
+        if not block:
+            continue
+        date_strs = list()
+        value_strs = list()
+        for line in block.splitlines():
+            if len(line) < 21 or line[4] != '-' or line[13] != ':' or '#' in line:
+                continue
+            value_str = line[19:].strip()
+            if not value_str or ' ' in value_str:  # multiple values of one line are not supported
+                continue
+            date_strs.append('%sT%s' % (line[:10], line[11:19]))
+            value_strs.append(value_str)
+        if not date_strs:
+            continue
+        dates = numpy.array(date_strs, dtype='datetime64[s]')
+        values = numpy.array(value_strs).astype(numpy.float64)
+        sel = numpy.ones(dates.shape, dtype=bool)
+        if stime is not None:
+            sel &= dates >= numpy.datetime64(stime, 's')
+        if etime is not None:
+            sel &= dates <= numpy.datetime64(etime, 's')
+        if not sel.any():
+            continue
+        vars_existed.append(v)
+        vars_dates.append(dates[sel])
+        vars_values.append(values[sel])
+
+    if not vars_existed:
+        return vars_existed, numpy.array([], dtype='datetime64[s]'), numpy.empty((0, 0))
+    all_dates = vars_dates[0]
+    for dates in vars_dates[1:]:
+        if dates.shape != all_dates.shape or (dates != all_dates).any():
+            all_dates = numpy.union1d(all_dates, dates)
+    all_dates = numpy.unique(all_dates)
+    all_values = numpy.full((len(all_dates), len(vars_existed)), numpy.nan)
+    for i, (dates, values) in enumerate(zip(vars_dates, vars_values)):
+        all_values[numpy.searchsorted(all_dates, dates), i] = values
+    return vars_existed, all_dates, all_values
+
+
 def read_simulation_from_txt(ws,  # type: AnyStr
                              plot_vars,  # type: List[AnyStr]
                              subbsnID,  # type: int
@@ -74,37 +182,9 @@ def read_simulation_from_txt(ws,  # type: AnyStr
         2. Simulation data dict of all plotted variables, with UTCDATETIME.
            {Datetime: [value_of_var1, value_of_var2, ...], ...}
     """
-    plot_vars_existed = list()
-    sim_data_dict = OrderedDict()
-    for i, v in enumerate(plot_vars):
-        txtfile = ws + os.path.sep + v + '.txt'
-        if not FileClass.is_file_exists(txtfile):
-            print('WARNING: Simulation variable file: %s is not existed!' % txtfile)
-            continue
-        data_items = read_data_items_from_txt(txtfile)
-        found = False
-        data_available = False
-        for item in data_items:
-            item_vs = StringClass.split_string(item[0], ' ', elim_empty=True)
-            if len(item_vs) == 2:
-                if int(item_vs[1]) == subbsnID and not found:
-                    found = True
-                elif int(item_vs[1]) != subbsnID and found:
-                    break
-            if not found:
-                continue
-            if len(item_vs) != 3:
-                continue
-            date_str = '%s %s' % (item_vs[0], item_vs[1])
-            sim_datetime = StringClass.get_datetime(date_str, "%Y-%m-%d %H:%M:%S")
-
-            if stime <= sim_datetime <= etime:
-                if sim_datetime not in sim_data_dict:
-                    sim_data_dict[sim_datetime] = list()
-                sim_data_dict[sim_datetime].append(float(item_vs[2]))
-                data_available = True
-        if data_available:
-            plot_vars_existed.append(v)
+    plot_vars_existed, dates, values = read_simulation_columns_from_txt(ws, plot_vars, subbsnID,
+                                                                        stime, etime)
+    sim_data_dict = OrderedDict(zip(dates.astype(datetime).tolist(), values.tolist()))
 
     print('Read simulation from %s to %s done.' % (stime.strftime('%c'),
                                                    etime.strftime('%c')))
@@ -5,6 +5,10 @@
     @changelog:
     - 18-10-29  - lj - Extract from other packages.
     - 23-03-29  - lj - ReWrite check_config_option and get_option_value functions.
+    - 26-10-18  - st - Add --resume argument and checkpoint options of NSGA-II.
+    - 26-10-18  - st - Add PopulationStore option of NSGA-II.
+    - 26-10-18  - st - Add plot frequency and background plotting options of NSGA-II.
+    - 26-10-18  - st - Add warm start options of NSGA-II.
 """
 from __future__ import absolute_import, unicode_literals
 
@@ -30,6 +34,8 @@ def get_optimization_config(desc='The help information is supposed not be empty.
     # add mutually group
     psa_group = parser.add_mutually_exclusive_group()
     psa_group.add_argument('-nsga2', action='store_true', help='Run NSGA-II method')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume optimization from the last checkpoint')
     # parse arguments
     args = parser.parse_args()
     ini_file = args.ini
@@ -40,6 +46,10 @@ def get_optimization_config(desc='The help information is supposed not be empty.
         raise ImportError('Configuration file is not existed: %s' % ini_file)
     cf = ConfigParser()
     cf.read(ini_file)
+    if args.resume:  # Override the Resume option of NSGA2 section, see `ParseNSGA2Config`
+        if not cf.has_section('NSGA2'):
+            cf.add_section('NSGA2')
+        cf.set('NSGA2', 'resume', 'True')
     return cf, psa_mtd
 
 
@@ -130,6 +140,45 @@ class ParseNSGA2Config(object):
 
         if self.npop % 4 != 0:
             raise ValueError('PopulationSize must be a multiple of 4.')
+        # Reuse the evaluated results of the same gene values, see `utility.eval_cache`
+        self.eval_cache = get_option_value(cf, 'NSGA2', 'evaluationcache', bool, False)
+        self.eval_cache_dir = get_option_value(cf, 'NSGA2', 'evaluationcachedir')
+        if not self.eval_cache_dir:
+            self.eval_cache_dir = wp + os.path.sep + 'eval_cache'
+        elif not os.path.isabs(self.eval_cache_dir):
+            self.eval_cache_dir = wp + os.path.sep + self.eval_cache_dir
+        # Terminate the model runs that last longer than `termination_ratio` times of the median
+        #   runtime of previous successful runs, regardless of their objectives
+        self.early_termination = get_option_value(cf, 'NSGA2', 'earlytermination', bool, False)
+        self.termination_ratio = get_option_value(cf, 'NSGA2', 'terminationratio', float, 3.)
+        # Failure isolation of model runs, i.e., wall-clock timeout (seconds, 0 for no limit),
+        #   retries of the failed (not timed out) runs, and the fitness values assigned to the
+        #   individuals whose model runs keep failing (empty for the worst objective values)
+        self.run_timeout = get_option_value(cf, 'NSGA2', 'runtimeout', float, 0.)
+        self.run_retries = get_option_value(cf, 'NSGA2', 'runretries', int, 0)
+        self.penalty_fitness = list()  # type: List[float]
+        penalty_str = get_option_value(cf, 'NSGA2', 'penaltyfitness')
+        if penalty_str:
+            self.penalty_fitness = StringClass.extract_numeric_values_from_string(penalty_str)
+        # Asynchronous steady-state evolution, i.e., an offspring is generated and evaluated as
+        #   soon as any evaluation finishes, `ngens * npop` offspring are evaluated in total
+        self.steady_state = get_option_value(cf, 'NSGA2', 'steadystate', bool, False)
+        # Surrogate-assisted pre-screening of offspring, i.e., `surrogate_ratio` times of
+        #   offspring are generated and only the most promising ones ranked by the surrogate
+        #   (rbf or gp, see `utility.surrogate`) trained on evaluated individuals are evaluated
+        self.surrogate = get_option_value(cf, 'NSGA2', 'surrogate').lower()
+        if self.surrogate in ['', 'none', 'false']:
+            self.surrogate = ''
+        self.surrogate_ratio = get_option_value(cf, 'NSGA2', 'surrogateratio', int, 2)
+        self.surrogate_min_samples = get_option_value(cf, 'NSGA2', 'surrogateminsamples', int, 0)
+        if self.surrogate_min_samples <= 0:
+            self.surrogate_min_samples = self.npop
+        # Convergence criteria and budgets checked after each generation, the optimization stops
+        #   before `ngens` generations if any is satisfied, see `utility.convergence`
+        self.conv_window = get_option_value(cf, 'NSGA2', 'convergencewindow', int, 0)
+        self.conv_tolerance = get_option_value(cf, 'NSGA2', 'convergencetolerance', float, 1.e-3)
+        self.max_walltime = get_option_value(cf, 'NSGA2', 'maxwalltime', float, 0.)
+        self.max_evaluations = get_option_value(cf, 'NSGA2', 'maxevaluations', int, 0)
 
         if '%d' not in dir_template:
             dir_template += '_Gen_%d_Pop_%d'
@@ -146,6 +195,34 @@ class ParseNSGA2Config(object):
         self.logbookfile = self.out_dir + os.path.sep + 'logbook.txt'
         self.simdata_dir = self.out_dir + os.path.sep + 'simulated_data'
         UtilClass.mkdir(self.simdata_dir)
+        # Store the population details of each generation as a columnar shard in `simdata_dir`
+        #   rather than pickle and json files, see `utility.population_store`
+        self.population_store = get_option_value(cf, 'NSGA2', 'populationstore', bool, False)
+        # Plot every `plot_frequency` generations and the final one (0 for the final one only,
+        #   negative to disable), in a background process with a bounded queue if
+        #   `background_plot`, see `utility.background_plot`
+        self.plot_frequency = get_option_value(cf, 'NSGA2', 'plotfrequency', int, 1)
+        self.background_plot = get_option_value(cf, 'NSGA2', 'backgroundplot', bool, True)
+        self.plot_queue_size = get_option_value(cf, 'NSGA2', 'plotqueuesize', int, 2)
+        # Save checkpoint every `checkpoint_interval` generations (0 to disable), and resume
+        #   from the last checkpoint if `resume` (or --resume argument), see `utility.checkpoint`
+        self.checkpoint_interval = get_option_value(cf, 'NSGA2', 'checkpointinterval', int, 1)
+        self.checkpoint_file = self.out_dir + os.path.sep + 'checkpoint.pickle'
+        self.resume = get_option_value(cf, 'NSGA2', 'resume', bool, False)
+        # Warm start from the archive of a previous run, i.e., checkpoint, population store, or
+        #   runtime.log, of the generation `warm_start_gen` (negative for the last one). The gene
+        #   values out of the current bounds are clipped or dropped according to
+        #   `warm_start_bounds`, see `utility.warm_start`. The evaluated individuals in checkpoint
+        #   are put into the evaluation cache if `warm_start_cache`, which is only valid if the
+        #   model and data are unchanged since the previous run.
+        self.warm_start_file = get_option_value(cf, 'NSGA2', 'warmstartfile')
+        if self.warm_start_file and not os.path.isabs(self.warm_start_file):
+            self.warm_start_file = wp + os.path.sep + self.warm_start_file
+        self.warm_start_gen = get_option_value(cf, 'NSGA2', 'warmstartgeneration', int, -1)
+        self.warm_start_bounds = get_option_value(cf, 'NSGA2', 'warmstartbounds').lower()
+        if self.warm_start_bounds not in ['clip', 'drop']:
+            self.warm_start_bounds = 'clip'
+        self.warm_start_cache = get_option_value(cf, 'NSGA2', 'warmstartcache', bool, False)
 
 
 class ParseResourceConfig(object):
@@ -154,7 +231,7 @@ class ParseResourceConfig(object):
     def __init__(self, cf=None):
         # type: (Optional[ConfigParser]) -> None
         """Get parameters from ConfigParser object."""
-        self.workload = 'scoop'  # type: AnyStr # available: scoop, slurm
+        self.workload = 'scoop'  # type: AnyStr # available: scoop, process, slurm, bash, serial
         self.partition = ''  # type: AnyStr
         self.nnodes = -1  # type: int  # computing nodes required
         self.ntasks_pernode = -1  # type: int  # maximum tasks (process of mpi or task of scoop)
@@ -168,3 +245,6 @@ class ParseResourceConfig(object):
         self.nnodes = get_option_value(cf, res_sec, 'nnodes', int, 1)
         self.ntasks_pernode = get_option_value(cf, res_sec, 'ntasks_pernode', int, 1)
         self.ncores_pernode = get_option_value(cf, res_sec, 'ncores_pernode', int, 1)
+        # Maximum tasks running simultaneously, i.e., workers of process pool or tasks of Slurm
+        #   job array, 0 means determined by the executor, see `utility.executor`
+        self.max_workers = get_option_value(cf, res_sec, 'max_workers', int, 0)
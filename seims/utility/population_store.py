@@ -0,0 +1,176 @@
+"""Columnar and append-only store of population details of optimization algorithms, e.g., NSGA-II.
+
+    Each generation is stored as a `.npz` shard (`gen<N>_population.npz`), which holds the
+      columns of the population, i.e., arrays with one row per individual, e.g., gene values,
+      objective values, and simulated time series, and some metadata, e.g., variable names.
+      Shards are written atomically and never modified except that the shard of a generation
+      is replaced if the generation is stored again, e.g., resumed from checkpoint.
+
+      store = PopulationStore(outdir)
+      dates, series = stack_timeseries([ind.sim.data for ind in pop])
+      store.append(gen, {'id': ids, 'genes': genes, 'sim': series},
+                   meta={'sim_vars': sim_vars, 'dates': dates})
+      genes = store.load(gen, ['genes'])['genes']  # only the requested arrays are read
+      all_genes = store.load_all(['genes'])['genes']  # rows of all generations
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import glob
+import os
+import re
+import tempfile
+
+import numpy
+from typing import Optional, Dict, List, Tuple, Sequence, Any, AnyStr
+
+SHARD_NAME = 'gen%d_population.npz'
+SHARD_PATTERN = re.compile(r'^gen(\d+)_population\.npz$')
+META_PREFIX = 'meta_'
+
+
+def stack_timeseries(series_list):
+    # type: (Sequence[Any]) -> Tuple[numpy.ndarray, numpy.ndarray]
+    """Stack time series of individuals, e.g., `TimeseriesArray`, to a 3D array.
+
+    The dates of the first non-empty series are used, the values of other series are matched
+      by dates and NaN is filled if missing, e.g., for the failed model runs.
+
+    Returns:
+        dates: `datetime64[s]` array with the shape of (ntime,)
+        values: float array with the shape of (nind, ntime, nvars)
+    """
+    ref = None
+    for ts in series_list:
+        if ts is not None and len(ts.dates) > 0:
+            ref = ts
+            break
+    if ref is None:
+        return numpy.array([], dtype='datetime64[s]'), numpy.empty((len(series_list), 0, 0))
+    dates = numpy.asarray(ref.dates, dtype='datetime64[s]')
+    values = numpy.full((len(series_list), len(dates), ref.data.shape[1]), numpy.nan)
+    for i, ts in enumerate(series_list):
+        if ts is None or len(ts.dates) == 0:
+            continue
+        ncols = min(ts.data.shape[1], values.shape[2])
+        if len(ts.dates) == len(dates) and numpy.array_equal(ts.dates, dates):
+            values[i, :, :ncols] = ts.data[:, :ncols]
+            continue
+        idx = numpy.searchsorted(dates, ts.dates)
+        idx[idx >= len(dates)] = 0
+        matched = dates[idx] == ts.dates
+        values[i, idx[matched], :ncols] = ts.data[matched, :ncols]
+    return dates, values
+
+
+class PopulationStore(object):
+    """Append-only store of population details as per-generation `.npz` shards.
+
+    Args:
+        store_dir: Directory of the shards.
+        compress: Compress the shards by `numpy.savez_compressed`, which reduces the disk
+                  footprint at the cost of slightly longer writing time.
+    """
+
+    def __init__(self, store_dir, compress=True):
+        # type: (AnyStr, bool) -> None
+        self.store_dir = store_dir
+        self.compress = compress
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+    def shard_file(self, gen):
+        # type: (int) -> AnyStr
+        return self.store_dir + os.path.sep + SHARD_NAME % gen
+
+    def generations(self):
+        # type: (...) -> List[int]
+        """Sorted generation numbers of the stored shards."""
+        gens = list()
+        for fname in glob.glob(self.store_dir + os.path.sep + 'gen*_population.npz'):
+            matched = SHARD_PATTERN.match(os.path.basename(fname))
+            if matched:
+                gens.append(int(matched.group(1)))
+        return sorted(gens)
+
+    def append(self, gen, columns, meta=None):
+        # type: (int, Dict[AnyStr, Any], Optional[Dict[AnyStr, Any]]) -> AnyStr
+        """Write the shard of a generation.
+
+        Args:
+            gen: Generation number.
+            columns: Arrays with the same length of the first dimension, i.e., individuals.
+            meta: Metadata of the generation, e.g., variable names and dates.
+
+        Returns:
+            Path of the shard.
+        """
+        arrays = dict()
+        nrows = None
+        for name, values in columns.items():
+            arrays[name] = numpy.asarray(values)
+            if nrows is None:
+                nrows = arrays[name].shape[0]
+            elif arrays[name].shape[0] != nrows:
+                raise ValueError('The column %s has %d rows, while the others have %d!' %
+                                 (name, arrays[name].shape[0], nrows))
+        for name, values in (meta or dict()).items():
+            arrays[META_PREFIX + name] = numpy.asarray(values)
+        shard = self.shard_file(gen)
+        fd, tmpname = tempfile.mkstemp(suffix='.tmp', dir=self.store_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if self.compress:
+                    numpy.savez_compressed(f, **arrays)
+                else:
+                    numpy.savez(f, **arrays)
+            if os.name == 'nt' and os.path.exists(shard):  # os.rename cannot overwrite on Windows
+                os.remove(shard)
+            os.rename(tmpname, shard)
+        except Exception:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        return shard
+
+    def load(self, gen, fields=None):
+        # type: (int, Optional[List[AnyStr]]) -> Dict[AnyStr, numpy.ndarray]
+        """Load the columns and metadata (with `meta_` prefix) of a generation.
+
+        Only the given fields are read if specified, e.g., ['genes', 'meta_dates'].
+        """
+        with numpy.load(self.shard_file(gen), allow_pickle=False) as npz:
+            names = npz.files if fields is None else [n for n in fields if n in npz.files]
+            return dict((name, npz[name]) for name in names)
+
+    def load_meta(self, gen):
+        # type: (int) -> Dict[AnyStr, numpy.ndarray]
+        """Load the metadata of a generation, without the prefix."""
+        with numpy.load(self.shard_file(gen), allow_pickle=False) as npz:
+            return dict((name[len(META_PREFIX):], npz[name]) for name in npz.files
+                        if name.startswith(META_PREFIX))
+
+    def load_all(self, fields, gens=None):
+        # type: (List[AnyStr], Optional[List[int]]) -> Dict[AnyStr, numpy.ndarray]
+        """Load and concatenate the columns of generations (all by default).
+
+        A `gen` column is added to identify the generation of each row.
+        """
+        if gens is None:
+            gens = self.generations()
+        parts = dict((name, list()) for name in fields)
+        parts['gen'] = list()
+        for gen in gens:
+            loaded = self.load(gen, fields)
+            nrows = 0
+            for name in fields:
+                if name in loaded:
+                    parts[name].append(loaded[name])
+                    nrows = loaded[name].shape[0]
+            parts['gen'].append(numpy.full(nrows, gen, dtype=int))
+        return dict((name, numpy.concatenate(values) if values else numpy.array([]))
+                    for name, values in parts.items())
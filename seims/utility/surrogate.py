@@ -0,0 +1,203 @@
+"""Surrogate models for pre-screening offspring of optimization algorithms, e.g., NSGA-II.
+
+    The surrogate is trained on the archive of evaluated individuals (gene values and fitness
+      values), and ranks candidate offspring by predicted fitness values, so that only the most
+      promising ones are evaluated by the SEIMS-based model, e.g.,
+
+      surrogate = SurrogateModel('rbf')
+      surrogate.add(ind, ind.fitness.values)  # for each evaluated individual
+      surrogate.fit()
+      selected_idx = surrogate.prescreen(candidates, n, weights=(1., -1.))
+
+    Available methods:
+
+      - rbf: Cubic radial basis function interpolation with a linear polynomial tail.
+      - gp: Gaussian process regression with squared exponential kernel (mean prediction).
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import numpy
+
+from typing import Optional, List, Sequence, Union, AnyStr
+
+SURROGATE_METHODS = ['rbf', 'gp']
+
+
+def nondominated_ranks(values):
+    # type: (numpy.ndarray) -> numpy.ndarray
+    """Non-dominated front index (0 is the best) of each row, all objectives are maximized."""
+    num = values.shape[0]
+    ranks = numpy.full(num, -1, dtype=int)
+    remained = numpy.arange(num)
+    front = 0
+    while remained.size > 0:
+        sub = values[remained]
+        # dominated[i] is True if any other row dominates row i
+        ge = (sub[:, None, :] >= sub[None, :, :]).all(axis=2)
+        gt = (sub[:, None, :] > sub[None, :, :]).any(axis=2)
+        dominated = (ge & gt).any(axis=0)
+        ranks[remained[~dominated]] = front
+        remained = remained[dominated]
+        front += 1
+    return ranks
+
+
+def crowding_distances(values):
+    # type: (numpy.ndarray) -> numpy.ndarray
+    """Crowding distance of each row within the same set of solutions."""
+    num, nobj = values.shape
+    dists = numpy.zeros(num)
+    if num < 3:
+        dists[:] = numpy.inf
+        return dists
+    for j in range(nobj):
+        order = numpy.argsort(values[:, j])
+        span = values[order[-1], j] - values[order[0], j]
+        dists[order[0]] = dists[order[-1]] = numpy.inf
+        if span <= 0.:
+            continue
+        dists[order[1:-1]] += (values[order[2:], j] - values[order[:-2], j]) / span
+    return dists
+
+
+class SurrogateModel(object):
+    """Surrogate model of all objectives trained on the evaluated individuals.
+
+    Args:
+        method: 'rbf' or 'gp', see `SURROGATE_METHODS`.
+        max_samples: Only the latest `max_samples` samples are used for training, since the
+                     training cost grows cubically.
+        nugget: Regularization added to the diagonal of the kernel matrix.
+    """
+
+    def __init__(self, method='rbf', max_samples=1000, nugget=1.e-8):
+        # type: (AnyStr, int, float) -> None
+        method = method.lower()
+        if method not in SURROGATE_METHODS:
+            raise ValueError('Surrogate method %s is unsupported! Please input one of %s!' %
+                             (method, ','.join(SURROGATE_METHODS)))
+        self.method = method
+        self.max_samples = max_samples
+        self.nugget = nugget
+        self.samples_x = list()  # type: List[List[float]]
+        self.samples_y = list()  # type: List[List[float]]
+        self._sample_keys = set()  # Gene values of samples, duplicated samples are ignored
+        # Trained variables
+        self.x = None  # type: Optional[numpy.ndarray] # normalized training inputs
+        self.xmin = None  # type: Optional[numpy.ndarray]
+        self.xrange = None  # type: Optional[numpy.ndarray]
+        self.ymean = None  # type: Optional[numpy.ndarray]
+        self.ystd = None  # type: Optional[numpy.ndarray]
+        self.coefs = None  # type: Optional[numpy.ndarray]
+        self.length_scale = 1.
+
+    @property
+    def size(self):
+        # type: (...) -> int
+        return len(self.samples_x)
+
+    @property
+    def trained(self):
+        # type: (...) -> bool
+        return self.coefs is not None
+
+    def add(self, genes, values):
+        # type: (Sequence[Union[int, float]], Sequence[float]) -> None
+        """Add an evaluated sample, i.e., gene values and fitness values."""
+        key = tuple(float(v) for v in genes)
+        if key in self._sample_keys:
+            return
+        self._sample_keys.add(key)
+        self.samples_x.append(list(key))
+        self.samples_y.append([float(v) for v in values])
+
+    def _normalize(self, x):
+        # type: (numpy.ndarray) -> numpy.ndarray
+        return (x - self.xmin) / self.xrange
+
+    def _kernel(self, xa, xb):
+        # type: (numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+        dists = numpy.sqrt(((xa[:, None, :] - xb[None, :, :]) ** 2).sum(axis=2))
+        if self.method == 'rbf':
+            return dists ** 3
+        return numpy.exp(-0.5 * (dists / self.length_scale) ** 2)
+
+    def fit(self):
+        # type: (...) -> bool
+        """Train the surrogate on the latest samples, returns False if training failed."""
+        x = numpy.array(self.samples_x[-self.max_samples:], dtype=float)
+        y = numpy.array(self.samples_y[-self.max_samples:], dtype=float)
+        if x.shape[0] < 2:
+            return False
+        self.xmin = x.min(axis=0)
+        self.xrange = x.max(axis=0) - self.xmin
+        self.xrange[self.xrange <= 0.] = 1.
+        self.ymean = y.mean(axis=0)
+        self.ystd = y.std(axis=0)
+        self.ystd[self.ystd <= 0.] = 1.
+        self.x = self._normalize(x)
+        ynorm = (y - self.ymean) / self.ystd
+        num, ndim = self.x.shape
+        if self.method == 'gp':  # Length scale by the median of pairwise distances
+            dists = numpy.sqrt(((self.x[:, None, :] - self.x[None, :, :]) ** 2).sum(axis=2))
+            self.length_scale = numpy.median(dists[numpy.triu_indices(num, 1)])
+            if self.length_scale <= 0.:
+                self.length_scale = 1.
+            amat = self._kernel(self.x, self.x) + self.nugget * numpy.eye(num)
+            rhs = ynorm
+        else:  # Augmented system of RBF interpolation with linear polynomial tail
+            poly = numpy.hstack((numpy.ones((num, 1)), self.x))
+            amat = numpy.zeros((num + ndim + 1, num + ndim + 1))
+            amat[:num, :num] = self._kernel(self.x, self.x) + self.nugget * numpy.eye(num)
+            amat[:num, num:] = poly
+            amat[num:, :num] = poly.T
+            rhs = numpy.vstack((ynorm, numpy.zeros((ndim + 1, ynorm.shape[1]))))
+        try:
+            self.coefs = numpy.linalg.solve(amat, rhs)
+        except numpy.linalg.LinAlgError:  # Singular matrix, e.g., duplicated samples
+            self.coefs = numpy.linalg.lstsq(amat, rhs, rcond=None)[0]
+        return True
+
+    def predict(self, genes_list):
+        # type: (Sequence[Sequence[Union[int, float]]]) -> numpy.ndarray
+        """Predict fitness values of the given gene values, returns array of (n, nobj)."""
+        if not self.trained:
+            raise RuntimeError('The surrogate model should be trained by fit() first!')
+        x = self._normalize(numpy.array([[float(v) for v in g] for g in genes_list]))
+        kmat = self._kernel(x, self.x)
+        if self.method == 'gp':
+            ynorm = kmat.dot(self.coefs)
+        else:
+            num = self.x.shape[0]
+            poly = numpy.hstack((numpy.ones((x.shape[0], 1)), x))
+            ynorm = kmat.dot(self.coefs[:num]) + poly.dot(self.coefs[num:])
+        return ynorm * self.ystd + self.ymean
+
+    def prescreen(self, genes_list, num, weights):
+        # type: (Sequence[Sequence[Union[int, float]]], int, Sequence[float]) -> List[int]
+        """Indexes of the `num` most promising candidates ranked by predicted fitness values.
+
+        The candidates are sorted by the non-dominated front and the crowding distance, the
+          same as the selection of NSGA-II. Signs of `weights` indicate maximization (positive)
+          or minimization (negative) of each objective.
+        """
+        if num >= len(genes_list):
+            return list(range(len(genes_list)))
+        values = self.predict(genes_list) * numpy.sign(numpy.array(weights, dtype=float))
+        ranks = nondominated_ranks(values)
+        selected = list()  # type: List[int]
+        for front in range(ranks.max() + 1):
+            idx = numpy.where(ranks == front)[0]
+            if len(selected) + idx.size <= num:
+                selected.extend(idx.tolist())
+            else:
+                crowd = crowding_distances(values[idx])
+                selected.extend(idx[numpy.argsort(-crowd)][:num - len(selected)].tolist())
+            if len(selected) >= num:
+                break
+        return selected
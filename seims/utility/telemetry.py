@@ -0,0 +1,136 @@
+"""Performance telemetry of SEIMS-based model runs stored in a SQLite database.
+
+    Each record contains the timespan parsed from the runtime log of SEIMS (IO, COMP, SIMU),
+      the total runtime counted by Python, and the Python-side phases, e.g., setup,
+      read_output, statistics, and cleanup. The records are keyed by run name, scenario ID,
+      and calibration ID, and can be queried by SQL or exported to CSV, e.g.,
+
+      telemetry = RunTelemetry('/path/to/telemetry.db')
+      print(telemetry.summary(group_by='nthread'))
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from io import open
+import csv
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from typing import Optional, Dict, List, Tuple, Any, AnyStr
+
+# Python-side phases of an evaluation
+TELEMETRY_PHASES = ['setup', 'read_output', 'statistics', 'cleanup']
+
+TELEMETRY_FIELDS = [('run_name', 'TEXT'), ('hostname', 'TEXT'), ('pid', 'INTEGER'),
+                    ('record_time', 'REAL'), ('db_name', 'TEXT'), ('version', 'TEXT'),
+                    ('nprocess', 'INTEGER'), ('nthread', 'INTEGER'),
+                    ('scenario_id', 'INTEGER'), ('calibration_id', 'INTEGER'),
+                    ('subbasin_id', 'INTEGER'), ('success', 'INTEGER'),
+                    ('io', 'REAL'), ('comp', 'REAL'), ('simu', 'REAL'), ('runtime', 'REAL')] + \
+                   [(phase, 'REAL') for phase in TELEMETRY_PHASES] + \
+                   [('tag', 'TEXT'), ('timespan', 'TEXT')]
+
+
+class RunTelemetry(object):
+    """SQLite-based store of the telemetry of model runs.
+
+    The database can be written by multiple processes simultaneously since each record is
+      inserted in a short transaction, and a connection is opened for each operation.
+
+    Args:
+        db_file: Path of SQLite database file, created if not existed.
+        timeout: Seconds to wait for the lock of database.
+    """
+
+    TABLE = 'model_runs'
+
+    def __init__(self, db_file, timeout=60.):
+        # type: (AnyStr, float) -> None
+        self.db_file = os.path.abspath(db_file)
+        self.timeout = timeout
+        dirname = os.path.dirname(self.db_file)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         '%s)' % (self.TABLE, ', '.join('%s %s' % f for f in TELEMETRY_FIELDS)))
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_%s_ids ON %s '
+                         '(scenario_id, calibration_id)' % (self.TABLE, self.TABLE))
+        conn.close()
+
+    def _connect(self):
+        # type: (...) -> sqlite3.Connection
+        return sqlite3.connect(self.db_file, timeout=self.timeout)
+
+    def record(self, model, tag=''):
+        # type: (Any, AnyStr) -> None
+        """Insert the telemetry of an executed `MainSEIMS` object."""
+        io_time, comp_time, simu_time, runtime = model.GetTimespan()
+        values = {'run_name': model.output_name, 'hostname': socket.gethostname(),
+                  'pid': os.getpid(), 'record_time': time.time(), 'db_name': model.db_name,
+                  'version': model.version, 'nprocess': model.nprocess,
+                  'nthread': model.nthread, 'scenario_id': model.scenario_id,
+                  'calibration_id': model.calibration_id, 'subbasin_id': model.subbasin_id,
+                  'success': 1 if model.run_success else 0,
+                  'io': io_time, 'comp': comp_time, 'simu': simu_time, 'runtime': runtime,
+                  'tag': tag, 'timespan': json.dumps(model.timespan)}
+        for phase in TELEMETRY_PHASES:
+            values[phase] = model.phases.get(phase, 0.)
+        self.insert(values)
+
+    def insert(self, values):
+        # type: (Dict[AnyStr, Any]) -> None
+        names = [f[0] for f in TELEMETRY_FIELDS if f[0] in values]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT INTO %s (%s) VALUES (%s)' % (self.TABLE, ', '.join(names),
+                                                                 ', '.join(['?'] * len(names))),
+                             [values[n] for n in names])
+            conn.close()
+        except sqlite3.Error as err:
+            print('Warning: Record telemetry failed! %s' % str(err))
+
+    def query(self, sql, params=()):
+        # type: (AnyStr, Tuple) -> (List[AnyStr], List[Tuple])
+        """Execute a SQL query, returns column names and rows."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            names = [d[0] for d in cursor.description] if cursor.description else list()
+            return names, cursor.fetchall()
+        finally:
+            conn.close()
+
+    def summary(self, group_by='nthread', where=''):
+        # type: (AnyStr, AnyStr) -> AnyStr
+        """Average timespan of successful runs grouped by the given field(s)."""
+        avg_fields = ['io', 'comp', 'simu', 'runtime'] + TELEMETRY_PHASES
+        sql = 'SELECT %s, COUNT(*), %s FROM %s WHERE success = 1%s GROUP BY %s ORDER BY %s' % \
+              (group_by, ', '.join('AVG(%s)' % f for f in avg_fields), self.TABLE,
+               ' AND (%s)' % where if where else '', group_by, group_by)
+        _, rows = self.query(sql)
+        lines = ['\t'.join([group_by, 'count'] + avg_fields)]
+        for row in rows:
+            lines.append('\t'.join(['%s' % row[0], '%d' % row[1]] +
+                                   ['%.3f' % (v or 0.) for v in row[2:]]))
+        return '\n'.join(lines)
+
+    def export_csv(self, csv_file, where=''):
+        # type: (AnyStr, AnyStr) -> int
+        """Export records to a CSV file, returns the count of records."""
+        names, rows = self.query('SELECT * FROM %s%s ORDER BY id' %
+                                 (self.TABLE, ' WHERE %s' % where if where else ''))
+        with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(rows)
+        return len(rows)
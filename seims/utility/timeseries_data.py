@@ -11,23 +11,156 @@ import bisect
 from collections import OrderedDict
 from datetime import datetime
 
-from typing import List, Dict, Optional, Union, AnyStr
-from pygeoc.utils import MathClass
+from typing import List, Dict, Optional, Union, Iterator, Tuple, AnyStr
+import numpy
+
+
+class TimeseriesArray(object):
+    """Time series of one or more variables stored as arrays.
+
+    It can be used as the `{Datetime: [value_of_var1, value_of_var2, ...], ...}` OrderedDict,
+      while the UTCDATETIME are stored as a sorted `datetime64[s]` array and the values as a
+      float array with the shape of (n, nvars). So a period can be extracted by binary search,
+      and the extracted `TimeseriesArray` shares the data with the original one.
+    """
+
+    def __init__(self, dates=None, data=None):
+        # type: (Optional[numpy.ndarray], Optional[numpy.ndarray]) -> None
+        if dates is None:
+            dates = numpy.array([], dtype='datetime64[s]')
+        self.dates = numpy.asarray(dates, dtype='datetime64[s]')
+        if data is None:
+            data = numpy.empty((len(self.dates), 0))
+        self.data = numpy.asarray(data, dtype=numpy.float64)
+        if self.data.ndim == 1:
+            self.data = self.data.reshape((-1, 1))
+        if len(self.dates) != len(self.data):
+            raise ValueError('The lengths of dates (%d) and data (%d) are not '
+                             'consistent!' % (len(self.dates), len(self.data)))
+
+    @classmethod
+    def from_dict(cls, data_dict):
+        # type: (Dict[datetime, List[float]]) -> TimeseriesArray
+        """Create from `{Datetime: [value_of_var1, value_of_var2, ...], ...}`."""
+        dates = sorted(data_dict.keys())
+        return cls(numpy.array(dates, dtype='datetime64[s]'),
+                   numpy.array([data_dict[d] for d in dates], dtype=numpy.float64))
+
+    def to_dict(self):
+        # type: (...) -> Dict[datetime, List[float]]
+        """Convert to `{Datetime: [value_of_var1, value_of_var2, ...], ...}`."""
+        return OrderedDict(self.items())
+
+    def index_range(self, stime=None, etime=None):
+        # type: (Optional[datetime], Optional[datetime]) -> (int, int)
+        """Start (included) and end (excluded) indexes of the period by binary search."""
+        sidx = 0
+        eidx = len(self.dates)
+        if stime is not None:
+            sidx = int(numpy.searchsorted(self.dates, numpy.datetime64(stime, 's'), 'left'))
+        if etime is not None:
+            eidx = int(numpy.searchsorted(self.dates, numpy.datetime64(etime, 's'), 'right'))
+        return sidx, max(sidx, eidx)
+
+    def slice(self, stime=None, etime=None):
+        # type: (Optional[datetime], Optional[datetime]) -> TimeseriesArray
+        """Extract the period [stime, etime] as views of the current arrays."""
+        sidx, eidx = self.index_range(stime, etime)
+        return TimeseriesArray(self.dates[sidx:eidx], self.data[sidx:eidx])
+
+    def column(self, idx):
+        # type: (int) -> numpy.ndarray
+        """Values of the idx-th variable."""
+        return self.data[:, idx]
+
+    def keys(self):
+        # type: (...) -> List[datetime]
+        return self.dates.astype(datetime).tolist()
+
+    def values(self):
+        # type: (...) -> numpy.ndarray
+        return self.data
+
+    def items(self):
+        # type: (...) -> Iterator[Tuple[datetime, List[float]]]
+        return zip(self.keys(), self.data.tolist())
+
+    def get(self, dt, default=None):
+        # type: (datetime, Optional[List[float]]) -> Optional[List[float]]
+        idx = int(numpy.searchsorted(self.dates, numpy.datetime64(dt, 's')))
+        if idx < len(self.dates) and self.dates[idx] == numpy.datetime64(dt, 's'):
+            return self.data[idx].tolist()
+        return default
+
+    def __getitem__(self, dt):
+        # type: (datetime) -> List[float]
+        value = self.get(dt)
+        if value is None:
+            raise KeyError(dt)
+        return value
+
+    def __contains__(self, dt):
+        return self.get(dt) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.dates)
+
+
+def align_timeseries_index(sim_dates,  # type: numpy.ndarray
+                           obs_dates,  # type: numpy.ndarray
+                           start_time=None,  # type: Optional[datetime]
+                           end_time=None  # type: Optional[datetime]
+                           ):
+    # type: (...) -> (numpy.ndarray, numpy.ndarray)
+    """Align two ascending sorted `datetime64` arrays by sorted-merge (i.e., `searchsorted`).
+
+    The returned index arrays can be reused for all variables of the same time series.
+      The alignment costs O(n log m) in native code, about as much as hashing the dates as a
+      cache key, thus the results are not cached.
+
+    Args:
+        sim_dates: Sorted dates of simulation
+        obs_dates: Sorted dates of observation
+        start_time: Start time, None means unlimited
+        end_time: End time, None means unlimited
+    Returns:
+        Indexes of the common dates in `sim_dates` and `obs_dates` respectively.
+    """
+    sidx = 0
+    eidx = len(sim_dates)
+    if start_time is not None:
+        sidx = int(numpy.searchsorted(sim_dates, numpy.datetime64(start_time, 's'), 'left'))
+    if end_time is not None:
+        eidx = max(sidx, int(numpy.searchsorted(sim_dates, numpy.datetime64(end_time, 's'),
+                                                'right')))
+    sim_idx = numpy.arange(sidx, eidx)
+    obs_idx = numpy.searchsorted(obs_dates, sim_dates[sidx:eidx])
+    matched = obs_idx < len(obs_dates)
+    matched[matched] = obs_dates[obs_idx[matched]] == sim_dates[sim_idx[matched]]
+    sim_idx = sim_idx[matched]
+    obs_idx = obs_idx[matched]
+    return sim_idx, obs_idx
 
 
 def match_simulation_observation(sim_vars,  # type: List[AnyStr]
-                                 sim_dict,  # type: Dict[datetime, List[float]]
+                                 sim_dict,  # type: Union[TimeseriesArray, Dict[datetime, List[float]]]
                                  obs_vars,  # type: Optional[List[AnyStr]]
-                                 obs_dict,  # type: Optional[Dict[datetime, List[float]]]
+                                 obs_dict,  # type: Optional[Union[TimeseriesArray, Dict[datetime, List[float]]]]
                                  start_time=None,  # type: Optional[datetime]
                                  end_time=None  # type: Optional[datetime]
                                  ):
     # type: (...) -> Optional[Dict[AnyStr, Dict[AnyStr, Union[List[datetime], List[float]]]]]
     """Match the simulation and observation data by UTCDATETIME for each variable.
 
+    The dates are aligned once by `align_timeseries_index` and the indexes are applied to
+      all matched variables. Missing observations (None or NaN) are skipped per variable.
+
     Args:
         sim_vars: Simulated variable list, e.g., ['Q', 'SED']
-        sim_dict: {Datetime: [value_of_var1, value_of_var2, ...], ...}
+        sim_dict: {Datetime: [value_of_var1, value_of_var2, ...], ...}, or `TimeseriesArray`
         obs_vars: Observed variable list, which may be None or [], e.g., ['Q']
         obs_dict: same format with sim_dict
         start_time: Start time, by default equals to the start of simulation data
@@ -40,30 +173,27 @@ def match_simulation_observation(sim_vars,  # type: List[AnyStr]
         ...
         }
     """
-    if start_time is None:
-        start_time = list(sim_dict.keys())[0]
-    if end_time is None:
-        end_time = list(sim_dict.keys())[-1]
-    sim_obs_dict = dict()
     if not obs_vars:
         return None
-    sim_to_obs = OrderedDict()
-    for i, param_name in enumerate(sim_vars):
+    sim_ts = sim_dict if isinstance(sim_dict, TimeseriesArray) \
+        else TimeseriesArray.from_dict(sim_dict)
+    obs_ts = obs_dict if isinstance(obs_dict, TimeseriesArray) \
+        else TimeseriesArray.from_dict(obs_dict or dict())
+    sim_idx, obs_idx = align_timeseries_index(sim_ts.dates, obs_ts.dates, start_time, end_time)
+    sim_obs_dict = dict()
+    for sim_i, param_name in enumerate(sim_vars):
         if param_name not in obs_vars:
             continue
-        sim_to_obs[i] = obs_vars.index(param_name)
-        sim_obs_dict[param_name] = {'UTCDATETIME': list(), 'Obs': list(), 'Sim': list()}
-    for sim_date, sim_values in sim_dict.items():
-        if sim_date not in obs_dict or not start_time <= sim_date <= end_time:
+        obs_i = obs_vars.index(param_name)
+        if obs_i >= obs_ts.data.shape[1]:
+            sim_obs_dict[param_name] = {'UTCDATETIME': list(), 'Obs': list(), 'Sim': list()}
             continue
-        for sim_i, obs_i in sim_to_obs.items():
-            param_name = sim_vars[sim_i]
-            obs_values = obs_dict.get(sim_date)
-            if obs_i > len(obs_values) or obs_values[obs_i] is None:
-                continue
-            sim_obs_dict[param_name]['UTCDATETIME'].append(sim_date)
-            sim_obs_dict[param_name]['Obs'].append(obs_values[obs_i])
-            sim_obs_dict[param_name]['Sim'].append(sim_values[sim_i])
+        obs_values = obs_ts.data[obs_idx, obs_i]
+        valid = ~numpy.isnan(obs_values)
+        sim_obs_dict[param_name] = {
+            'UTCDATETIME': sim_ts.dates[sim_idx[valid]].astype(datetime).tolist(),
+            'Obs': obs_values[valid].tolist(),
+            'Sim': sim_ts.data[sim_idx[valid], sim_i].tolist()}
 
     # for param, values in self.sim_obs_dict.items():
     #     print('Observation-Simulation of %s' % param)
@@ -73,6 +203,75 @@ def match_simulation_observation(sim_vars,  # type: List[AnyStr]
     return sim_obs_dict
 
 
+# Names of all statistics calculated by `calculate_statistics_matrix`, in order.
+STATISTICS_NAMES = ['NSE', 'R-square', 'RMSE', 'PBIAS', 'RSR', 'lnNSE', 'NSE1', 'NSE3']
+
+
+def _nash_coefficient(obs, sim, expon=2):
+    # type: (numpy.ndarray, numpy.ndarray, Union[int, float]) -> numpy.ndarray
+    """NSE and its variants of each row, the same as `pygeoc.utils.MathClass.nashcoef`."""
+    if expon > obs.shape[-1] or expon < 1:
+        return numpy.zeros(sim.shape[0])
+    ave = numpy.nanmean(obs, axis=-1)
+    if ave.ndim == 1:
+        ave = ave.reshape((-1, 1))
+    a1 = numpy.nansum(numpy.abs(obs - sim) ** expon, axis=-1)
+    a2 = numpy.nansum(numpy.abs(obs - ave) ** expon, axis=-1)
+    a1, a2 = numpy.broadcast_arrays(a1, a2)
+    return numpy.where(a2 == 0., 1., 1. - a1 / numpy.where(a2 == 0., 1., a2))
+
+
+def calculate_statistics_matrix(obs,  # type: Union[numpy.ndarray, List[float]]
+                                sim  # type: Union[numpy.ndarray, List[float], List[List[float]]]
+                                ):
+    # type: (...) -> Dict[AnyStr, Union[float, numpy.ndarray]]
+    """Calculate all statistics of `STATISTICS_NAMES` in one vectorized pass.
+
+    The formulas are consistent with `MathClass` of PyGeoC, i.e., `nashcoef`, `rsquare`, `rmse`,
+      `pbias`, `rsr`, `nashcoef(log=True)`, `nashcoef(expon=1)`, and `nashcoef(expon=3)`.
+
+    Args:
+        obs: Observed values with the shape of (n,)
+        sim: Simulated values with the shape of (n,), or (m, n) for m individuals that share
+             the same observations, e.g., the population of one generation.
+    Returns:
+        OrderedDict of statistic name and values, the values are floats if `sim` is 1-D,
+          otherwise arrays with the shape of (m,).
+    """
+    obs = numpy.asarray(obs, dtype=numpy.float64)
+    sim = numpy.asarray(sim, dtype=numpy.float64)
+    single = sim.ndim == 1
+    sim = numpy.atleast_2d(sim)
+    if obs.shape[-1] != sim.shape[-1]:
+        raise ValueError('The size of observed and simulated values must be the same!')
+    values = OrderedDict()
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        diff2 = numpy.sum((obs - sim) ** 2, axis=1)
+        obs_dev = obs - numpy.mean(obs)
+        obs_dev2 = numpy.sum(obs_dev ** 2)
+        sim_dev = sim - numpy.mean(sim, axis=1).reshape((-1, 1))
+        sim_dev2 = numpy.sum(sim_dev ** 2, axis=1)
+        yy = obs_dev2 ** 0.5 * sim_dev2 ** 0.5
+        r2 = (numpy.sum(obs_dev * sim_dev, axis=1) / numpy.where(yy == 0., 1., yy)) ** 2.
+
+        zeros = (obs == 0.) | (sim == 0.)
+        ln_obs = numpy.log(numpy.where(zeros, numpy.nan, obs))
+        ln_sim = numpy.log(numpy.where(sim == 0., numpy.nan, sim))
+
+        values['NSE'] = _nash_coefficient(obs, sim)
+        values['R-square'] = numpy.where(numpy.abs(yy) < 1.e-6, 1., r2)
+        values['RMSE'] = numpy.sqrt(diff2 / obs.shape[-1])
+        values['PBIAS'] = numpy.sum((obs - sim) * 100., axis=1) / numpy.sum(obs)
+        values['RSR'] = numpy.sqrt(diff2) / numpy.sqrt(obs_dev2)
+        values['lnNSE'] = _nash_coefficient(ln_obs, ln_sim)
+        values['NSE1'] = _nash_coefficient(obs, sim, expon=1)
+        values['NSE3'] = _nash_coefficient(obs, sim, expon=3)
+    if single:
+        for name in values:
+            values[name] = float(values[name][0])
+    return values
+
+
 def calculate_statistics(sim_obs_dict,  # type: Optional[Dict[AnyStr, Dict[AnyStr, Union[List[datetime], List[float], float]]]]
                          stime=None,  # type: Optional[datetime]
                          etime=None  # type: Optional[datetime]
@@ -114,29 +313,74 @@ def calculate_statistics(sim_obs_dict,  # type: Optional[Dict[AnyStr, Dict[AnySt
         else:
             sidx = bisect.bisect_left(values['UTCDATETIME'], stime)
             eidx = bisect.bisect_right(values['UTCDATETIME'], etime)
-        obsl = values['Obs'][sidx:eidx]
-        siml = values['Sim'][sidx:eidx]
-
-        nse_value = MathClass.nashcoef(obsl, siml)
-        r2_value = MathClass.rsquare(obsl, siml)
-        rmse_value = MathClass.rmse(obsl, siml)
-        pbias_value = MathClass.pbias(obsl, siml)
-        rsr_value = MathClass.rsr(obsl, siml)
-        lnnse_value = MathClass.nashcoef(obsl, siml, log=True)
-        nse1_value = MathClass.nashcoef(obsl, siml, expon=1)
-        nse3_value = MathClass.nashcoef(obsl, siml, expon=3)
-
-        values['NSE'] = nse_value
-        values['R-square'] = r2_value
-        values['RMSE'] = rmse_value
-        values['PBIAS'] = pbias_value
-        values['RSR'] = rsr_value
-        values['lnNSE'] = lnnse_value
-        values['NSE1'] = nse1_value
-        values['NSE3'] = nse3_value
+        stats = calculate_statistics_matrix(values['Obs'][sidx:eidx], values['Sim'][sidx:eidx])
+        values.update(stats)
 
         # print('Statistics for %s, NSE: %.3f, R2: %.3f, RMSE: %.3f, PBIAS: %.3f, RSR: %.3f,'
         #       ' lnNSE: %.3f, NSE1: %.3f, NSE3: %.3f' %
-        #       (param, nse_value, r2_value, rmse_value, pbias_value, rsr_value,
-        #        lnnse_value, nse1_value, nse3_value))
-    return ['NSE', 'R-square', 'RMSE', 'PBIAS', 'RSR', 'lnNSE', 'NSE1', 'NSE3']
+        #       (param, values['NSE'], values['R-square'], values['RMSE'], values['PBIAS'],
+        #        values['RSR'], values['lnNSE'], values['NSE1'], values['NSE3']))
+    return STATISTICS_NAMES[:]
+
+
+def calculate_statistics_batch(sim_obs_dicts,  # type: List[Optional[Dict[AnyStr, Dict[AnyStr, Union[List[datetime], List[float], float]]]]]
+                               stime=None,  # type: Optional[datetime]
+                               etime=None  # type: Optional[datetime]
+                               ):
+    # type: (...) -> Optional[List[AnyStr]]
+    """Calculate statistics of multiple individuals, e.g., the population of one generation.
+
+    For each variable, the individuals whose matched UTCDATETIME and observations are the same
+      (which is the common case in calibration and sensitivity analysis) are stacked as a
+      (individuals x time) matrix and calculated at once by `calculate_statistics_matrix`.
+      Individuals with different observations are grouped in the same way.
+
+    Args:
+        sim_obs_dicts: List of `sim_obs_dict` (see `calculate_statistics`), None or empty dict
+                       will be skipped.
+        stime: Start time for statistics calculation.
+        etime: End time for statistics calculation.
+    Returns:
+        Name list of the calculated statistics, or None if no valid `sim_obs_dict` exists.
+    """
+    valid_dicts = [d for d in sim_obs_dicts if d]
+    if not valid_dicts:
+        return None
+    all_vars = list()
+    for d in valid_dicts:
+        for param in d:
+            if param not in all_vars:
+                all_vars.append(param)
+    for param in all_vars:
+        remained = list()
+        for d in valid_dicts:
+            if param not in d:
+                continue
+            values = d[param]
+            if stime is None and etime is None:
+                sidx = 0
+                eidx = len(values['UTCDATETIME'])
+            else:
+                sidx = bisect.bisect_left(values['UTCDATETIME'], stime)
+                eidx = bisect.bisect_right(values['UTCDATETIME'], etime)
+            remained.append((values, sidx, eidx))
+        while remained:
+            ref_values, ref_sidx, ref_eidx = remained[0]
+            ref_dates = ref_values['UTCDATETIME'][ref_sidx:ref_eidx]
+            ref_obs = ref_values['Obs'][ref_sidx:ref_eidx]
+            group = list()
+            others = list()
+            for item in remained:
+                values, sidx, eidx = item
+                if values['UTCDATETIME'][sidx:eidx] == ref_dates and \
+                    values['Obs'][sidx:eidx] == ref_obs:
+                    group.append(item)
+                else:
+                    others.append(item)
+            sims = [values['Sim'][sidx:eidx] for values, sidx, eidx in group]
+            stats = calculate_statistics_matrix(ref_obs, sims)
+            for i, (values, sidx, eidx) in enumerate(group):
+                for name, stat_values in stats.items():
+                    values[name] = float(stat_values[i])
+            remained = others
+    return STATISTICS_NAMES[:]
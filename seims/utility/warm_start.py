@@ -0,0 +1,169 @@
+"""Warm start of optimization algorithms, e.g., NSGA-II, from the archive of a previous run.
+
+    The gene values of a generation are loaded from one of the following archives:
+
+      - Checkpoint (`*.pickle`), i.e., the last complete generation, see `utility.checkpoint`.
+        The evaluated individuals are also returned, e.g., to seed the evaluation cache.
+      - Population store, i.e., a shard (`gen<N>_population.npz`) or the directory of shards,
+        see `utility.population_store`.
+      - Runtime log (`runtime.log`), i.e., the Pareto solutions of each generation.
+
+    The loaded genes are then revalidated against the current problem, since the bounds of
+      parameters or the available BMPs may be changed since the previous run.
+
+      genes, inds = load_archive_genes(archive_file, generation=-1, sce_name='calibrationID')
+      genes, kept = revalidate_bounds(genes, lows, ups, mode='clip')
+      pop = [creator.Individual(g) for g in genes[:npop]]  # fill the rest by sampling
+
+    @author   : SEIMS Team
+
+    @changelog:
+    - 26-10-18  - st - Initial implementation.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+import numpy
+from typing import Optional, List, Tuple, Sequence, Set, Any, AnyStr
+
+from utility.checkpoint import load_checkpoint
+from utility.population_store import PopulationStore
+
+WARM_START_MODES = ['clip', 'drop']
+
+
+def _select_generation(gens, generation):
+    # type: (List[int], int) -> Optional[int]
+    """The given generation if available, or the last one if `generation` is negative."""
+    if not gens:
+        return None
+    if generation < 0:
+        return max(gens)
+    return generation if generation in gens else None
+
+
+def load_archive_genes(archive_file, generation=-1, sce_name='calibrationID'):
+    # type: (AnyStr, int, AnyStr) -> Tuple[List[List[float]], Optional[List[Any]]]
+    """Load gene values of a generation from the archive of a previous run.
+
+    Args:
+        archive_file: Checkpoint, population store (shard or directory), or runtime log.
+        generation: Generation number, negative for the last one. Ignored by checkpoint
+                    and a single shard, which hold only one generation.
+        sce_name: Field name of individual ID in runtime log, e.g., 'calibrationID', 'scenario'.
+
+    Returns:
+        genes: Gene values of each individual, empty if not found.
+        individuals: The evaluated individuals if loaded from checkpoint, otherwise None.
+    """
+    if os.path.isdir(archive_file):
+        store = PopulationStore(archive_file)
+        gen = _select_generation(store.generations(), generation)
+        if gen is None:
+            return list(), None
+        genes = store.load(gen, ['genes']).get('genes', numpy.empty((0, 0)))
+        return genes.tolist(), None
+    if not os.path.isfile(archive_file):
+        return list(), None
+    ext = os.path.splitext(archive_file)[1].lower()
+    if ext in ['.pickle', '.pkl']:
+        # The random states of the previous run should not be restored
+        state = load_checkpoint(archive_file, restore_random=False)
+        if state is None or 'pop' not in state:
+            return list(), None
+        return [list(ind) for ind in state['pop']], list(state['pop'])
+    if ext == '.npz':
+        with numpy.load(archive_file, allow_pickle=False) as npz:
+            if 'genes' not in npz.files:
+                return list(), None
+            return npz['genes'].tolist(), None
+    # Plain text, i.e., runtime.log, imported here to avoid the dependency on matplotlib
+    from scenario_analysis.visualization import read_pareto_solutions_from_txt
+    solutions = read_pareto_solutions_from_txt(archive_file, sce_name=sce_name,
+                                               field_name='gene_values')
+    gen = _select_generation([g for g in solutions if solutions[g]], generation)
+    if gen is None:
+        return list(), None
+    return [list(genes) for genes in solutions[gen]], None
+
+
+def _unique_rows(genes_list, kept):
+    # type: (List[List[float]], List[int]) -> Tuple[List[List[float]], List[int]]
+    """Remove duplicated gene values, e.g., after clipping, keep the first occurrence."""
+    uniq_genes = list()
+    uniq_kept = list()
+    seen = set()
+    for genes, idx in zip(genes_list, kept):
+        key = tuple(genes)
+        if key in seen:
+            continue
+        seen.add(key)
+        uniq_genes.append(genes)
+        uniq_kept.append(idx)
+    return uniq_genes, uniq_kept
+
+
+def revalidate_bounds(genes_list, lows, ups, mode='clip'):
+    # type: (Sequence[Sequence[float]], Sequence[float], Sequence[float], AnyStr) -> Tuple[List[List[float]], List[int]]
+    """Revalidate continuous gene values against the current bounds.
+
+    The gene values with mismatched dimension or invalid values (e.g., NaN) are always dropped,
+      the ones out of bounds are clipped to bounds if `mode` is 'clip', or dropped if 'drop'.
+
+    Returns:
+        genes: Valid and unique gene values.
+        kept: Index of each valid gene values in `genes_list`.
+    """
+    if mode not in WARM_START_MODES:
+        raise ValueError('The revalidation mode %s is not supported, available: %s.' %
+                         (mode, ', '.join(WARM_START_MODES)))
+    lows = numpy.asarray(lows, dtype=float)
+    ups = numpy.asarray(ups, dtype=float)
+    valid_genes = list()
+    kept = list()
+    for idx, genes in enumerate(genes_list):
+        values = numpy.asarray(genes, dtype=float)
+        if values.shape != lows.shape or not numpy.all(numpy.isfinite(values)):
+            continue
+        within = numpy.all((values >= lows) & (values <= ups))
+        if not within:
+            if mode == 'drop':
+                continue
+            values = numpy.clip(values, lows, ups)
+        valid_genes.append(values.tolist())
+        kept.append(idx)
+    return _unique_rows(valid_genes, kept)
+
+
+def revalidate_choices(genes_list, choices, mode='clip', replacement=0):
+    # type: (Sequence[Sequence[Any]], Sequence[Set[Any]], AnyStr, Any) -> Tuple[List[List[Any]], List[int]]
+    """Revalidate discrete gene values against the current available values of each gene.
+
+    The gene values with mismatched dimension are always dropped, the ones not available are
+      replaced by `replacement` (e.g., no BMP) if `mode` is 'clip', or dropped if 'drop'.
+
+    Returns:
+        genes: Valid and unique gene values.
+        kept: Index of each valid gene values in `genes_list`.
+    """
+    if mode not in WARM_START_MODES:
+        raise ValueError('The revalidation mode %s is not supported, available: %s.' %
+                         (mode, ', '.join(WARM_START_MODES)))
+    valid_genes = list()
+    kept = list()
+    for idx, genes in enumerate(genes_list):
+        if len(genes) != len(choices):
+            continue
+        values = list()
+        for gv, available in zip(genes, choices):
+            if gv not in available:
+                if mode == 'drop':
+                    break
+                gv = replacement
+            values.append(gv)
+        if len(values) != len(choices):
+            continue
+        valid_genes.append(values)
+        kept.append(idx)
+    return _unique_rows(valid_genes, kept)